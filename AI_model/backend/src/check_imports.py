@@ -0,0 +1,48 @@
+import importlib
+import os
+import sys
+import traceback
+
+# Import every backend module, so a name that does not exist in the pinned
+# dependencies (requirements.txt) fails here instead of at API start-up.
+#
+#   pip install -r requirements.txt
+#   python -m src.check_imports
+
+# main.py connects its clients at import time; placeholders are enough
+# for them to be constructed without a running Supabase
+PLACEHOLDER_ENV = {
+    'SUPABASE_URL': 'http://127.0.0.1:54321',
+    'SUPABASE_KEY': 'placeholder',
+}
+
+def main() -> int:
+    for name, value in PLACEHOLDER_ENV.items():
+        os.environ.setdefault(name, value)
+
+    # The subpackages have no __init__.py, so walk the files rather than pkgutil
+    root = os.path.dirname(os.path.abspath(__file__))
+    modules = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != '__pycache__']
+        package = os.path.relpath(directory, os.path.dirname(root)).replace(os.sep, '.')
+        modules.extend(
+            f'{package}.{filename[:-3]}' for filename in filenames
+            if filename.endswith('.py') and filename != '__init__.py'
+        )
+    modules = sorted(name for name in modules if name != __name__)
+
+    failures = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            failures.append(name)
+            print(f'FAIL {name}')
+            traceback.print_exc()
+
+    print(f'{len(modules) - len(failures)}/{len(modules)} modules imported')
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
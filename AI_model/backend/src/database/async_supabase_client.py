@@ -0,0 +1,371 @@
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+import os
+import httpx
+import pandas as pd
+
+from .pagination import (
+    DEFAULT_PAGE_SIZE, DEFAULT_READING_COLUMNS, READING_CONFLICT_KEY, ROLLUP_COLUMNS, ReadingFrameBuilder,
+    bucket_seconds, keyset_filter, next_cursor, project_page, projection, rollup_table,
+)
+
+class AsyncSupabaseClient:
+    """
+    Non-blocking counterpart of SupabaseClient.
+
+    Talks to the PostgREST endpoint of a Supabase project over one shared
+    httpx.AsyncClient, so every request reuses keep-alive connections from
+    a bounded pool instead of blocking the event loop on network I/O.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        key: Optional[str] = None,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+        timeout: Optional[float] = None,
+        connect_timeout: Optional[float] = None,
+    ):
+        self.url = url or os.getenv('SUPABASE_URL')
+        self.key = key or os.getenv('SUPABASE_KEY')
+
+        if not self.url or not self.key:
+            raise ValueError(
+                'Supabase URL and key must be provided either through '
+                'constructor arguments or environment variables'
+            )
+
+        limits = httpx.Limits(
+            max_connections=max_connections or int(os.getenv('SUPABASE_POOL_MAX_CONNECTIONS', '20')),
+            max_keepalive_connections=max_keepalive_connections or int(os.getenv('SUPABASE_POOL_MAX_KEEPALIVE', '10')),
+            keepalive_expiry=keepalive_expiry or float(os.getenv('SUPABASE_POOL_KEEPALIVE_EXPIRY', '30')),
+        )
+        timeouts = httpx.Timeout(
+            timeout or float(os.getenv('SUPABASE_TIMEOUT', '10')),
+            connect=connect_timeout or float(os.getenv('SUPABASE_CONNECT_TIMEOUT', '5')),
+        )
+
+        self.client = httpx.AsyncClient(
+            base_url=f"{self.url.rstrip('/')}/rest/v1",
+            headers={
+                'apikey': self.key,
+                'Authorization': f'Bearer {self.key}',
+                'Content-Type': 'application/json',
+            },
+            limits=limits,
+            timeout=timeouts,
+        )
+
+    async def aclose(self):
+        """Close the shared connection pool"""
+        await self.client.aclose()
+
+    async def _select(self, table: str, params: List[Tuple[str, str]]) -> List[Dict]:
+        response = await self.client.get(f'/{table}', params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def _upsert(
+        self,
+        table: str,
+        data,
+        returning: str = 'representation',
+        on_conflict: Optional[str] = None,
+        ignore_duplicates: bool = False,
+    ) -> List[Dict]:
+        resolution = 'ignore-duplicates' if ignore_duplicates else 'merge-duplicates'
+        response = await self.client.post(
+            f'/{table}',
+            params={'on_conflict': on_conflict} if on_conflict else None,
+            json=data,
+            headers={'Prefer': f'resolution={resolution},return={returning}'},
+        )
+        response.raise_for_status()
+        return response.json() if returning == 'representation' else []
+
+    async def fetch_consumption_data(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+    ) -> List[Dict]:
+        """
+        Fetch power consumption data for a device within a time range.
+        """
+        try:
+            return await self._select('power_readings', [
+                ('select', '*'),
+                ('device_id', f'eq.{device_id}'),
+                ('timestamp', f'gte.{start_time.isoformat()}'),
+                ('timestamp', f'lte.{end_time.isoformat()}'),
+                ('order', 'timestamp.asc'),
+            ])
+        except Exception as e:
+            raise Exception(f'Error fetching consumption data: {str(e)}')
+
+    async def iter_consumption_chunks(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        columns: Sequence[str] = DEFAULT_READING_COLUMNS,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Yield power consumption data in pages, selecting only `columns`.
+
+        Pages follow a (timestamp, id) keyset, so long windows are read
+        completely instead of being truncated at the PostgREST row cap.
+        """
+        cursor = None
+        while True:
+            params = [
+                ('select', projection(columns)),
+                ('device_id', f'eq.{device_id}'),
+                ('timestamp', f'gte.{start_time.isoformat()}'),
+                ('timestamp', f'lte.{end_time.isoformat()}'),
+                ('order', 'timestamp.asc,id.asc'),
+                ('limit', str(page_size)),
+            ]
+            if cursor is not None:
+                params.append(('or', f'({keyset_filter(cursor)})'))
+
+            try:
+                page = await self._select('power_readings', params)
+            except Exception as e:
+                raise Exception(f'Error fetching consumption data: {str(e)}')
+
+            if page:
+                yield project_page(page, columns)
+
+            cursor = next_cursor(page)
+            if cursor is None:
+                break
+
+    async def fetch_consumption_frame(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        columns: Sequence[str] = DEFAULT_READING_COLUMNS,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> pd.DataFrame:
+        """
+        Fetch a complete time range as one DataFrame with only `columns`.
+        """
+        builder = ReadingFrameBuilder(columns)
+        async for chunk in self.iter_consumption_chunks(
+            device_id, start_time, end_time, columns, page_size
+        ):
+            builder.add(chunk)
+        return builder.build()
+
+    async def fetch_consumption_buckets(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        resolution: Union[str, int, timedelta] = '1h',
+    ) -> List[Dict]:
+        """
+        Fetch power consumption aggregated into fixed time buckets.
+
+        Same contract as SupabaseClient.fetch_consumption_buckets.
+        """
+        try:
+            response = await self.client.post('/rpc/power_readings_buckets', json={
+                'p_device_id': device_id,
+                'p_start': start_time.isoformat(),
+                'p_end': end_time.isoformat(),
+                'p_bucket_seconds': bucket_seconds(resolution),
+            })
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            raise Exception(f'Error fetching consumption buckets: {str(e)}')
+
+    async def fetch_consumption_rollups(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        granularity: str = 'hour',
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> List[Dict]:
+        """
+        Fetch precomputed hourly or daily rollups with bucket_start in the range.
+
+        Same contract as SupabaseClient.fetch_consumption_rollups.
+        """
+        table = rollup_table(granularity)
+        rows = []
+        cursor = None
+        while True:
+            params = [
+                ('select', ','.join(ROLLUP_COLUMNS)),
+                ('device_id', f'eq.{device_id}'),
+                ('bucket_start', f'lte.{end_time.isoformat()}'),
+                ('order', 'bucket_start.asc'),
+                ('limit', str(page_size)),
+            ]
+            if cursor is None:
+                params.append(('bucket_start', f'gte.{start_time.isoformat()}'))
+            else:
+                params.append(('bucket_start', f'gt.{cursor}'))
+
+            try:
+                page = await self._select(table, params)
+            except Exception as e:
+                raise Exception(f'Error fetching consumption rollups: {str(e)}')
+
+            # A short page may just be the server's max-rows cap
+            if not page:
+                return rows
+            rows.extend(page)
+            cursor = page[-1]['bucket_start']
+
+    async def save_consumption_data(
+        self,
+        device_id: str,
+        timestamp: datetime,
+        consumption: float,
+        predicted_consumption: Optional[float] = None,
+    ) -> Dict:
+        """
+        Save power consumption data point.
+        """
+        try:
+            data = {
+                'device_id': device_id,
+                'timestamp': timestamp.isoformat(),
+                'power_watts': consumption,
+            }
+            # A reading sent again replaces the stored one
+            rows = await self._upsert('power_readings', data, on_conflict=READING_CONFLICT_KEY)
+            return rows[0]
+        except Exception as e:
+            raise Exception(f'Error saving consumption data: {str(e)}')
+
+    async def save_consumption_data_batch(
+        self,
+        readings: List[Dict],
+        chunk_size: int = 500,
+    ) -> Dict:
+        """
+        Save many power consumption data points with chunked multi-row upserts.
+
+        Same contract as SupabaseClient.save_consumption_data_batch.
+        """
+        rows = [
+            {
+                'device_id': reading['device_id'],
+                'timestamp': reading['timestamp'].isoformat(),
+                'power_watts': reading['consumption'],
+                'power_kwh': reading.get('power_kwh') or 0.0,
+            }
+            for reading in readings
+        ]
+
+        saved = 0
+        failed_chunks = []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            try:
+                await self._upsert(
+                    'power_readings', chunk, returning='minimal',
+                    on_conflict=READING_CONFLICT_KEY, ignore_duplicates=True,
+                )
+                saved += len(chunk)
+            except Exception as e:
+                failed_chunks.append({
+                    'start': start,
+                    'end': start + len(chunk),
+                    'error': f'Error saving consumption data: {str(e)}',
+                })
+
+        return {'saved': saved, 'failed_chunks': failed_chunks}
+
+    async def save_anomaly_alert(
+        self,
+        device_id: str,
+        timestamp: datetime,
+        value: float,
+        deviation_percentage: float,
+        alert_type: str,
+        severity: str,
+    ) -> Dict:
+        """
+        Save anomaly alert.
+        """
+        try:
+            data = {
+                'device_id': device_id,
+                'timestamp': timestamp.isoformat(),
+                'value': value,
+                'deviation_percentage': deviation_percentage,
+                'type': alert_type,
+                'severity': severity,
+            }
+            rows = await self._upsert('anomaly_alerts', data)
+            return rows[0]
+        except Exception as e:
+            raise Exception(f'Error saving anomaly alert: {str(e)}')
+
+    async def fetch_anomalies(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+    ) -> List[Dict]:
+        """
+        Fetch anomaly alerts for a device within a time range.
+        """
+        try:
+            return await self._select('anomaly_alerts', [
+                ('select', '*'),
+                ('device_id', f'eq.{device_id}'),
+                ('timestamp', f'gte.{start_time.isoformat()}'),
+                ('timestamp', f'lte.{end_time.isoformat()}'),
+                ('order', 'timestamp.desc'),
+            ])
+        except Exception as e:
+            raise Exception(f'Error fetching anomalies: {str(e)}')
+
+    async def save_model_metrics(
+        self,
+        device_id: str,
+        metrics: Dict[str, float],
+    ) -> Dict:
+        """
+        Save model performance metrics.
+        """
+        try:
+            data = {
+                'device_id': device_id,
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                **metrics
+            }
+            rows = await self._upsert('model_metrics', data)
+            return rows[0]
+        except Exception as e:
+            raise Exception(f'Error saving model metrics: {str(e)}')
+
+    async def get_latest_model_metrics(
+        self,
+        device_id: str,
+    ) -> Optional[Dict]:
+        """
+        Get the most recent model metrics.
+        """
+        try:
+            rows = await self._select('model_metrics', [
+                ('select', '*'),
+                ('device_id', f'eq.{device_id}'),
+                ('order', 'timestamp.desc'),
+                ('limit', '1'),
+            ])
+            return rows[0] if rows else None
+        except Exception as e:
+            raise Exception(f'Error fetching model metrics: {str(e)}')
@@ -0,0 +1,321 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .supabase_client import SupabaseClient
+from .pagination import DEFAULT_READING_COLUMNS, bucket_seconds
+
+# Columns kept on disk; 'id' deduplicates overlapping syncs and
+# 'created_at' (server insert time) drives incremental syncs
+MIRROR_COLUMNS = ('id', 'timestamp', 'created_at', 'power_watts', 'power_kwh')
+
+def _to_utc(value: datetime) -> pd.Timestamp:
+    """Naive datetimes are treated as UTC, as the database does"""
+    ts = pd.Timestamp(value)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+class LocalPowerMirror:
+    """
+    Local on-disk columnar mirror of power_readings.
+
+    Layout: <root>/<device_id>/<YYYY-MM-DD>.parquet (UTC days of the
+    reading timestamp) plus a per-device _watermark.json.
+
+    The first sync backfills readings timestamped in the last backfill_days;
+    that start is the mirror's coverage. Later syncs pull rows inserted
+    since the last one by server created_at (minus a small overlap for
+    transactions committing late), so uploads of old readings after an
+    outage are mirrored too, into the day partitions of their timestamps.
+
+    Reads expose the same interface as SupabaseClient, so the services and
+    preprocessors can use a mirror in place of the database client. The
+    part of a range before the coverage start is read from the database.
+    """
+
+    def __init__(
+        self,
+        db_client: SupabaseClient,
+        root: str = 'power_mirror',
+        backfill_days: int = 30,
+        overlap: timedelta = timedelta(minutes=10),
+        max_staleness: Optional[float] = 60.0,
+    ):
+        self.db_client = db_client
+        self.root = root
+        self.backfill_days = backfill_days
+        self.overlap = overlap
+        # Reads sync first when the last sync is older than this (seconds)
+        self.max_staleness = max_staleness
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _device_dir(self, device_id: str) -> str:
+        return os.path.join(self.root, device_id)
+
+    def _partition_path(self, device_id: str, day) -> str:
+        return os.path.join(self._device_dir(device_id), f'{day.isoformat()}.parquet')
+
+    def _watermark_path(self, device_id: str) -> str:
+        return os.path.join(self._device_dir(device_id), '_watermark.json')
+
+    def _lock(self, device_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(device_id, threading.Lock())
+
+    def get_watermark(self, device_id: str) -> Optional[Dict]:
+        """
+        Sync state of a device, or None if never synced: latest mirrored
+        reading timestamp, latest created_at, coverage start, last sync time
+        """
+        try:
+            with open(self._watermark_path(device_id), 'r') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        def parse(key: str) -> Optional[datetime]:
+            return datetime.fromisoformat(state[key]) if state.get(key) else None
+
+        return {
+            'watermark': parse('watermark'),
+            'created_at': parse('created_at'),
+            'covered_from': parse('covered_from'),
+            'synced_at': parse('synced_at'),
+            'rows': state['rows'],
+        }
+
+    def _write_watermark(self, device_id: str, state: Dict):
+        state = {
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in {**state, 'synced_at': datetime.now(timezone.utc)}.items()
+        }
+        path = self._watermark_path(device_id)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(f'{path}.tmp', path)
+
+    def sync(self, device_id: str) -> int:
+        """
+        Pull rows inserted since the last sync and merge them into the mirror.
+
+        Returns the number of rows fetched.
+        """
+        with self._lock(device_id):
+            os.makedirs(self._device_dir(device_id), exist_ok=True)
+            state = self.get_watermark(device_id)
+            now = datetime.now(timezone.utc)
+
+            if state and state['created_at'] and state['covered_from']:
+                df = self.db_client.fetch_consumption_created_since(
+                    device_id, state['created_at'] - self.overlap, columns=MIRROR_COLUMNS
+                )
+            else:
+                # First sync (or a pre-created_at watermark): backfill by timestamp
+                state = {'watermark': None, 'created_at': None, 'rows': 0,
+                         'covered_from': now - timedelta(days=self.backfill_days)}
+                df = self.db_client.fetch_consumption_frame(
+                    device_id, state['covered_from'], now, columns=MIRROR_COLUMNS
+                )
+
+            if df.empty:
+                # Nothing new; later rows are inserted after this sync started
+                created_at = state['created_at'] or now
+            else:
+                for day, day_df in df.groupby(df['timestamp'].dt.date):
+                    state['rows'] += self._merge_partition(device_id, day, day_df)
+                latest = df['timestamp'].max().to_pydatetime()
+                state['watermark'] = max(state['watermark'], latest) if state['watermark'] else latest
+                created_at = df['created_at'].max().to_pydatetime()
+                if state['created_at']:
+                    created_at = max(state['created_at'], created_at)
+
+            state['created_at'] = created_at
+            self._write_watermark(device_id, state)
+            return len(df)
+
+    def _merge_partition(self, device_id: str, day, new_rows: pd.DataFrame) -> int:
+        """Merge rows into one day file atomically; returns the number of rows added"""
+        path = self._partition_path(device_id, day)
+        existing_count = 0
+        if os.path.exists(path):
+            existing = pq.read_table(path).to_pandas()
+            existing_count = len(existing)
+            new_rows = pd.concat([existing, new_rows], ignore_index=True)
+
+        merged = new_rows \
+            .drop_duplicates(subset='id', keep='last') \
+            .sort_values(['timestamp', 'id']) \
+            .reset_index(drop=True)
+
+        table = pa.Table.from_pandas(merged[list(MIRROR_COLUMNS)], preserve_index=False)
+        pq.write_table(table, f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+        return len(merged) - existing_count
+
+    def _maybe_sync(self, device_id: str) -> Optional[datetime]:
+        """Sync if stale; returns the coverage start (None if never synced)"""
+        state = self.get_watermark(device_id)
+        if self.max_staleness is not None:
+            age = (datetime.now(timezone.utc) - state['synced_at']).total_seconds() if state else None
+            if age is None or age > self.max_staleness or not state['covered_from']:
+                self.sync(device_id)
+                state = self.get_watermark(device_id)
+        return state['covered_from'] if state else None
+
+    def _split_range(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+    ) -> Tuple[Optional[Tuple[datetime, datetime]], Optional[datetime]]:
+        """
+        ((start, end) to read from the database or None, mirror read start or None)
+        """
+        covered_from = self._maybe_sync(device_id)
+        if covered_from is None:
+            return (start_time, end_time), None
+        start, end = _to_utc(start_time), _to_utc(end_time)
+        if start >= covered_from:
+            return None, start_time
+        if end < covered_from:
+            return (start_time, end_time), None
+        # Bounds are inclusive on both sides
+        return (start_time, covered_from - timedelta(microseconds=1)), covered_from
+
+    def _partitions(self, device_id: str, start_time: datetime, end_time: datetime) -> List[str]:
+        # List the day files that exist rather than walking every day of the range
+        try:
+            names = os.listdir(self._device_dir(device_id))
+        except FileNotFoundError:
+            return []
+        first, last = _to_utc(start_time).date().isoformat(), _to_utc(end_time).date().isoformat()
+        return [
+            os.path.join(self._device_dir(device_id), name)
+            for name in sorted(names)
+            if name.endswith('.parquet') and first <= name[:-len('.parquet')] <= last
+        ]
+
+    def _read_partition(
+        self,
+        path: str,
+        start_time: datetime,
+        end_time: datetime,
+        columns: Sequence[str],
+    ) -> pd.DataFrame:
+        # Memory-mapped read; only the requested columns are decoded
+        table = pq.read_table(
+            path,
+            columns=list(columns),
+            memory_map=True,
+            filters=[
+                ('timestamp', '>=', _to_utc(start_time)),
+                ('timestamp', '<=', _to_utc(end_time)),
+            ],
+        )
+        return table.to_pandas()
+
+    def iter_consumption_chunks(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        columns: Sequence[str] = DEFAULT_READING_COLUMNS,
+        page_size: Optional[int] = None,
+    ) -> Iterator[List[Dict]]:
+        """
+        Yield mirrored readings one day partition at a time, after any
+        uncovered start of the range read from the database.
+        """
+        db_range, mirror_start = self._split_range(device_id, start_time, end_time)
+        if db_range is not None:
+            yield from self.db_client.iter_consumption_chunks(device_id, *db_range, columns=columns)
+        if mirror_start is None:
+            return
+        for path in self._partitions(device_id, mirror_start, end_time):
+            df = self._read_partition(path, mirror_start, end_time, columns)
+            if not df.empty:
+                yield df.to_dict('records')
+
+    def fetch_consumption_frame(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        columns: Sequence[str] = DEFAULT_READING_COLUMNS,
+        page_size: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """
+        Read a time range from the mirror as one DataFrame with only `columns`.
+
+        The part of the range before the mirror's coverage comes from the
+        database.
+        """
+        db_range, mirror_start = self._split_range(device_id, start_time, end_time)
+        frames = []
+        if db_range is not None:
+            frames.append(self.db_client.fetch_consumption_frame(device_id, *db_range, columns=columns))
+        if mirror_start is not None:
+            frames.extend(
+                self._read_partition(path, mirror_start, end_time, columns)
+                for path in self._partitions(device_id, mirror_start, end_time)
+            )
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame({
+                column: pd.Series(dtype='datetime64[ns, UTC]' if column == 'timestamp' else np.float64)
+                for column in columns
+            })
+        return pd.concat(frames, ignore_index=True)
+
+    def fetch_consumption_data(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+    ) -> List[Dict]:
+        """
+        Fetch power consumption data for a device within a time range.
+        """
+        df = self.fetch_consumption_frame(
+            device_id, start_time, end_time, columns=('id', 'timestamp', 'power_watts', 'power_kwh')
+        )
+        df['device_id'] = device_id
+        df['timestamp'] = df['timestamp'].map(lambda ts: ts.isoformat())
+        return df.to_dict('records')
+
+    def fetch_consumption_buckets(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        resolution: Union[str, int, timedelta] = '1h',
+    ) -> List[Dict]:
+        """
+        Aggregate mirrored readings into fixed time buckets.
+
+        Same contract as SupabaseClient.fetch_consumption_buckets.
+        """
+        df = self.fetch_consumption_frame(
+            device_id, start_time, end_time, columns=('timestamp', 'power_watts', 'power_kwh')
+        )
+        if df.empty:
+            return []
+
+        freq = pd.Timedelta(seconds=bucket_seconds(resolution))
+        buckets = df.groupby(df['timestamp'].dt.floor(freq)).agg(
+            mean_watts=('power_watts', 'mean'),
+            min_watts=('power_watts', 'min'),
+            max_watts=('power_watts', 'max'),
+            sample_count=('power_watts', 'size'),
+            energy_kwh=('power_kwh', 'sum'),
+        ).reset_index()
+        buckets = buckets.rename(columns={'timestamp': 'bucket_start'})
+        buckets['bucket_start'] = buckets['bucket_start'].map(lambda ts: ts.isoformat())
+        return buckets.to_dict('records')
@@ -0,0 +1,135 @@
+from datetime import timedelta
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+import pandas as pd
+
+# Columns the models actually use; 'id', 'metadata' and 'created_at' stay on the server
+DEFAULT_READING_COLUMNS = ('timestamp', 'power_watts')
+
+# Supabase caps a single PostgREST response at 1000 rows by default. The
+# server's max-rows may be lower than the requested page size, so a short
+# page does not mean the range is exhausted: paging stops on an empty page.
+DEFAULT_PAGE_SIZE = 1000
+
+# Natural key of power_readings (unique since 20250704000000): a reading sent
+# twice, e.g. by a retried upload, is stored once
+READING_CONFLICT_KEY = 'device_id,timestamp'
+
+def parse_timestamps(values) -> pd.DatetimeIndex:
+    """
+    UTC timestamps from PostgREST timestamptz strings, whose fractional
+    seconds vary per row (e.g. '...10:00:00.123456+00:00' and '...10:05:00+00:00')
+    """
+    return pd.to_datetime(values, utc=True, format='ISO8601')
+
+# Incrementally maintained rollups of power_readings, keyed by granularity
+ROLLUP_TABLES = {
+    'hour': 'power_readings_hourly',
+    'day': 'power_readings_daily',
+}
+
+ROLLUP_COLUMNS = (
+    'bucket_start', 'sample_count', 'sum_watts', 'mean_watts',
+    'min_watts', 'max_watts', 'energy_kwh',
+)
+
+def bucket_seconds(resolution: Union[str, int, timedelta]) -> int:
+    """
+    Convert a bucket resolution ('1h', '15min', 300, timedelta) to seconds.
+    """
+    if isinstance(resolution, int):
+        seconds = resolution
+    else:
+        seconds = int(pd.Timedelta(resolution).total_seconds())
+    if seconds <= 0:
+        raise ValueError(f'Bucket resolution must be positive, got {resolution}')
+    return seconds
+
+def rollup_table(granularity: str) -> str:
+    """Rollup table for a granularity ('hour' or 'day')"""
+    try:
+        return ROLLUP_TABLES[granularity]
+    except KeyError:
+        raise ValueError(
+            f"Unknown rollup granularity '{granularity}', "
+            f"expected one of {', '.join(ROLLUP_TABLES)}"
+        )
+
+def buckets_to_frame(rows: List[Dict]) -> pd.DataFrame:
+    """
+    Turn bucket rows into a reading-shaped frame.
+
+    The bucket mean becomes 'power_watts' and the bucket start 'timestamp',
+    so the preprocessors can consume it like raw readings.
+    """
+    df = pd.DataFrame(rows, columns=[
+        'bucket_start', 'mean_watts', 'min_watts', 'max_watts',
+        'sample_count', 'energy_kwh',
+    ])
+    df = df.rename(columns={'bucket_start': 'timestamp', 'mean_watts': 'power_watts'})
+    df['timestamp'] = parse_timestamps(df['timestamp'])
+    return df
+
+def projection(columns: Sequence[str], keys: Sequence[str] = ('timestamp', 'id')) -> str:
+    """
+    Build the select list for a keyset-paginated read.
+
+    The keyset columns ('timestamp' and 'id' by default) are always selected
+    because they form the cursor.
+    """
+    selected = list(columns)
+    for key in keys:
+        if key not in selected:
+            selected.append(key)
+    return ','.join(selected)
+
+def keyset_filter(cursor: Tuple[str, str], column: str = 'timestamp') -> str:
+    """
+    PostgREST or-filter selecting rows strictly after (column, id).
+
+    Values are quoted because timestamps contain ':' and '+'.
+    """
+    value, row_id = cursor
+    return (
+        f'{column}.gt."{value}",'
+        f'and({column}.eq."{value}",id.gt."{row_id}")'
+    )
+
+def next_cursor(page: List[Dict], column: str = 'timestamp') -> Optional[Tuple[str, str]]:
+    """Cursor for the page after this one, or None once a page comes back empty"""
+    if not page:
+        return None
+    last = page[-1]
+    return last[column], last['id']
+
+def project_page(page: List[Dict], columns: Sequence[str]) -> List[Dict]:
+    """Drop cursor columns that the caller did not ask for"""
+    if 'id' in columns:
+        return page
+    return [{column: row.get(column) for column in columns} for row in page]
+
+class ReadingFrameBuilder:
+    """
+    Accumulates paginated chunks column by column and builds one frame.
+
+    Avoids keeping every row dict alive until the end of a long read.
+    """
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = list(columns)
+        self._values: Dict[str, List] = {column: [] for column in self.columns}
+
+    def add(self, chunk: List[Dict]):
+        for column in self.columns:
+            self._values[column].extend(row.get(column) for row in chunk)
+
+    def build(self) -> pd.DataFrame:
+        data = {}
+        for column, values in self._values.items():
+            if column in ('timestamp', 'created_at'):
+                data[column] = parse_timestamps(values)
+            elif column in ('power_watts', 'power_kwh'):
+                data[column] = np.asarray(values, dtype=np.float64)
+            else:
+                data[column] = values
+        return pd.DataFrame(data, columns=self.columns)
@@ -1,8 +1,15 @@
-from datetime import datetime
-from typing import Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Sequence, Union
 from supabase import create_client, Client
+from postgrest.types import ReturnMethod
+import pandas as pd
 import os
 
+from .pagination import (
+    DEFAULT_PAGE_SIZE, DEFAULT_READING_COLUMNS, READING_CONFLICT_KEY, ROLLUP_COLUMNS, ReadingFrameBuilder,
+    bucket_seconds, keyset_filter, next_cursor, project_page, projection, rollup_table,
+)
+
 class SupabaseClient:
     def __init__(self, url: Optional[str] = None, key: Optional[str] = None):
         self.url = url or os.getenv('SUPABASE_URL')
@@ -37,6 +44,171 @@ class SupabaseClient:
         except Exception as e:
             raise Exception(f'Error fetching consumption data: {str(e)}')
 
+    def iter_consumption_chunks(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        columns: Sequence[str] = DEFAULT_READING_COLUMNS,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> Iterator[List[Dict]]:
+        """
+        Yield power consumption data in pages, selecting only `columns`.
+
+        Pages follow a (timestamp, id) keyset, so long windows are read
+        completely instead of being truncated at the PostgREST row cap.
+        """
+        cursor = None
+        while True:
+            try:
+                query = self.client.table('power_readings') \
+                    .select(projection(columns)) \
+                    .eq('device_id', device_id) \
+                    .gte('timestamp', start_time.isoformat()) \
+                    .lte('timestamp', end_time.isoformat())
+                if cursor is not None:
+                    query = query.or_(keyset_filter(cursor))
+                response = query \
+                    .order('timestamp') \
+                    .order('id') \
+                    .limit(page_size) \
+                    .execute()
+            except Exception as e:
+                raise Exception(f'Error fetching consumption data: {str(e)}')
+
+            page = response.data
+            if page:
+                yield project_page(page, columns)
+
+            cursor = next_cursor(page)
+            if cursor is None:
+                break
+
+    def fetch_consumption_frame(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        columns: Sequence[str] = DEFAULT_READING_COLUMNS,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> pd.DataFrame:
+        """
+        Fetch a complete time range as one DataFrame with only `columns`.
+        """
+        builder = ReadingFrameBuilder(columns)
+        for chunk in self.iter_consumption_chunks(
+            device_id, start_time, end_time, columns, page_size
+        ):
+            builder.add(chunk)
+        return builder.build()
+
+    def fetch_consumption_created_since(
+        self,
+        device_id: str,
+        created_after: datetime,
+        columns: Sequence[str] = DEFAULT_READING_COLUMNS,
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> pd.DataFrame:
+        """
+        Fetch rows inserted at or after created_after, whatever their timestamp.
+
+        created_at is the server insert time, so readings uploaded late with
+        old device timestamps (e.g. an ESP32 backlog) are included. Pages
+        follow a (created_at, id) keyset; created_at is always returned.
+        """
+        selected = list(columns) if 'created_at' in columns else [*columns, 'created_at']
+        builder = ReadingFrameBuilder(selected)
+        cursor = None
+        while True:
+            try:
+                query = self.client.table('power_readings') \
+                    .select(projection(selected, keys=('created_at', 'id'))) \
+                    .eq('device_id', device_id) \
+                    .gte('created_at', created_after.isoformat())
+                if cursor is not None:
+                    query = query.or_(keyset_filter(cursor, column='created_at'))
+                response = query \
+                    .order('created_at') \
+                    .order('id') \
+                    .limit(page_size) \
+                    .execute()
+            except Exception as e:
+                raise Exception(f'Error fetching consumption data: {str(e)}')
+
+            page = response.data
+            cursor = next_cursor(page, column='created_at')
+            if cursor is None:
+                return builder.build()
+            builder.add(page)
+
+    def fetch_consumption_buckets(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        resolution: Union[str, int, timedelta] = '1h',
+    ) -> List[Dict]:
+        """
+        Fetch power consumption aggregated into fixed time buckets.
+
+        Each row has bucket_start, mean_watts, min_watts, max_watts,
+        sample_count and energy_kwh. Aggregation runs in the database
+        (power_readings_buckets), so only one row per bucket is transferred.
+        """
+        try:
+            response = self.client.rpc('power_readings_buckets', {
+                'p_device_id': device_id,
+                'p_start': start_time.isoformat(),
+                'p_end': end_time.isoformat(),
+                'p_bucket_seconds': bucket_seconds(resolution),
+            }).execute()
+            return response.data
+        except Exception as e:
+            raise Exception(f'Error fetching consumption buckets: {str(e)}')
+
+    def fetch_consumption_rollups(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        granularity: str = 'hour',
+        page_size: int = DEFAULT_PAGE_SIZE,
+    ) -> List[Dict]:
+        """
+        Fetch precomputed hourly or daily rollups with bucket_start in the range.
+
+        Each row has bucket_start, sample_count, sum_watts, mean_watts,
+        min_watts, max_watts and energy_kwh. Rollups are maintained on
+        insert, so no raw readings are scanned.
+        """
+        table = rollup_table(granularity)
+        rows = []
+        cursor = None
+        while True:
+            try:
+                query = self.client.table(table) \
+                    .select(','.join(ROLLUP_COLUMNS)) \
+                    .eq('device_id', device_id) \
+                    .lte('bucket_start', end_time.isoformat())
+                if cursor is None:
+                    query = query.gte('bucket_start', start_time.isoformat())
+                else:
+                    # bucket_start is unique per device, so it is the keyset on its own
+                    query = query.gt('bucket_start', cursor)
+                response = query \
+                    .order('bucket_start') \
+                    .limit(page_size) \
+                    .execute()
+            except Exception as e:
+                raise Exception(f'Error fetching consumption rollups: {str(e)}')
+
+            page = response.data
+            # A short page may just be the server's max-rows cap
+            if not page:
+                return rows
+            rows.extend(page)
+            cursor = page[-1]['bucket_start']
+
     def save_consumption_data(
         self,
         device_id: str,
@@ -53,13 +225,63 @@ class SupabaseClient:
                 'timestamp': timestamp.isoformat(),
                 'power_watts': consumption,
             }
+            # A reading sent again replaces the stored one
             response = self.client.table('power_readings') \
-                .upsert(data) \
+                .upsert(data, on_conflict=READING_CONFLICT_KEY) \
                 .execute()
             return response.data[0]
         except Exception as e:
             raise Exception(f'Error saving consumption data: {str(e)}')
 
+    def save_consumption_data_batch(
+        self,
+        readings: List[Dict],
+        chunk_size: int = 500,
+    ) -> Dict:
+        """
+        Save many power consumption data points with chunked multi-row upserts.
+
+        Each reading is a dict with 'device_id', 'timestamp', 'consumption'
+        and optionally 'power_kwh'.
+        A failing chunk does not abort the remaining ones; its row range is
+        reported under 'failed_chunks' so callers can map errors to items.
+        Readings already stored under the same (device_id, timestamp) are
+        skipped, so a retried batch or upload is idempotent and the insert
+        triggers (total_power, rollups) never count a reading twice.
+        """
+        rows = [
+            {
+                'device_id': reading['device_id'],
+                'timestamp': reading['timestamp'].isoformat(),
+                'power_watts': reading['consumption'],
+                'power_kwh': reading.get('power_kwh') or 0.0,
+            }
+            for reading in readings
+        ]
+
+        saved = 0
+        failed_chunks = []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            try:
+                self.client.table('power_readings') \
+                    .upsert(
+                        chunk,
+                        returning=ReturnMethod.minimal,
+                        on_conflict=READING_CONFLICT_KEY,
+                        ignore_duplicates=True,
+                    ) \
+                    .execute()
+                saved += len(chunk)
+            except Exception as e:
+                failed_chunks.append({
+                    'start': start,
+                    'end': start + len(chunk),
+                    'error': f'Error saving consumption data: {str(e)}',
+                })
+
+        return {'saved': saved, 'failed_chunks': failed_chunks}
+
     async def save_anomaly_alert(
         self,
         device_id: str,
@@ -125,7 +347,7 @@ class SupabaseClient:
         try:
             data = {
                 'device_id': device_id,
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': datetime.now(timezone.utc).isoformat(),
                 **metrics
             }
             
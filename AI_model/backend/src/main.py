@@ -1,15 +1,25 @@
 import os
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-from fastapi import FastAPI, HTTPException, Depends
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
 from .models.power_prediction_model import PowerPredictionModel
+from .models.model_bundle import load_bundle, latest_bundle_path
 from .utils.data_preprocessor import PowerDataPreprocessor
+from .database.async_supabase_client import AsyncSupabaseClient
 from .database.supabase_client import SupabaseClient
+from .database.local_mirror import LocalPowerMirror
 from .services.prediction_service import PredictionService
+from .services.ingestion_service import IngestionService
+from .services.write_behind_buffer import WriteBehindBuffer, BufferFullError
+from .utils.ring_buffer import DeviceRingBuffers
+from .utils.online_features import DeviceFeatureStates
+from .utils.anomaly_detectors import DeviceAnomalyModels
+from .utils.feature_stats import DeviceFeatureStatistics
+from .utils.quality_stats import collect_quality_reports
 
 # Load environment variables
 load_dotenv()
@@ -31,10 +41,106 @@ app.add_middleware(
 )
 
 # Initialize services
-model = PowerPredictionModel()
-preprocessor = PowerDataPreprocessor()
-db_client = SupabaseClient()
-prediction_service = PredictionService(model, preprocessor, db_client)
+# Serve the latest trained bundle if there is one; its scalers are never refitted
+MODEL_BUNDLE_DIR = os.getenv("MODEL_BUNDLE_DIR")
+if MODEL_BUNDLE_DIR and latest_bundle_path(MODEL_BUNDLE_DIR):
+    bundle = load_bundle(MODEL_BUNDLE_DIR)
+    model = bundle.model
+    preprocessor = bundle.preprocessor()
+else:
+    model = PowerPredictionModel()
+    preprocessor = PowerDataPreprocessor()
+# Per-device anomaly models of the enhanced preprocessor, kept across restarts
+ANOMALY_MODEL_DIR = os.getenv("ANOMALY_MODEL_DIR") or (
+    os.path.join(MODEL_BUNDLE_DIR, "anomaly_models") if MODEL_BUNDLE_DIR else None
+)
+if ANOMALY_MODEL_DIR and hasattr(preprocessor, "anomaly_models"):
+    preprocessor.anomaly_models = DeviceAnomalyModels(model_dir=ANOMALY_MODEL_DIR)
+# Traced once here; requests call the compiled function instead of Model.predict
+if os.getenv("SERVING_COMPILED", "true").lower() in ("1", "true", "yes"):
+    model.compile_for_serving(
+        max_batch_size=int(os.getenv("SERVING_MAX_BATCH_SIZE", "256")),
+        jit_compile=os.getenv("SERVING_XLA", "false").lower() in ("1", "true", "yes"),
+    )
+# Shared keep-alive connection pool for all handlers
+db_client = AsyncSupabaseClient()
+
+# Optional local columnar mirror: history reads hit disk, synced incrementally
+history_source = db_client
+if os.getenv("LOCAL_MIRROR_DIR"):
+    history_source = LocalPowerMirror(
+        SupabaseClient(),
+        root=os.getenv("LOCAL_MIRROR_DIR"),
+        max_staleness=float(os.getenv("LOCAL_MIRROR_MAX_STALENESS", "60")),
+    )
+
+# Optional in-memory recent readings per device (hourly buckets), fed by
+# ingestion and re-seeded from history_source once older than the staleness limit
+ring_buffers = None
+if os.getenv("RING_BUFFERS", "false").lower() in ("1", "true", "yes"):
+    ring_buffers = DeviceRingBuffers(
+        history_source,
+        seed_window=timedelta(hours=48),
+        bucket_seconds=int(os.getenv("RING_BUFFER_BUCKET_SECONDS", "3600")),
+        max_devices=int(os.getenv("RING_BUFFER_MAX_DEVICES", "10000")),
+        max_staleness=float(os.getenv("RING_BUFFER_MAX_STALENESS", "60")),
+    )
+
+# Optional per-device lag/rolling/EMA features on the hourly grid, stepped
+# at ingest; enhanced preprocessors read prediction windows from them
+feature_states = None
+if os.getenv("FEATURE_STATES", "false").lower() in ("1", "true", "yes"):
+    feature_states = DeviceFeatureStates(
+        bucket_seconds=int(os.getenv("FEATURE_STATES_BUCKET_SECONDS", "3600")),
+        max_devices=int(os.getenv("FEATURE_STATES_MAX_DEVICES", "10000")),
+    )
+    if hasattr(preprocessor, "feature_states"):
+        preprocessor.feature_states = feature_states
+
+# Optional per-device model feature statistics, updated at ingest and
+# served by /api/feature-importance without rebuilding any history
+feature_stats = None
+if os.getenv("FEATURE_STATS", "false").lower() in ("1", "true", "yes"):
+    feature_stats = DeviceFeatureStatistics(
+        max_devices=int(os.getenv("FEATURE_STATS_MAX_DEVICES", "10000")),
+    )
+    if hasattr(preprocessor, "feature_stats"):
+        preprocessor.feature_stats = feature_stats
+
+prediction_service = PredictionService(
+    model,
+    preprocessor,
+    history_source,
+    ring_buffers=ring_buffers,
+    bundle_dir=MODEL_BUNDLE_DIR,
+    # Cache each device's LSTM state and step it once per new reading
+    streaming=os.getenv("PREDICT_STREAMING", "false").lower() in ("1", "true", "yes"),
+    streaming_rewarm_steps=int(os.getenv("STREAMING_REWARM_STEPS", "168")) or None,
+    streaming_max_devices=int(os.getenv("STREAMING_MAX_DEVICES", "10000")),
+)
+
+PREDICT_MAX_BATCH_DEVICES = int(os.getenv("PREDICT_MAX_BATCH_DEVICES", "1000"))
+
+# Optional write-behind mode: acknowledge readings once queued in memory
+write_behind = None
+if os.getenv("INGEST_WRITE_BEHIND", "false").lower() in ("1", "true", "yes"):
+    write_behind = WriteBehindBuffer(
+        db_client,
+        max_queue_size=int(os.getenv("INGEST_QUEUE_SIZE", "100000")),
+        flush_size=int(os.getenv("INGEST_FLUSH_SIZE", "500")),
+        flush_interval=float(os.getenv("INGEST_FLUSH_INTERVAL", "1.0")),
+        dead_letter_path=os.getenv("INGEST_DEAD_LETTER_PATH", "ingest_dead_letter.ndjson"),
+    )
+
+ingestion_service = IngestionService(
+    db_client,
+    chunk_size=int(os.getenv("INGEST_CHUNK_SIZE", "500")),
+    max_batch_size=int(os.getenv("INGEST_MAX_BATCH_SIZE", "10000")),
+    write_behind=write_behind,
+    ring_buffers=ring_buffers,
+    feature_states=feature_states,
+    feature_stats=feature_stats,
+)
 
 # Pydantic models for request/response validation
 class ConsumptionData(BaseModel):
@@ -43,6 +149,13 @@ class ConsumptionData(BaseModel):
     consumption: float
     predicted_consumption: Optional[float] = None
 
+class BatchConsumptionData(BaseModel):
+    # Items are validated one by one so a bad row rejects only itself
+    readings: List[Any]
+
+class BatchPredictionRequest(BaseModel):
+    device_ids: List[str]
+
 class PredictionResponse(BaseModel):
     predictions: List[Dict]
     anomalies: List[Dict]
@@ -53,23 +166,109 @@ class ModelMetrics(BaseModel):
     mae: float
     accuracy: float
 
+@app.on_event("startup")
+async def start_write_behind():
+    if write_behind is not None:
+        await write_behind.start()
+
+@app.on_event("shutdown")
+async def drain_write_behind():
+    if write_behind is not None:
+        await write_behind.stop()
+    await db_client.aclose()
+
 @app.get("/")
 async def root():
     return {"message": "Power Consumption AI API is running"}
 
+@app.get("/api/ingest/stats")
+async def get_ingest_stats():
+    """
+    Get write-behind queue depth and flush counters, and ring buffer and
+    online feature state usage.
+    """
+    memory = {
+        "ring_buffers": ring_buffers.stats() if ring_buffers is not None else None,
+        "feature_states": feature_states.stats() if feature_states is not None else None,
+    }
+    if write_behind is None:
+        return {"write_behind": False, **memory}
+    return {"write_behind": True, **write_behind.stats(), **memory}
+
+@app.get("/api/predictions/streaming/stats")
+async def get_streaming_stats():
+    """
+    Get recurrent step, warm-up and device counters of streaming predictions.
+    """
+    stats = prediction_service.streaming_stats()
+    if stats is None:
+        return {"streaming": False}
+    return {"streaming": True, **stats}
+
+@app.get("/api/feature-importance")
+async def get_feature_importance(device_ids: Optional[str] = None):
+    """
+    Get correlations, means and stds of the model features over ingested
+    readings, for comma-separated devices (all devices by default).
+    """
+    if feature_stats is None:
+        return {"feature_stats": False}
+    ids = [device_id for device_id in device_ids.split(",") if device_id] if device_ids else None
+    return {"feature_stats": True, **feature_stats.report(ids)}
+
+@app.post("/api/consumption/batch")
+async def save_consumption_batch(data: BatchConsumptionData):
+    """
+    Save a batch of power consumption data points, possibly for several devices.
+    """
+    try:
+        return await ingestion_service.ingest_batch(data.readings)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/consumption/upload")
+async def upload_consumption(
+    request: Request,
+    format: Optional[str] = None,
+    device_id: Optional[str] = None,
+    batch_size: Optional[int] = None,
+):
+    """
+    Stream a CSV or NDJSON body of power readings into the database.
+
+    The body uses the power_readings_rows.csv column layout (CSV) or one
+    reading object per line (NDJSON) and may be sent with chunked encoding.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "ndjson" if "ndjson" in content_type or "jsonl" in content_type else "csv"
+
+    try:
+        return await ingestion_service.ingest_stream(
+            request.stream(),
+            fmt=format,
+            device_id=device_id,
+            batch_size=batch_size,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/consumption/{device_id}")
 async def save_consumption(device_id: str, data: ConsumptionData):
     """
     Save power consumption data point.
     """
     try:
-        result = db_client.save_consumption_data(
-            device_id=device_id,
-            timestamp=data.timestamp,
-            consumption=data.consumption,
-            predicted_consumption=data.predicted_consumption,
-        )
-        return result
+        # Same validation as the batch path; queued when write-behind is on
+        return await ingestion_service.ingest_reading(device_id, data.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BufferFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -83,7 +282,7 @@ async def get_consumption(
     Get power consumption data for a device within a time range.
     """
     try:
-        data = db_client.fetch_consumption_data(
+        data = await db_client.fetch_consumption_data(
             device_id,
             start_date,
             end_date,
@@ -92,6 +291,52 @@ async def get_consumption(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/consumption/{device_id}/rollups")
+async def get_consumption_rollups(
+    device_id: str,
+    start_date: datetime,
+    end_date: datetime,
+    granularity: str = "hour",
+):
+    """
+    Get precomputed hourly or daily consumption aggregates for a device.
+    """
+    try:
+        return await db_client.fetch_consumption_rollups(
+            device_id,
+            start_date,
+            end_date,
+            granularity=granularity,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/data-quality")
+async def get_data_quality(
+    device_ids: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+):
+    """
+    Get data quality reports for comma-separated devices, streamed over
+    their full history (or the given range) in chunks.
+    """
+    try:
+        # Straight from the database: the mirror may not cover the full
+        # history, and the report is about what is actually stored
+        return await collect_quality_reports(
+            db_client,
+            [device_id for device_id in device_ids.split(",") if device_id],
+            # Unset device clocks report 1970 timestamps; include them by default
+            start_date or datetime(1970, 1, 1, tzinfo=timezone.utc),
+            end_date or datetime.now(timezone.utc),
+            max_concurrency=int(os.getenv("QUALITY_REPORT_CONCURRENCY", "4")),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/predictions/{device_id}")
 async def get_predictions(device_id: str):
     """
@@ -105,13 +350,31 @@ async def get_predictions(device_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/predictions/batch")
+async def get_batch_predictions(request: BatchPredictionRequest):
+    """
+    Get next-24h predictions for many devices with one model call.
+    Devices that cannot be predicted carry an inline error.
+    """
+    if len(request.device_ids) > PREDICT_MAX_BATCH_DEVICES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {PREDICT_MAX_BATCH_DEVICES} devices per batch",
+        )
+    try:
+        return await prediction_service.predict_batch(request.device_ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/model-metrics/{device_id}")
 async def get_model_metrics(device_id: str):
     """
     Get model performance metrics.
     """
     try:
-        metrics = prediction_service.get_prediction_accuracy(device_id)
+        metrics = await prediction_service.get_prediction_accuracy(device_id)
         return metrics
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -124,7 +387,7 @@ async def train_model(device_id: str):
     Train the model on recent data.
     """
     try:
-        metrics = prediction_service.train(device_id)
+        metrics = await prediction_service.train(device_id)
         return metrics
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
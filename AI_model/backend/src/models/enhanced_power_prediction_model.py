@@ -9,6 +9,8 @@ from tensorflow.keras.optimizers import Adam
 import numpy as np
 from typing import Tuple, List, Dict
 
+from .compiled_inference import CompiledPredictor
+
 class EnhancedPowerPredictionModel:
     """
     Advanced power prediction model with hybrid architecture:
@@ -18,6 +20,8 @@ class EnhancedPowerPredictionModel:
     - Multi-feature input support (weather, time features, etc.)
     """
     
+    model_type = 'enhanced_hybrid'
+
     def __init__(
         self,
         sequence_length: int = 168,  # 1 week of hourly data
@@ -33,10 +37,24 @@ class EnhancedPowerPredictionModel:
         self.sequence_length = sequence_length
         self.n_power_features = n_power_features
         self.n_contextual_features = n_contextual_features
+        # Constructor arguments, stored so a model bundle can rebuild the graph
+        self.config = {
+            'sequence_length': sequence_length,
+            'n_power_features': n_power_features,
+            'n_contextual_features': n_contextual_features,
+            'lstm_units': lstm_units,
+            'transformer_heads': transformer_heads,
+            'transformer_layers': transformer_layers,
+            'cnn_filters': cnn_filters,
+            'dropout_rate': dropout_rate,
+            'learning_rate': learning_rate,
+        }
         self.model = self._build_hybrid_model(
             lstm_units, transformer_heads, transformer_layers,
             cnn_filters, dropout_rate, learning_rate
         )
+        # Set by compile_for_serving(); predictions fall back to Model.predict
+        self._predictor = None
 
     def _build_hybrid_model(
         self,
@@ -173,7 +191,42 @@ class EnhancedPowerPredictionModel:
     ):
         """Train with early stopping and learning rate scheduling"""
         
-        callbacks = [
+        history = self.model.fit(
+            {'power_input': X_power, 'context_input': X_context},
+            {'1h_prediction': y_1h, '6h_prediction': y_6h, '24h_prediction': y_24h},
+            validation_data=validation_data,
+            epochs=epochs,
+            batch_size=batch_size,
+            callbacks=self._training_callbacks(patience),
+            verbose=1
+        )
+        
+        return history
+
+    def train_with_datasets(
+        self,
+        train_dataset: tf.data.Dataset,
+        val_dataset: tf.data.Dataset,
+        epochs: int = 100,
+        patience: int = 15,
+    ):
+        """
+        Train from batched tf.data pipelines (see utils.enhanced_dataset)
+        instead of fully materialized window arrays
+        """
+        history = self.model.fit(
+            train_dataset,
+            validation_data=val_dataset,
+            epochs=epochs,
+            callbacks=self._training_callbacks(patience),
+            verbose=1
+        )
+        
+        return history
+
+    def _training_callbacks(self, patience: int) -> List[tf.keras.callbacks.Callback]:
+        """Early stopping, learning rate scheduling and best-model checkpointing"""
+        return [
             tf.keras.callbacks.EarlyStopping(
                 monitor='val_loss',
                 patience=patience,
@@ -191,22 +244,21 @@ class EnhancedPowerPredictionModel:
                 save_best_only=True
             )
         ]
-        
-        history = self.model.fit(
-            {'power_input': X_power, 'context_input': X_context},
-            {'1h_prediction': y_1h, '6h_prediction': y_6h, '24h_prediction': y_24h},
-            validation_data=validation_data,
-            epochs=epochs,
-            batch_size=batch_size,
-            callbacks=callbacks,
-            verbose=1
-        )
-        
-        return history
+
+    def compile_for_serving(self, max_batch_size: int = 64, jit_compile: bool = False):
+        """
+        Trace the compiled serving function once; predict_multi_horizon()
+        uses it from then on. Call again after replacing self.model.
+        """
+        self._predictor = CompiledPredictor(self.model, max_batch_size, jit_compile)
 
     def predict_multi_horizon(self, X_power: np.ndarray, X_context: np.ndarray) -> Dict[str, np.ndarray]:
         """Make predictions for multiple time horizons"""
-        predictions = self.model.predict({'power_input': X_power, 'context_input': X_context})
+        inputs = {'power_input': X_power, 'context_input': X_context}
+        if self._predictor is not None:
+            predictions = self._predictor(inputs)
+        else:
+            predictions = self.model.predict(inputs)
         
         return {
             '1h': predictions[0],
@@ -0,0 +1,95 @@
+import json
+import threading
+from typing import Any, Dict, List, Optional, Union
+import numpy as np
+
+# Deliberately no TensorFlow import: this module is the serving side of
+# models exported by tflite_export and runs on tflite-runtime alone.
+
+def _default_interpreter_class():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        # Last resort: works, but brings back the full TensorFlow import
+        from tensorflow.lite import Interpreter
+        return Interpreter
+    except ImportError:
+        raise ImportError('Serving TFLite models requires tflite-runtime (pip install tflite-runtime)')
+
+def metadata_path(path: str) -> str:
+    return f'{path}.json'
+
+class LiteModel:
+    """
+    CPU inference for an exported .tflite model without TensorFlow.
+
+    Inputs and outputs are addressed by the Keras input/output names saved
+    next to the model (<model>.tflite.json), so predict() behaves like
+    Model.predict: one array for single-output models, a list in Keras
+    output order otherwise. Input tensors are only resized and
+    reallocated when the batch shape changes.
+    """
+
+    def __init__(self, path: str, num_threads: Optional[int] = None, interpreter_class=None):
+        self.path = path
+        with open(metadata_path(path), 'r') as f:
+            self.metadata = json.load(f)
+        interpreter_class = interpreter_class or _default_interpreter_class()
+        self.interpreter = interpreter_class(model_path=path, num_threads=num_threads)
+
+        runner = self.interpreter.get_signature_runner()
+        input_details = runner.get_input_details()
+        output_details = runner.get_output_details()
+        self.input_names: List[str] = self.metadata['input_names']
+        self.output_names: List[str] = self.metadata['output_names']
+        self._input_index = {name: input_details[name]['index'] for name in self.input_names}
+        self._output_index = [output_details[name]['index'] for name in self.output_names]
+        self._shapes: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.interpreter.allocate_tensors()
+
+    @property
+    def sequence_length(self) -> Optional[int]:
+        return self.metadata.get('sequence_length')
+
+    @property
+    def model_type(self) -> Optional[str]:
+        return self.metadata.get('model_type')
+
+    def predict(self, inputs: Union[np.ndarray, Dict[str, np.ndarray]]) -> Any:
+        if not isinstance(inputs, dict):
+            inputs = {self.input_names[0]: inputs}
+        arrays = {
+            name: np.ascontiguousarray(inputs[name], dtype=np.float32)
+            for name in self.input_names
+        }
+
+        with self._lock:
+            resized = False
+            for name, array in arrays.items():
+                if self._shapes.get(name) != array.shape:
+                    self.interpreter.resize_tensor_input(self._input_index[name], array.shape)
+                    self._shapes[name] = array.shape
+                    resized = True
+            if resized:
+                self.interpreter.allocate_tensors()
+
+            for name, array in arrays.items():
+                self.interpreter.set_tensor(self._input_index[name], array)
+            self.interpreter.invoke()
+            outputs = [self.interpreter.get_tensor(index).copy() for index in self._output_index]
+
+        return outputs[0] if len(outputs) == 1 else outputs
+
+    def predict_multi_horizon(self, X_power: np.ndarray, X_context: np.ndarray) -> Dict[str, np.ndarray]:
+        """Same result layout as EnhancedPowerPredictionModel.predict_multi_horizon"""
+        outputs = self.predict({'power_input': X_power, 'context_input': X_context})
+        return {name.replace('_prediction', ''): output for name, output in zip(self.output_names, outputs)}
@@ -0,0 +1,188 @@
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence
+import joblib
+import numpy as np
+
+BUNDLE_FORMAT = 'powerflick-model-bundle'
+BUNDLE_FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+SCALERS_FILE = 'scalers.joblib'
+WEIGHTS_DIR = 'weights'
+
+def _model_class(model_type: str):
+    # Imported on demand: reading a manifest or the scalers needs no TensorFlow
+    if model_type == 'lstm':
+        from .power_prediction_model import PowerPredictionModel
+        return PowerPredictionModel
+    if model_type == 'enhanced_hybrid':
+        from .enhanced_power_prediction_model import EnhancedPowerPredictionModel
+        return EnhancedPowerPredictionModel
+    raise ValueError(f'Unknown model type in bundle: {model_type}')
+
+def _version_dirs(root: str) -> List[str]:
+    if not os.path.isdir(root):
+        return []
+    return sorted(
+        name for name in os.listdir(root)
+        if name.startswith('v') and name[1:].isdigit()
+        and os.path.exists(os.path.join(root, name, MANIFEST_FILE))
+    )
+
+def latest_bundle_path(root: str) -> Optional[str]:
+    """Newest complete version under root, or None"""
+    versions = _version_dirs(root)
+    return os.path.join(root, versions[-1]) if versions else None
+
+def save_bundle(
+    root: str,
+    model: Any,
+    scalers: Dict[str, Any],
+    feature_columns: Sequence[str],
+    context_features: Optional[Sequence[str]] = None,
+    training_stats: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Write a model and everything needed to serve it as the next version
+    under root (root/v0001, root/v0002, ...). Returns the version directory.
+
+    - manifest.json: model type and constructor config, sequence length,
+      ordered feature lists, weight shapes and training statistics
+    - weights/NNN.npy: one raw array per Keras weight, memory-mappable
+    - scalers.joblib: the fitted scalers by name
+
+    The version is written to a temporary directory and renamed into place,
+    so readers never see a partial bundle.
+    """
+    os.makedirs(root, exist_ok=True)
+    versions = _version_dirs(root)
+    number = int(versions[-1][1:]) + 1 if versions else 1
+    path = os.path.join(root, f'v{number:04d}')
+    tmp_path = f'{path}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_path, WEIGHTS_DIR))
+
+    weights = []
+    for i, array in enumerate(model.model.get_weights()):
+        file_name = f'{i:03d}.npy'
+        np.save(os.path.join(tmp_path, WEIGHTS_DIR, file_name), np.ascontiguousarray(array))
+        weights.append({'file': file_name, 'shape': list(array.shape), 'dtype': str(array.dtype)})
+
+    joblib.dump(scalers, os.path.join(tmp_path, SCALERS_FILE))
+
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'format_version': BUNDLE_FORMAT_VERSION,
+        'version': number,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'model_type': model.model_type,
+        'model_config': model.config,
+        'sequence_length': model.sequence_length,
+        'feature_columns': list(feature_columns),
+        'context_features': list(context_features) if context_features is not None else None,
+        'scalers': sorted(scalers),
+        'weights': weights,
+        'training_stats': training_stats or {},
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+    os.replace(tmp_path, path)
+    return path
+
+class ModelBundle:
+    """
+    Lazily loaded model bundle.
+
+    Opening a bundle only reads the manifest. Scalers, weights and the
+    Keras model are loaded on first access; weights are memory-mapped, so
+    only the pages Keras copies into its variables are ever read.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE), 'r') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != BUNDLE_FORMAT:
+            raise ValueError(f'Not a model bundle: {path}')
+        if self.manifest.get('format_version', 0) > BUNDLE_FORMAT_VERSION:
+            raise ValueError(
+                f"Bundle format version {self.manifest['format_version']} is newer "
+                f'than the supported version {BUNDLE_FORMAT_VERSION}'
+            )
+        self._scalers = None
+        self._weights = None
+        self._model = None
+
+    @property
+    def model_type(self) -> str:
+        return self.manifest['model_type']
+
+    @property
+    def sequence_length(self) -> int:
+        return self.manifest['sequence_length']
+
+    @property
+    def feature_columns(self) -> List[str]:
+        return self.manifest['feature_columns']
+
+    @property
+    def context_features(self) -> Optional[List[str]]:
+        return self.manifest['context_features']
+
+    @property
+    def training_stats(self) -> Dict[str, Any]:
+        return self.manifest['training_stats']
+
+    @property
+    def scalers(self) -> Dict[str, Any]:
+        if self._scalers is None:
+            self._scalers = joblib.load(os.path.join(self.path, SCALERS_FILE))
+        return self._scalers
+
+    @property
+    def weights(self) -> List[np.ndarray]:
+        if self._weights is None:
+            self._weights = [
+                np.load(os.path.join(self.path, WEIGHTS_DIR, weight['file']), mmap_mode='r')
+                for weight in self.manifest['weights']
+            ]
+        return self._weights
+
+    @property
+    def model(self):
+        """The model wrapper, built from the stored config with the stored weights"""
+        if self._model is None:
+            model = _model_class(self.model_type)(**self.manifest['model_config'])
+            model.model.set_weights(self.weights)
+            self._model = model
+        return self._model
+
+    def preprocessor(self):
+        """A preprocessor holding the fitted scalers, ready to serve without refitting"""
+        if self.model_type == 'lstm':
+            from ..utils.data_preprocessor import PowerDataPreprocessor
+            preprocessor = PowerDataPreprocessor()
+            preprocessor.scaler = self.scalers['scaler']
+            return preprocessor
+
+        from ..utils.enhanced_data_preprocessor import EnhancedDataPreprocessor
+        preprocessor = EnhancedDataPreprocessor()
+        if self.context_features != preprocessor.context_features:
+            raise ValueError('Bundle context features do not match the current feature builder')
+        preprocessor.power_scaler = self.scalers['power_scaler']
+        preprocessor.context_scaler = self.scalers['context_scaler']
+        return preprocessor
+
+def load_bundle(path: str) -> ModelBundle:
+    """
+    Open a bundle version directory, or the latest version under a bundle root.
+    """
+    if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        latest = latest_bundle_path(path)
+        if latest is None:
+            raise FileNotFoundError(f'No model bundle found in {path}')
+        path = latest
+    return ModelBundle(path)
@@ -5,7 +5,11 @@ from tensorflow.keras.optimizers import Adam
 import numpy as np
 from typing import Tuple, List
 
+from .compiled_inference import CompiledPredictor
+
 class PowerPredictionModel:
+    model_type = 'lstm'
+
     def __init__(
         self,
         sequence_length: int = 24,
@@ -16,7 +20,17 @@ class PowerPredictionModel:
     ):
         self.sequence_length = sequence_length
         self.n_features = n_features
+        # Constructor arguments, stored so a model bundle can rebuild the graph
+        self.config = {
+            'sequence_length': sequence_length,
+            'n_features': n_features,
+            'lstm_units': lstm_units,
+            'dropout_rate': dropout_rate,
+            'learning_rate': learning_rate,
+        }
         self.model = self._build_model(lstm_units, dropout_rate, learning_rate)
+        # Set by compile_for_serving(); predict() falls back to Model.predict
+        self._predictor = None
 
     def _build_model(
         self,
@@ -74,7 +88,16 @@ class PowerPredictionModel:
 
         return history
 
+    def compile_for_serving(self, max_batch_size: int = 64, jit_compile: bool = False):
+        """
+        Trace the compiled serving function once; predict() uses it from
+        then on. Call again after replacing self.model (e.g. load()).
+        """
+        self._predictor = CompiledPredictor(self.model, max_batch_size, jit_compile)
+
     def predict(self, X: np.ndarray) -> np.ndarray:
+        if self._predictor is not None:
+            return self._predictor(X)
         return self.model.predict(X)
 
     def evaluate(
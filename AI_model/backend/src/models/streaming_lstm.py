@@ -0,0 +1,304 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+# NumPy only: stepping a small LSTM one reading at a time is cheaper without
+# any framework dispatch, and the weights are read once from the Keras model.
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+def _hard_sigmoid(x: np.ndarray) -> np.ndarray:
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+
+_ACTIVATIONS = {
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': _hard_sigmoid,
+    'linear': lambda x: x,
+}
+
+def _activation(name: str):
+    if name not in _ACTIVATIONS:
+        raise ValueError(f'Unsupported activation for streaming inference: {name}')
+    return _ACTIVATIONS[name]
+
+class StreamingLSTM:
+    """
+    Step-at-a-time inference for the stacked LSTM of PowerPredictionModel.
+
+    The state is a list of (h, c) arrays, one pair per LSTM layer, each of
+    shape (batch, units). step() consumes one reading per row and returns
+    the model output for it (the next scaled value) with the new state;
+    states are never modified in place, so a cached state can be rolled
+    out any number of times.
+
+    Run over a window from initial_state(), the last output equals the
+    windowed model's prediction for that window. Stepped further, the
+    state keeps history beyond sequence_length, which the model never saw
+    in training; callers re-warm from a window now and then (see
+    DeviceLSTMStates).
+    """
+
+    def __init__(self, lstm_layers: List[Dict], dense_layers: List[Dict], n_features: int):
+        self.lstm_layers = lstm_layers
+        self.dense_layers = dense_layers
+        self.n_features = n_features
+
+    @classmethod
+    def from_keras(cls, model: Any) -> 'StreamingLSTM':
+        """
+        Read the weights of a Sequential LSTM stack followed by Dense layers
+        (a PowerPredictionModel or its Keras model); Dropout is skipped
+        """
+        keras_model = getattr(model, 'model', model)
+        lstm_layers, dense_layers = [], []
+        for layer in keras_model.layers:
+            kind = type(layer).__name__
+            config = layer.get_config()
+            if kind == 'Dropout':
+                continue
+            if kind == 'LSTM':
+                if dense_layers:
+                    raise ValueError('LSTM layers after Dense layers are not supported')
+                if config.get('go_backwards') or not config.get('use_bias', True):
+                    raise ValueError(f'Unsupported LSTM configuration in layer {layer.name}')
+                kernel, recurrent_kernel, bias = layer.get_weights()
+                lstm_layers.append({
+                    'kernel': kernel.astype(np.float32),
+                    'recurrent_kernel': recurrent_kernel.astype(np.float32),
+                    'bias': bias.astype(np.float32),
+                    'units': config['units'],
+                    'activation': _activation(config['activation']),
+                    'recurrent_activation': _activation(config['recurrent_activation']),
+                })
+            elif kind == 'Dense':
+                weights = layer.get_weights()
+                dense_layers.append({
+                    'kernel': weights[0].astype(np.float32),
+                    'bias': weights[1].astype(np.float32) if len(weights) > 1 else None,
+                    'activation': _activation(config['activation']),
+                })
+            else:
+                raise ValueError(f'Unsupported layer for streaming inference: {kind}')
+
+        if not lstm_layers:
+            raise ValueError('Model has no LSTM layer')
+        return cls(lstm_layers, dense_layers, lstm_layers[0]['kernel'].shape[0])
+
+    def initial_state(self, batch_size: int = 1) -> List[Tuple[np.ndarray, np.ndarray]]:
+        return [
+            (np.zeros((batch_size, layer['units']), dtype=np.float32),
+             np.zeros((batch_size, layer['units']), dtype=np.float32))
+            for layer in self.lstm_layers
+        ]
+
+    def step(
+        self,
+        x: np.ndarray,
+        state: List[Tuple[np.ndarray, np.ndarray]],
+    ) -> Tuple[np.ndarray, List[Tuple[np.ndarray, np.ndarray]]]:
+        """
+        One time step: x is (batch, n_features); returns ((batch, outputs), new state)
+        """
+        output = np.asarray(x, dtype=np.float32)
+        new_state = []
+        for layer, (h, c) in zip(self.lstm_layers, state):
+            # Keras gate order: input, forget, candidate, output
+            z = output @ layer['kernel'] + h @ layer['recurrent_kernel'] + layer['bias']
+            i, f, g, o = np.split(z, 4, axis=-1)
+            recurrent, activation = layer['recurrent_activation'], layer['activation']
+            c = recurrent(f) * c + recurrent(i) * activation(g)
+            h = recurrent(o) * activation(c)
+            new_state.append((h, c))
+            output = h
+        for layer in self.dense_layers:
+            output = output @ layer['kernel']
+            if layer['bias'] is not None:
+                output = output + layer['bias']
+            output = layer['activation'](output)
+        return output, new_state
+
+    def run(
+        self,
+        X: np.ndarray,
+        state: Optional[List[Tuple[np.ndarray, np.ndarray]]] = None,
+    ) -> Tuple[np.ndarray, List[Tuple[np.ndarray, np.ndarray]]]:
+        """
+        Step through X (batch, steps, n_features); returns the output of the
+        last step and the final state
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if state is None:
+            state = self.initial_state(len(X))
+        output = None
+        for t in range(X.shape[1]):
+            output, state = self.step(X[:, t], state)
+        return output, state
+
+    def rollout(
+        self,
+        next_output: np.ndarray,
+        state: List[Tuple[np.ndarray, np.ndarray]],
+        horizon: int,
+    ) -> np.ndarray:
+        """
+        Autoregressive forecast: next_output is the prediction made after the
+        last reading and each prediction is fed back as the next reading.
+        Returns (batch, horizon); needs a single-feature (power only) model.
+        """
+        if self.n_features != 1:
+            raise ValueError('Autoregressive rollout needs a model with one input feature')
+        predictions = np.empty((len(next_output), horizon), dtype=np.float32)
+        output = next_output
+        for k in range(horizon):
+            predictions[:, k] = output[:, 0]
+            if k + 1 < horizon:
+                output, state = self.step(output[:, :1], state)
+        return predictions
+
+class DeviceLSTMStates:
+    """
+    Per-device LSTM state, advanced by one step per completed bucket.
+
+    update() takes the recent (gap-free, scaled) history of a device and
+    steps the cached state over the completed buckets newer than the last
+    one it consumed. Buckets from completed_before on (the current hour,
+    whose mean still changes as readings arrive) are stepped on top of a
+    copy of that state, again on every update, and only the forecast uses
+    them. The state is (re)warmed from the last window_length completed
+    buckets when the device is new, after a gap longer than max_gap_ns,
+    or every rewarm_steps steps so it does not drift from what the model
+    was trained on. Least recently used devices are evicted beyond
+    max_devices.
+    """
+
+    def __init__(
+        self,
+        model: StreamingLSTM,
+        window_length: int,
+        max_gap_ns: int,
+        rewarm_steps: Optional[int] = None,
+        max_devices: int = 10000,
+    ):
+        self.model = model
+        self.window_length = window_length
+        self.max_gap_ns = max_gap_ns
+        self.rewarm_steps = rewarm_steps
+        self.max_devices = max_devices
+        # device_id -> (last timestamp ns, state, next output, steps since warm-up)
+        self._states: 'OrderedDict[str, Tuple[int, List, np.ndarray, int]]' = OrderedDict()
+        # device_id -> (state, next output) after the still open buckets
+        self._open: Dict[str, Tuple[List, np.ndarray]] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'updates': 0,
+            'warmups': 0,
+            'steps': 0,
+            'open_steps': 0,
+            'forecasts': 0,
+            'evicted': 0,
+        }
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._states
+
+    def update(
+        self,
+        device_id: str,
+        timestamps_ns: np.ndarray,
+        values: np.ndarray,
+        completed_before: Optional[int] = None,
+    ) -> int:
+        """
+        Consume the readings of a device (sorted by time, values scaled and
+        shaped (n, n_features)); rows at or after completed_before (ns) are
+        open buckets that are not committed to the state. Returns the
+        number of recurrent steps run.
+        """
+        if len(timestamps_ns) == 0:
+            raise ValueError('No readings to update the model state with')
+        timestamps_ns = np.asarray(timestamps_ns)
+        values = np.asarray(values, dtype=np.float32).reshape(len(timestamps_ns), -1)
+        n_completed = len(timestamps_ns) if completed_before is None \
+            else int(np.searchsorted(timestamps_ns, completed_before, side='left'))
+
+        with self._lock:
+            self._stats['updates'] += 1
+            steps = self._commit(device_id, timestamps_ns[:n_completed], values[:n_completed])
+
+            self._open.pop(device_id, None)
+            open_values = values[n_completed:]
+            if len(open_values):
+                _, state, output, _ = self._states[device_id]
+                for x in open_values:
+                    output, state = self.model.step(x[None, :], state)
+                self._open[device_id] = (state, output)
+                self._stats['open_steps'] += len(open_values)
+                steps += len(open_values)
+            return steps
+
+    def _commit(self, device_id: str, timestamps_ns: np.ndarray, values: np.ndarray) -> int:
+        """Step the cached state over new completed buckets; holds the lock"""
+        cached = self._states.get(device_id)
+        if cached is not None:
+            self._states.move_to_end(device_id)
+            last_ns, state, output, steps = cached
+            new = timestamps_ns > last_ns
+            n_new = int(new.sum())
+            if n_new == 0:
+                return 0
+            first = int(np.argmax(new))
+            fresh = (
+                timestamps_ns[first] - last_ns <= self.max_gap_ns
+                and np.all(np.diff(timestamps_ns[first:]) <= self.max_gap_ns)
+                and (self.rewarm_steps is None or steps + n_new <= self.rewarm_steps)
+            )
+            if fresh:
+                for x in values[first:]:
+                    output, state = self.model.step(x[None, :], state)
+                self._states[device_id] = (int(timestamps_ns[-1]), state, output, steps + n_new)
+                self._stats['steps'] += n_new
+                return n_new
+
+        if len(values) < self.window_length:
+            raise ValueError(
+                f'Not enough completed data points. Need at least {self.window_length}, '
+                f'but got {len(values)}'
+            )
+        output, state = self.model.run(values[None, -self.window_length:])
+        self._states[device_id] = (int(timestamps_ns[-1]), state, output, 0)
+        self._states.move_to_end(device_id)
+        self._stats['warmups'] += 1
+        self._stats['steps'] += self.window_length
+        while len(self._states) > self.max_devices:
+            evicted, _ = self._states.popitem(last=False)
+            self._open.pop(evicted, None)
+            self._stats['evicted'] += 1
+        return self.window_length
+
+    def forecast(self, device_id: str, horizon: int) -> np.ndarray:
+        """Scaled autoregressive forecast (horizon,) from the cached state"""
+        with self._lock:
+            cached = self._states.get(device_id)
+            if cached is None:
+                raise ValueError(f'No model state for device {device_id}')
+            _, state, output, _ = cached
+            state, output = self._open.get(device_id, (state, output))
+            self._stats['forecasts'] += 1
+        return self.model.rollout(output, state, horizon)[0]
+
+    def reset(self, device_id: Optional[str] = None):
+        """Drop the state of one device, or of all devices (e.g. after retraining)"""
+        with self._lock:
+            if device_id is None:
+                self._states.clear()
+                self._open.clear()
+            else:
+                self._states.pop(device_id, None)
+                self._open.pop(device_id, None)
+
+    def stats(self) -> Dict:
+        return {**self._stats, 'devices': len(self._states), 'max_devices': self.max_devices}
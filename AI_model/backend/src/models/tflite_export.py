@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from .lite_runtime import LiteModel, metadata_path
+
+QUANTIZATION_MODES = (None, 'dynamic', 'float16', 'int8')
+
+def _as_list(outputs: Any) -> List[np.ndarray]:
+    return [np.asarray(output) for output in outputs] if isinstance(outputs, (list, tuple)) else [np.asarray(outputs)]
+
+def _keras_model(model: Any) -> tf.keras.Model:
+    """The Keras model of a PowerPredictionModel-style wrapper, or model itself"""
+    return model if isinstance(model, tf.keras.Model) else model.model
+
+def _representative_dataset(inputs: Dict[str, np.ndarray]):
+    def generate() -> Iterator[Dict[str, np.ndarray]]:
+        n = len(next(iter(inputs.values())))
+        for i in range(n):
+            yield {name: value[i:i + 1].astype(np.float32) for name, value in inputs.items()}
+    return generate
+
+def export_tflite(
+    model: Any,
+    path: str,
+    quantization: Optional[str] = None,
+    calibration_inputs: Optional[Dict[str, np.ndarray]] = None,
+    evaluation_inputs: Optional[Dict[str, np.ndarray]] = None,
+) -> Dict:
+    """
+    Convert a PowerPredictionModel or EnhancedPowerPredictionModel (or a
+    plain Keras model) to TFLite.
+
+    quantization:
+    - None: float32
+    - 'dynamic': int8 weights, float activations
+    - 'float16': float16 weights
+    - 'int8': int8 weights and activations, calibrated on calibration_inputs
+      (inputs and outputs stay float32; ops without an int8 kernel stay float)
+
+    Writes <path> and <path>.json (input/output names for LiteModel). If
+    evaluation (or calibration) inputs are given, the accuracy and latency
+    delta against the Keras model is written to <path>.report.json and
+    returned.
+    """
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f'Unknown quantization: {quantization}')
+    if quantization == 'int8' and not calibration_inputs:
+        raise ValueError('int8 quantization needs calibration inputs')
+
+    keras_model = _keras_model(model)
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if quantization is not None:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        converter.representative_dataset = _representative_dataset(calibration_inputs)
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
+            tf.lite.OpsSet.TFLITE_BUILTINS,
+        ]
+    flatbuffer = converter.convert()
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(flatbuffer)
+
+    # Signature keys are the Keras input/output names; keep Keras output order
+    signature = tf.lite.Interpreter(model_content=flatbuffer).get_signature_list()['serving_default']
+    output_names = [name for name in keras_model.output_names if name in signature['outputs']] \
+        or list(signature['outputs'])
+    metadata = {
+        'model_type': getattr(model, 'model_type', None),
+        'sequence_length': getattr(model, 'sequence_length', None) or keras_model.inputs[0].shape[1],
+        'input_names': list(keras_model.input_names),
+        'output_names': output_names,
+        'quantization': quantization or 'float32',
+    }
+    with open(metadata_path(path), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    inputs = evaluation_inputs or calibration_inputs
+    if not inputs:
+        return {'path': path, 'size_bytes': len(flatbuffer), **metadata}
+
+    report = accuracy_report(model, path, inputs)
+    with open(f'{path}.report.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+def accuracy_report(model: Any, path: str, inputs: Dict[str, np.ndarray], timing_runs: int = 50) -> Dict:
+    """
+    Output deltas and single-window latency of an exported model against
+    the Keras original, on the same (scaled) input windows
+    """
+    keras_model = _keras_model(model)
+    lite_model = LiteModel(path, interpreter_class=tf.lite.Interpreter)
+    ordered = [inputs[name] for name in keras_model.input_names]
+    expected = _as_list(keras_model.predict(ordered if len(ordered) > 1 else ordered[0], verbose=0))
+    actual = _as_list(lite_model.predict(inputs))
+
+    outputs = {}
+    for name, reference, output in zip(lite_model.output_names, expected, actual):
+        delta = output.astype(np.float64) - reference.astype(np.float64)
+        scale = float(np.mean(np.abs(reference))) or 1.0
+        outputs[name] = {
+            'mae_delta': float(np.mean(np.abs(delta))),
+            'max_abs_delta': float(np.max(np.abs(delta))),
+            'rmse_delta': float(np.sqrt(np.mean(delta ** 2))),
+            'relative_mae_delta': float(np.mean(np.abs(delta)) / scale),
+        }
+
+    single = {name: value[:1] for name, value in inputs.items()}
+    single_ordered = [single[name] for name in keras_model.input_names]
+    keras_input = single_ordered if len(single_ordered) > 1 else single_ordered[0]
+
+    def latency_ms(call) -> float:
+        call()
+        started = time.perf_counter()
+        for _ in range(timing_runs):
+            call()
+        return 1000 * (time.perf_counter() - started) / timing_runs
+
+    keras_bytes = sum(weight.size * weight.dtype.itemsize for weight in keras_model.get_weights())
+    return {
+        'path': path,
+        'quantization': lite_model.metadata['quantization'],
+        'samples': len(next(iter(inputs.values()))),
+        'size_bytes': os.path.getsize(path),
+        'keras_weights_bytes': int(keras_bytes),
+        'outputs': outputs,
+        'latency_ms': {
+            'keras_predict': latency_ms(lambda: keras_model.predict(keras_input, verbose=0)),
+            'keras_call': latency_ms(lambda: keras_model(keras_input, training=False)),
+            'tflite': latency_ms(lambda: lite_model.predict(single)),
+        },
+    }
+
+def windows_from_csv(bundle: Any, csv_path: str, limit: int = 500) -> Dict[str, np.ndarray]:
+    """
+    Scaled model input windows from a CSV of readings (timestamp,
+    power_watts), using the bundle's fitted scalers; at most `limit`
+    windows spread evenly over the file
+    """
+    from ..utils.data_preprocessor import sliding_windows
+
+    df = pd.read_csv(csv_path, parse_dates=['timestamp'])
+    preprocessor = bundle.preprocessor()
+    model = bundle.model
+    if bundle.model_type == 'lstm':
+        X, _ = preprocessor.prepare_sequences(
+            df, bundle.sequence_length, fit=False, as_view=True, dtype=np.float32
+        )
+        windows = {model.model.input_names[0]: X}
+    else:
+        power, context, n_windows = preprocessor.prepare_enhanced_base(df, bundle.sequence_length, fit=False)
+        windows = {
+            'power_input': sliding_windows(power, bundle.sequence_length)[:n_windows],
+            'context_input': sliding_windows(context, bundle.sequence_length)[:n_windows],
+        }
+
+    n = len(next(iter(windows.values())))
+    if n == 0:
+        raise ValueError(f'Not enough rows in {csv_path} for one window')
+    index = np.unique(np.linspace(0, n - 1, min(limit, n)).astype(int))
+    return {name: np.ascontiguousarray(value[index]) for name, value in windows.items()}
+
+def main():
+    parser = argparse.ArgumentParser(description='Export a model bundle or Keras file to TFLite')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--bundle', help='Bundle version directory or bundle root (latest version)')
+    source.add_argument('--keras', help='Keras .h5 model (no scalers, so no --csv or int8)')
+    parser.add_argument('--out', required=True, help='Output .tflite path')
+    parser.add_argument('--quantize', choices=['dynamic', 'float16', 'int8'], default=None,
+                        help='Post-training quantization (int8 is calibrated on --csv windows)')
+    parser.add_argument('--csv', help='Readings (timestamp, power_watts) for calibration and the accuracy report')
+    parser.add_argument('--samples', type=int, default=500, help='Maximum windows taken from the CSV')
+    args = parser.parse_args()
+
+    if args.keras:
+        if args.csv:
+            parser.error('--csv needs the fitted scalers of a --bundle')
+        model = tf.keras.models.load_model(args.keras, compile=False)
+        report = export_tflite(model, args.out, args.quantize)
+    else:
+        from .model_bundle import load_bundle
+
+        bundle = load_bundle(args.bundle)
+        windows = windows_from_csv(bundle, args.csv, args.samples) if args.csv else None
+        report = export_tflite(bundle.model, args.out, args.quantize, calibration_inputs=windows)
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,7 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 import logging
@@ -9,6 +9,13 @@ import logging
 from ..models.enhanced_power_prediction_model import EnhancedPowerPredictionModel
 from ..utils.enhanced_data_preprocessor import EnhancedDataPreprocessor
 from ..database.supabase_client import SupabaseClient
+from ..database.async_supabase_client import AsyncSupabaseClient
+from ..database.local_mirror import LocalPowerMirror
+from ..database.pagination import buckets_to_frame
+from ..utils.ring_buffer import DeviceRingBuffers
+from ..utils.feature_builder import WARMUP_ROWS
+from ..utils.resampler import gap_free_runs, last_gap_free_run, regularize_readings
+from .inference_scheduler import MicroBatchScheduler
 
 class EnhancedPredictionService:
     """
@@ -24,13 +31,22 @@ class EnhancedPredictionService:
         self,
         model: EnhancedPowerPredictionModel,
         preprocessor: EnhancedDataPreprocessor,
-        db_client: SupabaseClient,
-        executor: Optional[ThreadPoolExecutor] = None
+        db_client: Union[SupabaseClient, AsyncSupabaseClient, LocalPowerMirror],
+        executor: Optional[ThreadPoolExecutor] = None,
+        resolution: Optional[str] = '1h',
+        ring_buffers: Optional[DeviceRingBuffers] = None,
+        scheduler: Optional[MicroBatchScheduler] = None,
     ):
         self.model = model
         self.preprocessor = preprocessor
         self.db_client = db_client
         self.executor = executor or ThreadPoolExecutor(max_workers=4)
+        # The model steps are hourly; None fetches raw readings instead
+        self.resolution = resolution
+        # In-memory recent history; its bucket_seconds should match resolution
+        self.ring_buffers = ring_buffers
+        # Concurrent predictions share batched forward passes
+        self.scheduler = scheduler or MicroBatchScheduler(self._predict_batch, executor=self.executor)
         self.logger = logging.getLogger(__name__)
         
         # Cache for frequent predictions
@@ -51,22 +67,20 @@ class EnhancedPredictionService:
             if self._is_cache_valid(cache_key):
                 return self._prediction_cache[cache_key]
             
-            # Get recent data (1 week for context)
-            end_time = datetime.now()
-            start_time = end_time - timedelta(days=7)
+            # Get recent data (1 week for context, plus warm-up for the 24h lag features)
+            end_time = datetime.now(timezone.utc)
+            start_time = end_time - timedelta(days=9)
             
-            data = await self._get_data_async(device_id, start_time, end_time)
-            
-            if not data:
-                raise ValueError('No recent data available for prediction')
-            
-            df = pd.DataFrame(data)
+            df = await self._window_frame(device_id, start_time, end_time)
             
             # Prepare data for prediction
-            X_power, X_context = self.preprocessor.prepare_prediction_data_enhanced(df)
+            X_power, X_context = self.preprocessor.prepare_prediction_data_enhanced(df, device_id=device_id)
             
-            # Make predictions
-            predictions = self.model.predict_multi_horizon(X_power, X_context)
+            # Make predictions (batched with concurrent requests)
+            predictions = await self.scheduler.submit({
+                'power_input': X_power,
+                'context_input': X_context,
+            })
             
             # Transform back to original scale
             predictions_transformed = {}
@@ -112,6 +126,13 @@ class EnhancedPredictionService:
             self.logger.error(f"Error in multi-horizon prediction: {e}")
             raise
 
+    def _predict_batch(self, inputs: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        return self.model.predict_multi_horizon(inputs['power_input'], inputs['context_input'])
+
+    def inference_stats(self) -> Dict:
+        """Queue depth and batch-size metrics of the inference scheduler"""
+        return self.scheduler.stats()
+
     async def _detect_prediction_anomalies(
         self,
         device_id: str,
@@ -122,18 +143,16 @@ class EnhancedPredictionService:
         """
         try:
             # Get historical data for comparison
-            end_time = datetime.now()
+            end_time = datetime.now(timezone.utc)
             start_time = end_time - timedelta(days=30)
             
-            historical_data = await self._get_data_async(device_id, start_time, end_time)
+            df_historical = await self._get_frame_async(device_id, start_time, end_time, last_run=True)
             
-            if not historical_data:
+            if df_historical.empty:
                 return []
             
-            df_historical = pd.DataFrame(historical_data)
-            
             # Use the model for anomaly detection
-            X_power, X_context = self.preprocessor.prepare_prediction_data_enhanced(df_historical)
+            X_power, X_context = self.preprocessor.prepare_prediction_data_enhanced(df_historical, device_id=device_id)
             
             # Get prediction intervals and anomalies
             anomalies = self.model.detect_advanced_anomalies(
@@ -144,7 +163,7 @@ class EnhancedPredictionService:
             formatted_anomalies = []
             for anomaly in anomalies:
                 formatted_anomalies.append({
-                    'timestamp': (datetime.now() + timedelta(hours=anomaly['index'])).isoformat(),
+                    'timestamp': (datetime.now(timezone.utc) + timedelta(hours=anomaly['index'])).isoformat(),
                     'predicted_value': anomaly['predicted'],
                     'expected_range': {
                         'lower': anomaly['lower_bound'],
@@ -191,7 +210,7 @@ class EnhancedPredictionService:
                     'description': f'Power consumption expected to increase by {((pred_1h/current_power - 1) * 100):.1f}% in the next hour.',
                     'recommendation': 'Monitor device usage and check for any unusual activity.',
                     'confidence': 0.85,
-                    'timestamp': datetime.now().isoformat()
+                    'timestamp': datetime.now(timezone.utc).isoformat()
                 })
             
             # 2. Peak load analysis
@@ -206,7 +225,7 @@ class EnhancedPredictionService:
                     'description': f'Peak consumption of {peak_6h:.1f}W expected in {peak_time} hours.',
                     'recommendation': 'Consider deferring non-essential energy usage to reduce peak load.',
                     'confidence': 0.78,
-                    'timestamp': datetime.now().isoformat()
+                    'timestamp': datetime.now(timezone.utc).isoformat()
                 })
             
             # 3. Energy efficiency insights
@@ -219,7 +238,7 @@ class EnhancedPredictionService:
                     'description': f'Tomorrow\'s consumption predicted to be {((daily_prediction/(avg_power*24) - 1) * 100):.1f}% above average.',
                     'recommendation': 'Review energy-intensive activities and optimize usage patterns.',
                     'confidence': 0.72,
-                    'timestamp': datetime.now().isoformat()
+                    'timestamp': datetime.now(timezone.utc).isoformat()
                 })
             
             # 4. Cost optimization
@@ -234,7 +253,7 @@ class EnhancedPredictionService:
                     'description': f'Predicted daily cost: ${predicted_cost:.2f}',
                     'recommendation': 'Consider using energy-efficient settings or timing usage during off-peak hours.',
                     'confidence': 0.80,
-                    'timestamp': datetime.now().isoformat()
+                    'timestamp': datetime.now(timezone.utc).isoformat()
                 })
             
             # 5. Pattern recognition insights
@@ -248,7 +267,7 @@ class EnhancedPredictionService:
                     'description': 'AI detected an unusual consumption pattern in the next 24 hours.',
                     'recommendation': 'Review scheduled activities and device operations.',
                     'confidence': 0.65,
-                    'timestamp': datetime.now().isoformat()
+                    'timestamp': datetime.now(timezone.utc).isoformat()
                 })
             
             return insights
@@ -265,17 +284,15 @@ class EnhancedPredictionService:
         Get explainable AI insights for predictions
         """
         try:
-            # Get recent data
-            end_time = datetime.now()
-            start_time = end_time - timedelta(days=7)
+            # Get recent data (1 week plus warm-up for the 24h lag features)
+            end_time = datetime.now(timezone.utc)
+            start_time = end_time - timedelta(days=9)
             
-            data = await self._get_data_async(device_id, start_time, end_time)
+            df = await self._get_frame_async(device_id, start_time, end_time, last_run=True)
             
-            if not data:
+            if df.empty:
                 return {'error': 'No data available for explanation'}
-            
-            df = pd.DataFrame(data)
-            X_power, X_context = self.preprocessor.prepare_prediction_data_enhanced(df)
+            X_power, X_context = self.preprocessor.prepare_prediction_data_enhanced(df, device_id=device_id)
             
             # Get explanation from model
             explanation = self.model.explain_prediction(X_power, X_context)
@@ -288,7 +305,7 @@ class EnhancedPredictionService:
                     'contextual_factors': explanation['context_importance']
                 },
                 'explanation_text': self._generate_explanation_text(explanation),
-                'timestamp': datetime.now().isoformat()
+                'timestamp': datetime.now(timezone.utc).isoformat()
             }
             
             return formatted_explanation
@@ -359,7 +376,7 @@ class EnhancedPredictionService:
                 
                 optimization_schedule.append({
                     'appliance': appliance['name'],
-                    'recommended_start_time': (datetime.now() + timedelta(hours=best_start_hour)).isoformat(),
+                    'recommended_start_time': (datetime.now(timezone.utc) + timedelta(hours=best_start_hour)).isoformat(),
                     'duration_hours': duration,
                     'expected_power': power_needed,
                     'estimated_cost_savings': self._calculate_cost_savings(
@@ -371,7 +388,7 @@ class EnhancedPredictionService:
                 'schedule': optimization_schedule,
                 'total_estimated_savings': sum(s['estimated_cost_savings'] for s in optimization_schedule),
                 'optimization_confidence': 0.75,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': datetime.now(timezone.utc).isoformat()
             }
             
         except Exception as e:
@@ -427,18 +444,28 @@ class EnhancedPredictionService:
         """
         try:
             # Get recent data
-            end_time = datetime.now()
+            end_time = datetime.now(timezone.utc)
             start_time = end_time - timedelta(days=30)
             
-            data = await self._get_data_async(device_id, start_time, end_time)
+            df = await self._get_frame_async(device_id, start_time, end_time)
             
-            if not data:
+            if df.empty:
                 return {'error': 'No data available for metrics'}
             
-            df = pd.DataFrame(data)
-            
-            # Prepare data for evaluation
-            X_power, X_context, y_1h, y_6h, y_24h = self.preprocessor.prepare_enhanced_sequences(df)
+            # Windows and lag features must not span a gap, so build them per
+            # gap-free run with the scalers fitted in training
+            # (a run needs more rows than warm-up, window and 24h targets to yield one)
+            sequence_length = self.model.sequence_length
+            shortest = WARMUP_ROWS + sequence_length + 24
+            runs = [run.reset_index(drop=True) for _, run in df.groupby('run', sort=False) if len(run) > shortest]
+            if not runs:
+                return {'error': 'Insufficient data for metrics calculation'}
+            X_power, X_context, y_1h, y_6h, y_24h = (
+                np.concatenate(parts) for parts in zip(*(
+                    self.preprocessor.prepare_enhanced_sequences(run, sequence_length=sequence_length, fit=False)
+                    for run in runs
+                ))
+            )
             
             if len(X_power) < 10:
                 return {'error': 'Insufficient data for metrics calculation'}
@@ -489,23 +516,109 @@ class EnhancedPredictionService:
                     'model_confidence': float(np.mean([a['confidence'] for a in anomalies])) if anomalies else 0.8
                 },
                 'data_quality': self.preprocessor.generate_data_quality_report(df),
-                'timestamp': datetime.now().isoformat()
+                'timestamp': datetime.now(timezone.utc).isoformat()
             }
             
         except Exception as e:
             self.logger.error(f"Error calculating advanced metrics: {e}")
             return {'error': str(e)}
 
-    async def _get_data_async(self, device_id: str, start_time: datetime, end_time: datetime) -> List[Dict]:
-        """Get data asynchronously"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(
-            self.executor,
-            self.db_client.fetch_consumption_data,
-            device_id,
-            start_time,
-            end_time
+    async def _get_frame_async(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        last_run: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Get the complete time range as a frame with only the columns the models use.
+        
+        With a resolution set, readings are aggregated server-side and one
+        row per bucket is transferred instead of every raw reading. Windows
+        covered by the ring buffers are served from memory. With last_run
+        only the readings after the last gap are returned, so a prediction
+        window never spans one.
+        """
+        if self.ring_buffers is not None and end_time - start_time <= self.ring_buffers.seed_window:
+            buffer = await self.ring_buffers.get(device_id)
+            df = buffer.to_frame(start_time)
+        else:
+            if self.resolution is not None:
+                fetch = self.db_client.fetch_consumption_buckets
+                args = (device_id, start_time, end_time, self.resolution)
+            else:
+                fetch = self.db_client.fetch_consumption_frame
+                args = (device_id, start_time, end_time)
+            
+            if isinstance(self.db_client, AsyncSupabaseClient):
+                result = await fetch(*args)
+            else:
+                # Blocking client: keep the event loop free by using the executor
+                loop = asyncio.get_event_loop()
+                result = await loop.run_in_executor(self.executor, fetch, *args)
+            
+            if self.resolution is not None:
+                # Keep the reading-shaped columns so the feature set is unchanged
+                df = buckets_to_frame(result)[['timestamp', 'power_watts', 'sample_count']]
+            else:
+                df = result
+        
+        df = self._regularize(df, last_run=last_run)
+        # Device stats features expect the column; no need to transfer it per row
+        df['device_id'] = device_id
+        if last_run:
+            self._sync_feature_states(device_id, df)
+        return df
+
+    async def _window_frame(self, device_id: str, start_time: datetime, end_time: datetime) -> pd.DataFrame:
+        """
+        The readings after the last gap, checked to fill one model window
+        once the lag features have warmed up
+        """
+        df = await self._get_frame_async(device_id, start_time, end_time, last_run=True)
+        if df.empty:
+            raise ValueError('No recent data available for prediction')
+        needed = self.model.sequence_length + WARMUP_ROWS
+        if len(df) < needed:
+            raise ValueError(
+                f'Insufficient data since the last gap. Need at least {needed} '
+                f'consecutive readings, but got {len(df)}'
+            )
+        return df
+
+    def _sync_feature_states(self, device_id: str, df: pd.DataFrame):
+        """
+        Step the device's online lag features over completed buckets that did
+        not arrive through ingestion; the still open bucket is left to ingest.
+        """
+        feature_states = self.preprocessor.feature_states
+        if feature_states is None or df.empty:
+            return
+        timestamps = pd.DatetimeIndex(pd.to_datetime(df['timestamp'], utc=True)).asi8
+        current_bucket = pd.Timestamp.now(tz='UTC').value // feature_states.step_ns * feature_states.step_ns
+        completed = timestamps < current_bucket
+        feature_states.sync(device_id, timestamps[completed], df['power_watts'].to_numpy(dtype=np.float64)[completed])
+
+    def _regularize(self, df: pd.DataFrame, last_run: bool = False) -> pd.DataFrame:
+        """
+        Put the series on the grid the 168-step window assumes (hourly by
+        default), filling missing buckets; long gaps are left out and 'run'
+        numbers the gap-free stretches between them, or with last_run only
+        the readings after the last one are kept.
+        """
+        if df.empty:
+            return df[['timestamp', 'power_watts']].copy()
+        
+        df = regularize_readings(
+            df,
+            freq=self.resolution or '1h',
+            count_col='sample_count' if 'sample_count' in df.columns else None,
         )
+        if last_run:
+            df = last_gap_free_run(df)
+            return df.loc[~df['gap'], ['timestamp', 'power_watts']].reset_index(drop=True)
+        df['run'] = gap_free_runs(df)
+        return df.loc[~df['gap'], ['timestamp', 'power_watts', 'run']].reset_index(drop=True)
 
     def _is_cache_valid(self, cache_key: str, minutes: int = 10) -> bool:
         """Check if cache is valid"""
@@ -513,16 +626,16 @@ class EnhancedPredictionService:
             return False
         
         expiry_time = self._cache_expiry[cache_key]
-        return datetime.now() < expiry_time
+        return datetime.now(timezone.utc) < expiry_time
 
     def _cache_result(self, cache_key: str, result: Dict, minutes: int = 10):
         """Cache result with expiry"""
         self._prediction_cache[cache_key] = result
-        self._cache_expiry[cache_key] = datetime.now() + timedelta(minutes=minutes)
+        self._cache_expiry[cache_key] = datetime.now(timezone.utc) + timedelta(minutes=minutes)
 
     def cleanup_cache(self):
         """Clean up expired cache entries"""
-        current_time = datetime.now()
+        current_time = datetime.now(timezone.utc)
         expired_keys = [
             key for key, expiry in self._cache_expiry.items()
             if current_time >= expiry
@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+class InferenceQueueFullError(Exception):
+    """Raised when too many inference requests are already waiting."""
+
+class MicroBatchScheduler:
+    """
+    Micro-batching front end for one model:
+    - Concurrent requests are queued instead of calling the model directly
+    - A single worker task collects them into one batch, up to
+      max_batch_size rows or max_wait_ms after the first request
+    - The batch runs as one forward pass in the executor and each caller's
+      future gets its own rows of the output
+
+    Waiting is adaptive: a lone request with nothing else queued is run
+    immediately, so batching only costs latency when there is concurrency
+    to gain from.
+
+    Inputs are dicts of arrays with a leading batch axis; predict_fn takes
+    the concatenated dict and returns an array, a list/tuple or a dict of
+    arrays with the same leading axis. Requests whose input shapes differ
+    are run as separate passes within the batch.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[Dict[str, np.ndarray]], Any],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        max_queue_size: int = 10000,
+        executor: Optional[Executor] = None,
+    ):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.executor = executor
+        self.logger = logging.getLogger(__name__)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self._stats = {
+            'requests': 0,
+            'batches': 0,
+            'forward_passes': 0,
+            'rows': 0,
+            'errors': 0,
+            'rejected_full': 0,
+            'max_batch_size_seen': 0,
+            'queue_wait_seconds': 0.0,
+            'inference_seconds': 0.0,
+        }
+        # Batch sizes in power-of-two buckets: 1, 2, 4, ...
+        self._batch_size_histogram: Dict[int, int] = {}
+
+    async def start(self):
+        """Start the batching worker on the running event loop"""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Finish queued requests, then stop the worker"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, inputs: Dict[str, np.ndarray]) -> Any:
+        """
+        Queue one request and wait for its slice of a batched forward pass.
+        """
+        if self._task is None:
+            await self.start()
+        if self._queue.full():
+            self._stats['rejected_full'] += 1
+            raise InferenceQueueFullError('Inference queue is full, retry later')
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((inputs, future, time.monotonic()))
+        self._stats['requests'] += 1
+        return await future
+
+    def stats(self) -> Dict:
+        """Queue depth, batch size and latency counters"""
+        batches = self._stats['batches']
+        requests = self._stats['requests']
+        return {
+            **self._stats,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'max_queue_size': self.max_queue_size,
+            'mean_batch_size': self._stats['rows'] / batches if batches else 0.0,
+            'mean_queue_wait_ms': 1000 * self._stats['queue_wait_seconds'] / requests if requests else 0.0,
+            'mean_inference_ms': 1000 * self._stats['inference_seconds'] / batches if batches else 0.0,
+            'batch_size_histogram': {
+                str(bucket): count for bucket, count in sorted(self._batch_size_histogram.items())
+            },
+        }
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            try:
+                await self._execute(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _collect_batch(self) -> List[Tuple[Dict[str, np.ndarray], asyncio.Future, float]]:
+        """Wait for the first request, then gather more until size or time triggers"""
+        batch = [await self._queue.get()]
+        rows = self._rows(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while rows < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                rows += self._rows(batch[-1][0])
+                continue
+            remaining = deadline - time.monotonic()
+            if len(batch) == 1 or remaining <= 0:
+                # Nothing else is waiting: don't hold a lone request back
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                rows += self._rows(batch[-1][0])
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    @staticmethod
+    def _rows(inputs: Dict[str, np.ndarray]) -> int:
+        return len(next(iter(inputs.values())))
+
+    async def _execute(self, batch: List[Tuple[Dict[str, np.ndarray], asyncio.Future, float]]):
+        started = time.monotonic()
+        self._stats['batches'] += 1
+        self._stats['queue_wait_seconds'] += sum(started - queued for _, _, queued in batch)
+        rows = sum(self._rows(inputs) for inputs, _, _ in batch)
+        self._stats['rows'] += rows
+        self._stats['max_batch_size_seen'] = max(self._stats['max_batch_size_seen'], rows)
+        bucket = 1 << (rows - 1).bit_length()
+        self._batch_size_histogram[bucket] = self._batch_size_histogram.get(bucket, 0) + 1
+
+        # One forward pass per distinct input signature
+        groups: Dict[tuple, List] = {}
+        for item in batch:
+            signature = tuple((name, array.shape[1:]) for name, array in sorted(item[0].items()))
+            groups.setdefault(signature, []).append(item)
+
+        loop = asyncio.get_running_loop()
+        for items in groups.values():
+            live = [item for item in items if not item[1].cancelled()]
+            if not live:
+                continue
+            names = live[0][0].keys()
+            stacked = {name: np.concatenate([inputs[name] for inputs, _, _ in live]) for name in names}
+            try:
+                outputs = await loop.run_in_executor(self.executor, self.predict_fn, stacked)
+                self._stats['forward_passes'] += 1
+            except Exception as e:
+                self._stats['errors'] += 1
+                self.logger.error(f"Batched inference failed for {len(live)} requests: {e}")
+                for _, future, _ in live:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            offset = 0
+            for inputs, future, _ in live:
+                n = self._rows(inputs)
+                if not future.done():
+                    future.set_result(_slice_outputs(outputs, offset, offset + n))
+                offset += n
+
+        self._stats['inference_seconds'] += time.monotonic() - started
+
+def _slice_outputs(outputs: Any, start: int, end: int) -> Any:
+    """Rows start:end of an array, or of every array in a dict/list/tuple"""
+    if isinstance(outputs, dict):
+        return {name: value[start:end] for name, value in outputs.items()}
+    if isinstance(outputs, (list, tuple)):
+        return type(outputs)(value[start:end] for value in outputs)
+    return outputs[start:end]
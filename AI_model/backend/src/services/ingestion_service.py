@@ -0,0 +1,246 @@
+import math
+import time
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+from pydantic import BaseModel, ValidationError, validator
+
+from ..database.async_supabase_client import AsyncSupabaseClient
+from ..utils.feature_stats import DeviceFeatureStatistics
+from ..utils.online_features import DeviceFeatureStates
+from ..utils.ring_buffer import DeviceRingBuffers
+from ..utils.stream_parser import ReadingStreamParser
+from .write_behind_buffer import WriteBehindBuffer, BufferFullError
+
+class PowerReading(BaseModel):
+    device_id: str
+    timestamp: datetime
+    consumption: float
+    power_kwh: Optional[float] = None
+    predicted_consumption: Optional[float] = None
+
+    @validator('consumption', 'power_kwh', 'predicted_consumption')
+    def must_be_finite(cls, value: Optional[float]) -> Optional[float]:
+        if value is not None and not math.isfinite(value):
+            raise ValueError('must be a finite number')
+        return value
+
+class IngestionService:
+    """
+    Bulk ingestion of power readings:
+    - One validation pass over a whole batch
+    - Chunked multi-row upserts instead of one round trip per reading
+    - Per-item accepted/rejected reporting
+    - Optional write-behind mode that acknowledges once readings are queued
+    - Accepted readings feed the in-memory ring buffers and online lag
+      features used for predictions, and the per-device feature statistics
+    """
+
+    def __init__(
+        self,
+        db_client: AsyncSupabaseClient,
+        chunk_size: int = 500,
+        max_batch_size: int = 10000,
+        write_behind: Optional[WriteBehindBuffer] = None,
+        ring_buffers: Optional[DeviceRingBuffers] = None,
+        feature_states: Optional[DeviceFeatureStates] = None,
+        feature_stats: Optional[DeviceFeatureStatistics] = None,
+    ):
+        self.db_client = db_client
+        self.write_behind = write_behind
+        self.ring_buffers = ring_buffers
+        self.feature_states = feature_states
+        self.feature_stats = feature_stats
+        self.chunk_size = chunk_size
+        self.max_batch_size = max_batch_size
+        self.logger = logging.getLogger(__name__)
+
+    def validate_reading(self, item: Any) -> Dict:
+        """
+        Validate one raw reading and normalize it for storage.
+        """
+        if not isinstance(item, dict):
+            raise ValueError('Reading must be an object')
+
+        if 'consumption' not in item and 'power_watts' in item:
+            item = {**item, 'consumption': item['power_watts']}
+
+        try:
+            reading = PowerReading.parse_obj(item)
+        except ValidationError as e:
+            raise ValueError('; '.join(
+                f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}"
+                for error in e.errors()
+            ))
+
+        return reading.dict()
+
+    def _remember(self, readings: List[Dict]):
+        """Feed accepted readings to the in-memory prediction state and statistics"""
+        for reading in readings:
+            if self.ring_buffers is not None:
+                self.ring_buffers.append(reading['device_id'], reading['timestamp'], reading['consumption'])
+            if self.feature_states is not None:
+                self.feature_states.add_reading(reading['device_id'], reading['timestamp'], reading['consumption'])
+            if self.feature_stats is not None:
+                self.feature_stats.add_reading(reading['device_id'], reading['timestamp'], reading['consumption'])
+
+    async def ingest_reading(self, device_id: str, item: Any) -> Dict:
+        """
+        Validate and store one reading, queued when write-behind is enabled.
+
+        Raises ValueError for an invalid reading and BufferFullError when the
+        write-behind queue is full.
+        """
+        if not isinstance(item, dict):
+            raise ValueError('Reading must be an object')
+        reading = self.validate_reading({**item, 'device_id': device_id})
+
+        if self.write_behind is not None:
+            await self.write_behind.enqueue(reading)
+            result = {'status': 'queued', 'device_id': device_id}
+        else:
+            result = await self.db_client.save_consumption_data(
+                device_id=device_id,
+                timestamp=reading['timestamp'],
+                consumption=reading['consumption'],
+                predicted_consumption=reading['predicted_consumption'],
+            )
+
+        self._remember([reading])
+        return result
+
+    async def ingest_batch(self, items: List[Any]) -> Dict:
+        """
+        Validate and store a batch of readings, possibly for several devices.
+
+        Returns accepted/rejected counts and one result entry per item.
+        """
+        if len(items) > self.max_batch_size:
+            raise ValueError(
+                f'Batch too large. At most {self.max_batch_size} readings '
+                f'per request, got {len(items)}'
+            )
+
+        results: List[Optional[Dict]] = [None] * len(items)
+        valid_readings = []
+        valid_indexes = []
+
+        for index, item in enumerate(items):
+            try:
+                valid_readings.append(self.validate_reading(item))
+                valid_indexes.append(index)
+            except ValueError as e:
+                results[index] = {'index': index, 'status': 'rejected', 'error': str(e)}
+
+        if valid_readings and self.write_behind is not None:
+            # One pass: once the queue is full the rest is rejected without waiting
+            try:
+                queued = await self.write_behind.enqueue_many(valid_readings)
+                error = 'Write-behind queue is full, retry later'
+            except BufferFullError as e:
+                queued, error = 0, str(e)
+            for index in valid_indexes[queued:]:
+                results[index] = {'index': index, 'status': 'rejected', 'error': error}
+        elif valid_readings:
+            outcome = await self.db_client.save_consumption_data_batch(
+                valid_readings,
+                chunk_size=self.chunk_size,
+            )
+            for failed in outcome['failed_chunks']:
+                for position in range(failed['start'], failed['end']):
+                    index = valid_indexes[position]
+                    results[index] = {
+                        'index': index,
+                        'status': 'rejected',
+                        'error': failed['error'],
+                    }
+
+        accepted_readings = []
+        for position, index in enumerate(valid_indexes):
+            if results[index] is None:
+                results[index] = {'index': index, 'status': 'accepted'}
+                accepted_readings.append(valid_readings[position])
+        self._remember(accepted_readings)
+
+        accepted = sum(1 for result in results if result['status'] == 'accepted')
+
+        return {
+            'accepted': accepted,
+            'rejected': len(items) - accepted,
+            'results': results,
+        }
+
+    async def ingest_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        fmt: str = 'csv',
+        device_id: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        max_reported_errors: int = 20,
+    ) -> Dict:
+        """
+        Parse a streamed CSV/NDJSON body incrementally and store it in batches.
+
+        Only one batch of rows is held in memory at a time. If device_id is
+        given it overrides the device_id column of every row.
+        """
+        batch_size = min(batch_size or self.max_batch_size, self.max_batch_size)
+        parser = ReadingStreamParser(fmt)
+        started = time.monotonic()
+
+        summary = {
+            'rows_received': 0,
+            'accepted': 0,
+            'rejected': 0,
+            'batches': 0,
+            'errors': [],
+        }
+        pending: List[Dict] = []
+        pending_lines: List[int] = []
+
+        def record_error(line: int, error: str):
+            summary['rejected'] += 1
+            if len(summary['errors']) < max_reported_errors:
+                summary['errors'].append({'line': line, 'error': error})
+
+        def collect(parsed):
+            rows, errors = parsed
+            summary['rows_received'] += len(rows) + len(errors)
+            for error in errors:
+                record_error(error['line'], error['error'])
+            for line, row in rows:
+                if device_id is not None:
+                    row['device_id'] = device_id
+                pending.append(row)
+                pending_lines.append(line)
+
+        async def flush(count: int):
+            outcome = await self.ingest_batch(pending[:count])
+            summary['accepted'] += outcome['accepted']
+            summary['batches'] += 1
+            for result in outcome['results']:
+                if result['status'] == 'rejected':
+                    record_error(pending_lines[result['index']], result['error'])
+            del pending[:count]
+            del pending_lines[:count]
+
+            self.logger.info(
+                f"Upload progress: {summary['rows_received']} rows received, "
+                f"{summary['accepted']} accepted, {summary['rejected']} rejected"
+            )
+
+        async for chunk in chunks:
+            collect(parser.feed(chunk))
+            while len(pending) >= batch_size:
+                await flush(batch_size)
+
+        collect(parser.close())
+        if pending:
+            await flush(len(pending))
+
+        elapsed = time.monotonic() - started
+        summary['elapsed_seconds'] = round(elapsed, 3)
+        summary['rows_per_second'] = round(summary['rows_received'] / elapsed, 1) if elapsed > 0 else None
+
+        return summary
@@ -1,22 +1,59 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import asyncio
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple, Union
 
 from ..models.power_prediction_model import PowerPredictionModel
+from ..models.model_bundle import save_bundle
+from ..models.streaming_lstm import StreamingLSTM, DeviceLSTMStates
 from ..utils.data_preprocessor import PowerDataPreprocessor
-from ..database.supabase_client import SupabaseClient
+from ..database.async_supabase_client import AsyncSupabaseClient
+from ..database.local_mirror import LocalPowerMirror
+from ..utils.ring_buffer import DeviceRingBuffers
+from ..utils.resampler import gap_free_runs, last_gap_free_run, regularize_readings
 
 class PredictionService:
     def __init__(
         self,
         model: PowerPredictionModel,
         preprocessor: PowerDataPreprocessor,
-        db_client: SupabaseClient,
+        db_client: Union[AsyncSupabaseClient, LocalPowerMirror],
+        ring_buffers: Optional[DeviceRingBuffers] = None,
+        resample_freq: Optional[str] = '1h',
+        bundle_dir: Optional[str] = None,
+        streaming: bool = False,
+        streaming_rewarm_steps: Optional[int] = 168,
+        streaming_max_devices: int = 10000,
     ):
         self.model = model
         self.preprocessor = preprocessor
         self.db_client = db_client
+        # Recent readings kept in memory by the ingest path
+        self.ring_buffers = ring_buffers
+        # Grid the model steps assume; None keeps raw readings
+        self.resample_freq = resample_freq
+        # Trained models are saved here as versioned bundles
+        self.bundle_dir = bundle_dir
+        # Streaming mode: per-device LSTM state, one recurrent step per new reading
+        self.streaming = streaming
+        self.streaming_rewarm_steps = streaming_rewarm_steps
+        self.streaming_max_devices = streaming_max_devices
+        self.lstm_states: Optional[DeviceLSTMStates] = None
+        if streaming:
+            self._build_lstm_states()
+
+    def _build_lstm_states(self):
+        """(Re)read the model weights into a fresh per-device state cache"""
+        step = pd.Timedelta(self.resample_freq or '1h')
+        self.lstm_states = DeviceLSTMStates(
+            StreamingLSTM.from_keras(self.model),
+            window_length=self.model.sequence_length,
+            # One missing grid step is a gap; the state is warmed up again
+            max_gap_ns=step.value,
+            rewarm_steps=self.streaming_rewarm_steps,
+            max_devices=self.streaming_max_devices,
+        )
 
     async def predict_next_24h(
         self,
@@ -25,28 +62,144 @@ class PredictionService:
         """
         Predict power consumption for the next 24 hours.
         """
-        # Get recent data
-        end_time = datetime.now()
-        start_time = end_time - timedelta(hours=48)  # Get 48h of data for context
-        
-        data = self.db_client.fetch_consumption_data(
-            device_id,
-            start_time,
-            end_time
-        )
-        
-        if not data:
-            raise ValueError('No recent data available for prediction')
-            
-        df = pd.DataFrame(data)
+        end_time = datetime.now(timezone.utc)
+        if self.lstm_states is not None:
+            return await self._predict_streaming(device_id, end_time)
         
-        # Prepare data for prediction
-        X = self.preprocessor.prepare_prediction_data(df)
+        df, X = await self._prediction_window(device_id, end_time)
         
         # Make predictions
         predictions = self.model.predict(X)
         predictions = self.preprocessor.inverse_transform_predictions(predictions)
         
+        return self._format_predictions(predictions, df, end_time)
+
+    async def _predict_streaming(
+        self,
+        device_id: str,
+        end_time: datetime,
+        horizon: int = 24,
+    ) -> Dict[str, List]:
+        """
+        Advance the device's cached LSTM state over completed buckets it
+        has not seen yet, step the still open bucket on top of it, then roll
+        out one prediction per hour.
+        """
+        df = await self._recent_history(device_id, end_time)
+        timestamps = pd.DatetimeIndex(df['timestamp'])
+        if timestamps.tz is not None:
+            timestamps = timestamps.tz_convert(None)
+        timestamps_ns = timestamps.as_unit('ns').asi8
+        # Scaled with the fitted scaler; only rows newer than the state are stepped
+        values = self.preprocessor.prepare_prediction_data(
+            df, sequence_length=len(df), dtype=np.float32
+        )[0]
+        # The current bucket's mean still changes; it is never committed to the state
+        step = pd.Timedelta(self.resample_freq or '1h').value
+        completed_before = pd.Timestamp.now(tz='UTC').value // step * step
+        self.lstm_states.update(device_id, timestamps_ns, values, completed_before=completed_before)
+        
+        predictions = self.lstm_states.forecast(device_id, horizon)
+        predictions = self.preprocessor.inverse_transform_predictions(predictions)
+        
+        return self._format_predictions(predictions, df, end_time)
+
+    def streaming_stats(self) -> Optional[Dict]:
+        """Step, warm-up and device counters of the streaming mode"""
+        return self.lstm_states.stats() if self.lstm_states is not None else None
+
+    async def predict_batch(
+        self,
+        device_ids: List[str],
+        max_concurrency: int = 16,
+    ) -> Dict[str, Dict]:
+        """
+        Predict for many devices with a single forward pass.
+
+        Input windows are loaded concurrently and stacked into one
+        (devices, sequence_length, features) batch. Devices whose window
+        cannot be built get an inline {'error': ...} entry instead of
+        failing the whole batch.
+        """
+        end_time = datetime.now(timezone.utc)
+        device_ids = list(dict.fromkeys(device_ids))
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def load(device_id: str):
+            async with semaphore:
+                return await self._prediction_window(device_id, end_time)
+
+        windows = await asyncio.gather(
+            *(load(device_id) for device_id in device_ids), return_exceptions=True
+        )
+
+        results = {}
+        ready = []
+        for device_id, window in zip(device_ids, windows):
+            if isinstance(window, Exception):
+                results[device_id] = {'error': str(window)}
+            else:
+                ready.append((device_id, window))
+
+        if ready:
+            X = np.concatenate([X for _, (_, X) in ready])
+            predictions = self.model.predict(X).reshape(len(ready), -1)
+            predictions = self.preprocessor.inverse_transform_predictions(
+                predictions.reshape(-1, 1)
+            ).reshape(len(ready), -1)
+            for (device_id, (df, _)), device_predictions in zip(ready, predictions):
+                results[device_id] = self._format_predictions(device_predictions, df, end_time)
+
+        # Keep the request order
+        return {device_id: results[device_id] for device_id in device_ids}
+
+    async def _prediction_window(
+        self,
+        device_id: str,
+        end_time: datetime,
+    ) -> Tuple[pd.DataFrame, np.ndarray]:
+        """
+        Recent history of a device and its scaled model input window.
+        """
+        df = await self._recent_history(device_id, end_time)
+        
+        # Prepare data for prediction
+        return df, self.preprocessor.prepare_prediction_data(df)
+
+    async def _recent_history(
+        self,
+        device_id: str,
+        end_time: datetime,
+    ) -> pd.DataFrame:
+        """
+        The last 48 hours of a device, from memory when ring buffers are set.
+        Only the readings after the last gap are kept, so a window never
+        spans one.
+        """
+        start_time = end_time - timedelta(hours=48)  # Get 48h of data for context
+        
+        if self.ring_buffers is not None:
+            buffer = await self.ring_buffers.get(device_id)
+            df = self._regularize(buffer.to_frame(start_time), last_run=True)
+        else:
+            df = await self._get_frame_async(device_id, start_time, end_time, last_run=True)
+        
+        if df.empty:
+            raise ValueError('No recent data available for prediction')
+        if self.resample_freq is not None and len(df) < self.model.sequence_length:
+            raise ValueError(
+                f'Insufficient data since the last gap. Need at least '
+                f'{self.model.sequence_length} consecutive readings, but got {len(df)}'
+            )
+        
+        return df
+
+    def _format_predictions(
+        self,
+        predictions: np.ndarray,
+        df: pd.DataFrame,
+        end_time: datetime,
+    ) -> Dict[str, List]:
         # Generate timestamps for predictions
         timestamps = [
             (end_time + timedelta(hours=i)).isoformat()
@@ -84,7 +237,7 @@ class PredictionService:
             deviation = abs(pred - mean_consumption)
             if deviation > 2 * std_consumption:
                 anomalies.append({
-                    'timestamp': (datetime.now() + timedelta(hours=i+1)).isoformat(),
+                    'timestamp': (datetime.now(timezone.utc) + timedelta(hours=i+1)).isoformat(),
                     'value': float(pred),
                     'deviation_percentage': float(deviation / mean_consumption * 100),
                     'type': 'high_deviation' if pred > mean_consumption else 'low_deviation',
@@ -93,7 +246,7 @@ class PredictionService:
                 
         return anomalies
 
-    def get_prediction_accuracy(
+    async def get_prediction_accuracy(
         self,
         device_id: str,
     ) -> Dict[str, float]:
@@ -101,22 +254,18 @@ class PredictionService:
         Calculate prediction accuracy metrics.
         """
         # Get data from the last week
-        end_time = datetime.now()
+        end_time = datetime.now(timezone.utc)
         start_time = end_time - timedelta(days=7)
         
-        data = self.db_client.fetch_consumption_data(
-            device_id,
-            start_time,
-            end_time
-        )
+        df = await self._get_frame_async(device_id, start_time, end_time)
         
-        if not data:
+        if df.empty:
             raise ValueError('No data available for accuracy calculation')
-            
-        df = pd.DataFrame(data)
         
-        # Prepare sequences
-        X, y = self.preprocessor.prepare_sequences(df)
+        # Prepare sequences with the scaler fitted in training
+        X, y = self.preprocessor.prepare_sequences(df, fit=False)
+        if len(X) == 0:
+            raise ValueError('No gap-free stretch is long enough for accuracy calculation')
         
         # Get predictions
         predictions = self.model.predict(X)
@@ -141,27 +290,23 @@ class PredictionService:
             'accuracy': float(accuracy)
         }
 
-    def train(self, device_id: str) -> Dict[str, float]:
+    async def train(self, device_id: str) -> Dict[str, float]:
         """
         Train the model on recent data.
         """
         # Get training data (last 30 days)
-        end_time = datetime.now()
+        end_time = datetime.now(timezone.utc)
         start_time = end_time - timedelta(days=30)
         
-        data = self.db_client.fetch_consumption_data(
-            device_id,
-            start_time,
-            end_time
-        )
+        df = await self._get_frame_async(device_id, start_time, end_time)
         
-        if not data:
+        if df.empty:
             raise ValueError('No data available for training')
-            
-        df = pd.DataFrame(data)
         
-        # Prepare data
-        X, y = self.preprocessor.prepare_sequences(df)
+        # Prepare data (windows are views over one float32 copy of the series)
+        X, y = self.preprocessor.prepare_sequences(df, as_view=True, dtype=np.float32)
+        if len(X) == 0:
+            raise ValueError('No gap-free stretch is long enough for training')
         X_train, X_val, X_test, y_train, y_val, y_test = \
             self.preprocessor.train_val_test_split(X, y)
         
@@ -176,9 +321,70 @@ class PredictionService:
             'mse': float(mse),
             'rmse': float(rmse),
             'mae': float(mae),
-            'timestamp': datetime.now().isoformat()
+            'timestamp': datetime.now(timezone.utc).isoformat()
         }
         
         # await self.db_client.save_model_metrics(device_id, metrics)  # Skip for now
         
-        return metrics 
\ No newline at end of file
+        # Cached states belong to the old weights
+        if self.streaming:
+            self._build_lstm_states()
+        
+        if self.bundle_dir:
+            metrics['bundle_path'] = save_bundle(
+                self.bundle_dir,
+                self.model,
+                {'scaler': self.preprocessor.scaler},
+                feature_columns=['power_watts'],
+                training_stats={
+                    **metrics,
+                    'device_id': device_id,
+                    'n_train': len(X_train),
+                    'power_mean': float(df['power_watts'].mean()),
+                    'power_std': float(df['power_watts'].std()),
+                },
+            )
+        
+        return metrics
+
+    async def _get_frame_async(
+        self,
+        device_id: str,
+        start_time: datetime,
+        end_time: datetime,
+        last_run: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Get the history window from the async client or, off the event loop,
+        from a blocking source such as the local mirror.
+        """
+        if isinstance(self.db_client, AsyncSupabaseClient):
+            df = await self.db_client.fetch_consumption_frame(device_id, start_time, end_time)
+        else:
+            loop = asyncio.get_event_loop()
+            df = await loop.run_in_executor(
+                None,
+                self.db_client.fetch_consumption_frame,
+                device_id,
+                start_time,
+                end_time
+            )
+        
+        return self._regularize(df, last_run=last_run)
+
+    def _regularize(self, df: pd.DataFrame, last_run: bool = False) -> pd.DataFrame:
+        """
+        Resample readings onto the fixed grid so each step covers the same
+        time span. Short gaps are forward-filled; long gaps are left out
+        and 'run' numbers the gap-free stretches between them, or with
+        last_run only the readings after the last one are kept.
+        """
+        if self.resample_freq is None or df.empty:
+            return df
+        
+        df = regularize_readings(df, freq=self.resample_freq)
+        if last_run:
+            df = last_gap_free_run(df)
+            return df.loc[~df['gap'], ['timestamp', 'power_watts']].reset_index(drop=True)
+        df['run'] = gap_free_runs(df)
+        return df.loc[~df['gap'], ['timestamp', 'power_watts', 'run']].reset_index(drop=True)
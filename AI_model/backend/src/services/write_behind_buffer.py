@@ -0,0 +1,215 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+
+from ..database.async_supabase_client import AsyncSupabaseClient
+
+class BufferFullError(Exception):
+    """Raised when the write-behind queue stays full past the enqueue timeout."""
+
+class WriteBehindBuffer:
+    """
+    Write-behind ingestion buffer:
+    - Readings are acknowledged once they are appended to a bounded queue
+    - A background task flushes them in size- or time-triggered batches
+    - Failed batches are retried, then spilled to an NDJSON dead-letter file
+    - Stopping the buffer drains and flushes everything still queued
+
+    Dead-letter lines use the upload format, so they can be re-imported with
+    POST /api/consumption/upload?format=ndjson.
+    """
+
+    def __init__(
+        self,
+        db_client: AsyncSupabaseClient,
+        max_queue_size: int = 100000,
+        flush_size: int = 500,
+        flush_interval: float = 1.0,
+        enqueue_timeout: float = 0.5,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        dead_letter_path: str = 'ingest_dead_letter.ndjson',
+    ):
+        self.db_client = db_client
+        self.max_queue_size = max_queue_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.dead_letter_path = dead_letter_path
+        self.logger = logging.getLogger(__name__)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self._stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'flushes': 0,
+            'retries': 0,
+            'dead_lettered': 0,
+            'rejected_full': 0,
+        }
+
+    async def start(self):
+        """Start the background flush task on the running event loop"""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop accepting readings, then drain and flush the queue"""
+        if self._task is None:
+            return
+        self._stopping = True
+        await self._task
+        self._task = None
+
+    async def enqueue(self, reading: Dict):
+        """
+        Append one validated reading to the queue.
+
+        Waits up to enqueue_timeout for space and raises BufferFullError if
+        the queue is still full, pushing back on the client.
+        """
+        if self._task is None or self._stopping:
+            raise BufferFullError('Write-behind buffer is not accepting readings')
+
+        try:
+            await asyncio.wait_for(self._queue.put(reading), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self._stats['rejected_full'] += 1
+            raise BufferFullError('Write-behind queue is full, retry later')
+
+        self._stats['enqueued'] += 1
+
+    async def enqueue_many(self, readings: List[Dict]) -> int:
+        """
+        Append validated readings in order, as many as fit.
+
+        Waits at most once, up to enqueue_timeout, when the queue is full;
+        returns the number of readings queued (a prefix of readings). The
+        rest count as rejected_full and are the caller's to report.
+        """
+        if self._task is None or self._stopping:
+            raise BufferFullError('Write-behind buffer is not accepting readings')
+        if not readings:
+            return 0
+
+        queued = 0
+        waited = False
+        for reading in readings:
+            try:
+                self._queue.put_nowait(reading)
+            except asyncio.QueueFull:
+                if waited:
+                    break
+                waited = True
+                try:
+                    await asyncio.wait_for(self._queue.put(reading), timeout=self.enqueue_timeout)
+                except asyncio.TimeoutError:
+                    break
+            queued += 1
+
+        self._stats['enqueued'] += queued
+        self._stats['rejected_full'] += len(readings) - queued
+        return queued
+
+    def stats(self) -> Dict:
+        """Queue depth and flush counters"""
+        return {
+            **self._stats,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'max_queue_size': self.max_queue_size,
+        }
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            if batch:
+                await self._flush(batch)
+            elif self._stopping:
+                break
+
+    async def _collect_batch(self) -> List[Dict]:
+        """Wait for the first reading, then gather more until size or time triggers"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.flush_size:
+            if self._stopping:
+                # Draining: take whatever is left without waiting
+                if self._queue.empty():
+                    break
+                batch.append(self._queue.get_nowait())
+                continue
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _flush(self, batch: List[Dict]):
+        pending = batch
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                outcome = await self.db_client.save_consumption_data_batch(
+                    pending,
+                    chunk_size=self.flush_size,
+                )
+            except Exception as e:
+                outcome = {
+                    'saved': 0,
+                    'failed_chunks': [{'start': 0, 'end': len(pending), 'error': str(e)}],
+                }
+
+            self._stats['flushed'] += outcome['saved']
+            failed = [
+                reading
+                for chunk in outcome['failed_chunks']
+                for reading in pending[chunk['start']:chunk['end']]
+            ]
+            if not failed:
+                break
+
+            pending = failed
+            if attempt < self.max_retries:
+                self._stats['retries'] += 1
+                self.logger.warning(
+                    f"Write-behind flush failed for {len(pending)} readings, "
+                    f"retry {attempt + 1}/{self.max_retries}: "
+                    f"{outcome['failed_chunks'][0]['error']}"
+                )
+                await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+        else:
+            self._spill(pending)
+
+        self._stats['flushes'] += 1
+
+    def _spill(self, readings: List[Dict]):
+        """Append readings that exhausted their retries to the dead-letter file"""
+        try:
+            with open(self.dead_letter_path, 'a') as f:
+                for reading in readings:
+                    f.write(json.dumps({
+                        **reading,
+                        'timestamp': reading['timestamp'].isoformat(),
+                    }) + '\n')
+            self._stats['dead_lettered'] += len(readings)
+            self.logger.error(
+                f"Spilled {len(readings)} readings to {self.dead_letter_path}"
+            )
+        except Exception as e:
+            self.logger.error(f"Error writing dead-letter file: {e}")
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+from sklearn.ensemble import IsolationForest
+
+class DeviceAnomalyModels:
+    """
+    Per-device IsolationForest models that are fitted once and reused.
+
+    The hot path only scores rows. A device's model is refitted when it is
+    older than refresh_interval or when the incoming features drift: some
+    column mean moves more than drift_threshold reference standard
+    deviations. With model_dir set, models are persisted with joblib and
+    reloaded across restarts.
+
+    Fitting holds only the device's own lock, so other devices keep being
+    scored while one model is (re)fitted.
+    """
+
+    def __init__(
+        self,
+        model_dir: Optional[str] = None,
+        refresh_interval: timedelta = timedelta(days=1),
+        drift_threshold: float = 3.0,
+        contamination: float = 0.1,
+        min_fit_rows: int = 50,
+    ):
+        self.model_dir = model_dir
+        self.refresh_interval = refresh_interval
+        self.drift_threshold = drift_threshold
+        self.contamination = contamination
+        self.min_fit_rows = min_fit_rows
+        self.logger = logging.getLogger(__name__)
+        self._models: Dict[str, Dict] = {}
+        self._device_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()  # guards _device_locks
+        if model_dir:
+            os.makedirs(model_dir, exist_ok=True)
+
+    def _path(self, device_id: str) -> str:
+        # Device ids come from requests; never use them as a path directly
+        name = hashlib.sha256(device_id.encode('utf-8')).hexdigest()
+        return os.path.join(self.model_dir, f'{name}.joblib')
+
+    def _device_lock(self, device_id: str) -> threading.Lock:
+        with self._lock:
+            return self._device_locks.setdefault(device_id, threading.Lock())
+
+    def _load(self, device_id: str) -> Optional[Dict]:
+        state = self._models.get(device_id)
+        if state is None and self.model_dir and os.path.exists(self._path(device_id)):
+            state = self._models[device_id] = joblib.load(self._path(device_id))
+        return state
+
+    def fit(self, device_id: str, X: pd.DataFrame) -> Dict:
+        """Fit and store a device model on X"""
+        model = IsolationForest(contamination=self.contamination, random_state=42)
+        model.fit(X)
+        state = {
+            'model': model,
+            'columns': list(X.columns),
+            'mean': X.mean().to_numpy(),
+            'std': X.std().fillna(0).to_numpy(),
+            'fitted_at': datetime.now(timezone.utc),
+        }
+        self._models[device_id] = state
+        if self.model_dir:
+            path = self._path(device_id)
+            joblib.dump(state, f'{path}.tmp')
+            os.replace(f'{path}.tmp', path)
+        return state
+
+    def _needs_refit(self, state: Optional[Dict], X: pd.DataFrame) -> bool:
+        if state is None or list(X.columns) != state['columns']:
+            return True
+        if datetime.now(timezone.utc) - state['fitted_at'] > self.refresh_interval:
+            return True
+        shift = np.abs(X.mean().to_numpy() - state['mean']) / (state['std'] + 1e-9)
+        if np.nanmax(shift) > self.drift_threshold:
+            self.logger.info(f"Feature drift {np.nanmax(shift):.1f} sd, refitting anomaly model")
+            return True
+        return False
+
+    def predict(self, device_id: str, X: pd.DataFrame) -> np.ndarray:
+        """
+        Score rows with the device model: -1 for anomalies, 1 otherwise.
+        """
+        with self._device_lock(device_id):
+            state = self._load(device_id)
+            if self._needs_refit(state, X) and len(X) >= self.min_fit_rows:
+                state = self.fit(device_id, X)
+
+        if state is None or list(X.columns) != state['columns']:
+            # Too little data to fit a model for these features yet
+            return np.ones(len(X), dtype=int)
+        return state['model'].predict(X)
+
+class RobustZScoreDetector:
+    """
+    Median/MAD outlier test: |0.6745 * (x - median) / MAD| > threshold.
+
+    O(n log n) per call and unaffected by the outliers it is looking for.
+    """
+
+    def __init__(self, threshold: float = 3.5):
+        self.threshold = threshold
+
+    def predict(self, values: np.ndarray) -> np.ndarray:
+        values = np.asarray(values, dtype=np.float64)
+        median = np.nanmedian(values)
+        mad = np.nanmedian(np.abs(values - median))
+        if not mad:
+            return np.ones(len(values), dtype=int)
+        score = 0.6745 * (values - median) / mad
+        return np.where(np.abs(score) > self.threshold, -1, 1)
+
+class EwmaBandDetector:
+    """
+    Streaming EWMA band: a reading is anomalous when it falls more than
+    k exponentially weighted standard deviations from the EWMA mean.
+
+    update() is O(1) per reading, so the detector can follow a live stream
+    one reading at a time; update_many() feeds a whole chunk at once.
+    """
+
+    def __init__(self, alpha: float = 0.1, k: float = 3.0, warmup: int = 24):
+        self.alpha = alpha
+        self.k = k
+        self.warmup = warmup
+        self.mean = None
+        self.var = 0.0
+        self.count = 0
+
+    def update(self, value: float) -> bool:
+        """Feed one reading; returns True if it is anomalous"""
+        if self.mean is None:
+            self.mean = value
+            self.count = 1
+            return False
+
+        deviation = value - self.mean
+        anomalous = self.count >= self.warmup and abs(deviation) > self.k * math.sqrt(self.var)
+        self.mean += self.alpha * deviation
+        self.var = (1 - self.alpha) * (self.var + self.alpha * deviation ** 2)
+        self.count += 1
+        return anomalous
+
+    def update_many(self, values: np.ndarray) -> np.ndarray:
+        """
+        Feed a chunk of readings; returns a boolean anomaly mask.
+
+        Same result as calling update() on each value: the mean and variance
+        recursions are linear, so they run as two IIR filters seeded with
+        the current state.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        anomalous = np.zeros(len(values), dtype=bool)
+        if len(values) == 0:
+            return anomalous
+
+        start = 0
+        if self.mean is None:
+            self.mean = float(values[0])
+            self.count = 1
+            start = 1
+        values = values[start:]
+        if len(values) == 0:
+            return anomalous
+
+        decay = 1.0 - self.alpha
+        means, _ = lfilter([self.alpha], [1.0, -decay], values, zi=[decay * self.mean])
+        deviations = values - np.r_[self.mean, means[:-1]]
+        variances, _ = lfilter([decay * self.alpha], [1.0, -decay], deviations ** 2, zi=[decay * self.var])
+        prior_variances = np.r_[self.var, variances[:-1]]
+        prior_counts = self.count + np.arange(len(values))
+
+        anomalous[start:] = (prior_counts >= self.warmup) & \
+            (np.abs(deviations) > self.k * np.sqrt(prior_variances))
+        self.mean = float(means[-1])
+        self.var = float(variances[-1])
+        self.count += len(values)
+        return anomalous
+
+    def predict(self, values: np.ndarray) -> np.ndarray:
+        """Run a fresh band over a series: -1 for anomalies, 1 otherwise"""
+        detector = EwmaBandDetector(self.alpha, self.k, self.warmup)
+        return np.where(detector.update_many(values), -1, 1)
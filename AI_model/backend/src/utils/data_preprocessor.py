@@ -1,8 +1,26 @@
 import numpy as np
 import pandas as pd
-from typing import Tuple, List
+from typing import Tuple, List, Optional
+from numpy.lib.stride_tricks import sliding_window_view
 from sklearn.preprocessing import MinMaxScaler
 
+def sliding_windows(
+    series: np.ndarray,
+    sequence_length: int,
+    stride: int = 1,
+) -> np.ndarray:
+    """
+    Read-only (n_windows, sequence_length, n_features) view of a 2D series.
+
+    Window i covers series[i * stride:i * stride + sequence_length]; no
+    values are copied.
+    """
+    if len(series) < sequence_length:
+        return np.empty((0, sequence_length, series.shape[1]), dtype=series.dtype)
+    # sliding_window_view puts the window axis last: (n, features, length)
+    windows = sliding_window_view(series, sequence_length, axis=0)
+    return windows.transpose(0, 2, 1)[::stride]
+
 class PowerDataPreprocessor:
     def __init__(self):
         self.scaler = MinMaxScaler()
@@ -13,6 +31,11 @@ class PowerDataPreprocessor:
         sequence_length: int = 24,
         target_column: str = 'power_watts',
         feature_columns: List[str] = None,
+        as_view: bool = False,
+        stride: int = 1,
+        dtype: Optional[np.dtype] = None,
+        fit: bool = True,
+        run_col: Optional[str] = 'run',
     ) -> Tuple[np.ndarray, np.ndarray]:
         """
         Prepare sequences for LSTM model training.
@@ -22,6 +45,15 @@ class PowerDataPreprocessor:
             sequence_length: Number of time steps in each sequence
             target_column: Name of the target column
             feature_columns: List of feature column names
+            as_view: Return X as a read-only strided view over the scaled
+                series instead of a copy of every window
+            stride: Step between the starts of consecutive windows
+            dtype: Cast the scaled series once (e.g. np.float32) before windowing
+            fit: Fit the scaler on this data; pass False to evaluate with the
+                already fitted (e.g. bundled) scaler
+            run_col: Column numbering the gap-free runs of a regularized
+                series; when present, windows whose inputs and target do not
+                all lie in one run are dropped (X is then a copy)
             
         Returns:
             Tuple of (X, y) where X contains sequences and y contains targets
@@ -30,14 +62,35 @@ class PowerDataPreprocessor:
             feature_columns = [target_column]
 
         # Scale the features
-        scaled_data = self.scaler.fit_transform(data[feature_columns])
+        if fit:
+            scaled_data = self.scaler.fit_transform(data[feature_columns])
+        else:
+            self._check_fitted()
+            scaled_data = self.scaler.transform(data[feature_columns])
+        if dtype is not None:
+            scaled_data = scaled_data.astype(dtype, copy=False)
         
-        X, y = [], []
-        for i in range(len(scaled_data) - sequence_length):
-            X.append(scaled_data[i:(i + sequence_length)])
-            y.append(scaled_data[i + sequence_length, 0])  # 0 index for target column
-            
-        return np.array(X), np.array(y)
+        # The last window has no next value to predict
+        X = sliding_windows(scaled_data[:-1], sequence_length, stride)
+        y = scaled_data[sequence_length::stride, 0]  # 0 index for target column
+        
+        if run_col is not None and run_col in data.columns:
+            # Runs only increase, so equal ids at both ends mean no gap between
+            runs = data[run_col].to_numpy()
+            starts = np.arange(len(X)) * stride
+            inside = runs[starts] == runs[starts + sequence_length]
+            if not inside.all():
+                X, y = X[inside], y[inside]
+        
+        if not as_view:
+            return np.ascontiguousarray(X), y.copy()
+        
+        y.flags.writeable = False
+        return X, y
+
+    def _check_fitted(self):
+        if not hasattr(self.scaler, 'scale_'):
+            raise ValueError('Scaler is not fitted; train the model or load a model bundle first')
 
     def train_val_test_split(
         self,
@@ -102,6 +155,7 @@ class PowerDataPreprocessor:
         data: pd.DataFrame,
         sequence_length: int = 24,
         feature_columns: List[str] = None,
+        dtype: Optional[np.dtype] = None,
     ) -> np.ndarray:
         """
         Prepare data for making predictions.
@@ -110,6 +164,7 @@ class PowerDataPreprocessor:
             data: DataFrame containing recent power consumption data
             sequence_length: Number of time steps in each sequence
             feature_columns: List of feature column names
+            dtype: Cast the scaled window (e.g. np.float32) for the model
             
         Returns:
             Scaled and formatted input sequence
@@ -126,10 +181,11 @@ class PowerDataPreprocessor:
         # Use the last sequence_length points
         recent_data = data.tail(sequence_length)
         
-        # Fit the scaler on the recent data if not fitted
-        if not hasattr(self.scaler, 'scale_'):
-            self.scaler.fit(data[feature_columns])
+        # Never refit on the serving path: the scaler comes from training
+        self._check_fitted()
         
         scaled_data = self.scaler.transform(recent_data[feature_columns])
+        if dtype is not None:
+            scaled_data = scaled_data.astype(dtype, copy=False)
         
-        return np.array([scaled_data]) 
\ No newline at end of file
+        return sliding_windows(scaled_data, sequence_length)[-1:] 
\ No newline at end of file
@@ -1,12 +1,18 @@
 import numpy as np
 import pandas as pd
-from typing import Tuple, List, Dict, Optional
+from typing import Tuple, List, Dict, Iterable, Optional
 from sklearn.preprocessing import MinMaxScaler, StandardScaler, RobustScaler
-from sklearn.ensemble import IsolationForest
 from sklearn.decomposition import PCA
 import warnings
 warnings.filterwarnings('ignore')
 
+from .feature_builder import ContextFeatureBuilder
+from .anomaly_detectors import DeviceAnomalyModels, EwmaBandDetector, RobustZScoreDetector
+from .quality_stats import quality_report_from_chunks
+from .feature_stats import CovarianceAccumulator, DeviceFeatureStatistics
+from .online_features import DeviceFeatureStates
+from .weather import WeatherJoiner
+
 class EnhancedDataPreprocessor:
     """
     Advanced data preprocessor with multi-feature support:
@@ -16,11 +22,28 @@ class EnhancedDataPreprocessor:
     - Multiple scaling strategies
     """
     
-    def __init__(self, scaling_method: str = 'robust'):
+    def __init__(
+        self,
+        scaling_method: str = 'robust',
+        anomaly_method: str = 'isolation_forest',
+        anomaly_models: Optional[DeviceAnomalyModels] = None,
+        weather: Optional[WeatherJoiner] = None,
+        feature_states: Optional[DeviceFeatureStates] = None,
+        feature_stats: Optional[DeviceFeatureStatistics] = None,
+    ):
         self.power_scaler = self._get_scaler(scaling_method)
         self.context_scaler = self._get_scaler(scaling_method)
-        self.anomaly_detector = IsolationForest(contamination=0.1, random_state=42)
+        # 'isolation_forest' (fitted once per device), 'zscore' or 'ewma'
+        self.anomaly_method = anomaly_method
+        self.anomaly_models = anomaly_models or DeviceAnomalyModels()
         self.pca = PCA(n_components=0.95)  # Keep 95% of variance
+        # Model inputs are built in one pass with a fixed column order
+        self.feature_builder = ContextFeatureBuilder(weather)
+        self.context_features = list(self.feature_builder.feature_names)
+        # Incremental lag/rolling/EMA features per device, fed at ingest
+        self.feature_states = feature_states
+        # Per-device feature statistics, updated at ingest
+        self.feature_stats = feature_stats
         
     def _get_scaler(self, method: str):
         """Get scaler based on method"""
@@ -31,6 +54,11 @@ class EnhancedDataPreprocessor:
         }
         return scalers.get(method, RobustScaler())
 
+    def _check_fitted(self):
+        for scaler in (self.power_scaler, self.context_scaler):
+            if not hasattr(scaler, 'scale_'):
+                raise ValueError('Scalers are not fitted; train the model or load a model bundle first')
+
     def add_time_features(self, df: pd.DataFrame, timestamp_col: str = 'timestamp') -> pd.DataFrame:
         """Add comprehensive time-based features"""
         df = df.copy()
@@ -68,18 +96,19 @@ class EnhancedDataPreprocessor:
         return df
 
     def add_weather_features(self, df: pd.DataFrame, weather_data: Optional[pd.DataFrame] = None) -> pd.DataFrame:
-        """Add weather-based features (mock implementation - integrate with weather API)"""
+        """
+        Add weather-based features: as-of joined from weather_data or the
+        configured weather cache, else mock weather for demonstration
+        """
         df = df.copy()
         
-        if weather_data is not None:
-            # Merge with actual weather data
-            df = df.merge(weather_data, on='timestamp', how='left')
-        else:
-            # Generate mock weather features for demonstration
-            np.random.seed(42)
-            df['temperature'] = 20 + 10 * np.sin(2 * np.pi * df['hour'] / 24) + np.random.normal(0, 2, len(df))
-            df['humidity'] = 50 + 20 * np.random.random(len(df))
-            df['cloud_cover'] = np.random.uniform(0, 100, len(df))
+        device_ids = df['device_id'].to_numpy() if 'device_id' in df.columns else None
+        temperature, humidity, cloud_cover = self.feature_builder.weather_columns(
+            pd.DatetimeIndex(pd.to_datetime(df['timestamp'])), weather_data, device_ids
+        )
+        df['temperature'] = temperature
+        df['humidity'] = humidity
+        df['cloud_cover'] = cloud_cover
             
         # Weather-based features
         df['temp_category'] = pd.cut(df['temperature'], bins=[-np.inf, 10, 20, 30, np.inf], 
@@ -127,13 +156,22 @@ class EnhancedDataPreprocessor:
         
         statistical_anomalies = df[(df[target_col] < lower_bound) | (df[target_col] > upper_bound)].index.tolist()
         
-        # Isolation Forest anomaly detection
-        if len(df) > 50:  # Need sufficient data
+        # ML / streaming anomaly detection
+        if self.anomaly_method == 'zscore':
+            anomaly_scores = RobustZScoreDetector().predict(df[target_col].values)
+            ml_anomalies = df[anomaly_scores == -1].index.tolist()
+        elif self.anomaly_method == 'ewma':
+            anomaly_scores = EwmaBandDetector().predict(df[target_col].values)
+            ml_anomalies = df[anomaly_scores == -1].index.tolist()
+        elif len(df) > 50:  # Need sufficient data
             features_for_anomaly = [col for col in df.columns if col not in ['timestamp', 'device_id']]
             X_anomaly = df[features_for_anomaly].select_dtypes(include=[np.number]).fillna(0)
             
             if len(X_anomaly.columns) > 0:
-                anomaly_scores = self.anomaly_detector.fit_predict(X_anomaly)
+                # Scored with the device's persisted forest; refitted only when stale or drifting
+                devices = df['device_id'].unique() if 'device_id' in df.columns else []
+                device_key = str(devices[0]) if len(devices) == 1 else '_all'
+                anomaly_scores = self.anomaly_models.predict(device_key, X_anomaly)
                 ml_anomalies = df[anomaly_scores == -1].index.tolist()
             else:
                 ml_anomalies = []
@@ -167,49 +205,68 @@ class EnhancedDataPreprocessor:
         
         return df
 
-    def prepare_enhanced_sequences(
+    def prepare_enhanced_base(
         self,
         df: pd.DataFrame,
         sequence_length: int = 168,  # 1 week
         target_col: str = 'power_watts',
         prediction_horizons: List[int] = [1, 6, 24],
-    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        dtype: Optional[np.dtype] = np.float32,
+        fit: bool = True,
+    ) -> Tuple[np.ndarray, np.ndarray, int]:
         """
-        Prepare sequences with multi-horizon targets and contextual features
+        Scale the series once without building any windows.
+
+        Returns (power_data, context_data, n_windows). Window i covers rows
+        i:i + sequence_length and its targets start at i + sequence_length,
+        so windows can be built lazily (see utils.enhanced_dataset).
+        With fit=False the already fitted scalers are reused.
         """
-        # Create contextual features
-        df_enhanced = self.create_contextual_features(df)
-        df_enhanced = df_enhanced.dropna()
+        # Create contextual features (float32, complete rows only)
+        power_data, context_data = self.feature_builder.build(df, target_col=target_col)
         
-        if len(df_enhanced) < sequence_length + max(prediction_horizons):
+        if len(power_data) < sequence_length + max(prediction_horizons):
             raise ValueError(f"Insufficient data. Need at least {sequence_length + max(prediction_horizons)} rows")
         
-        # Separate power and contextual features
-        power_features = [target_col]
-        
-        # Select contextual features (exclude target and metadata)
-        exclude_cols = ['timestamp', 'device_id', target_col, 'is_anomaly', 'temp_category']
-        contextual_features = [col for col in df_enhanced.columns 
-                             if col not in exclude_cols and df_enhanced[col].dtype in ['int64', 'float64']]
-        
-        print(f"Power features: {power_features}")
-        print(f"Contextual features ({len(contextual_features)}): {contextual_features[:10]}...")  # Show first 10
+        print(f"Power features: {[target_col]}")
+        print(f"Contextual features ({len(self.context_features)}): {self.context_features[:10]}...")  # Show first 10
         
         # Scale features
-        power_data = self.power_scaler.fit_transform(df_enhanced[power_features])
-        
-        if contextual_features:
-            context_data = self.context_scaler.fit_transform(df_enhanced[contextual_features])
+        if fit:
+            power_data = self.power_scaler.fit_transform(power_data)
+            context_data = self.context_scaler.fit_transform(context_data)
         else:
-            # Create dummy contextual features if none available
-            context_data = np.zeros((len(df_enhanced), 7))
-            contextual_features = [f'dummy_feature_{i}' for i in range(7)]
+            self._check_fitted()
+            power_data = self.power_scaler.transform(power_data)
+            context_data = self.context_scaler.transform(context_data)
+        
+        if dtype is not None:
+            power_data = power_data.astype(dtype, copy=False)
+            context_data = context_data.astype(dtype, copy=False)
+        
+        n_windows = len(power_data) - sequence_length - max(prediction_horizons)
+        return power_data, context_data, n_windows
+
+    def prepare_enhanced_sequences(
+        self,
+        df: pd.DataFrame,
+        sequence_length: int = 168,  # 1 week
+        target_col: str = 'power_watts',
+        prediction_horizons: List[int] = [1, 6, 24],
+        fit: bool = True,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Prepare sequences with multi-horizon targets and contextual features
+        """
+        power_data, context_data, n_windows = self.prepare_enhanced_base(
+            df, sequence_length, target_col, prediction_horizons, dtype=None, fit=fit
+        )
         
         # Create sequences
         X_power, X_context = [], []
         y_1h, y_6h, y_24h = [], [], []
         
-        for i in range(len(power_data) - sequence_length - max(prediction_horizons)):
+        for i in range(n_windows):
             # Input sequences
             X_power.append(power_data[i:i + sequence_length])
             X_context.append(context_data[i:i + sequence_length])
@@ -295,55 +352,70 @@ class EnhancedDataPreprocessor:
         df: pd.DataFrame,
         sequence_length: int = 168,
         target_col: str = 'power_watts',
+        device_id: Optional[str] = None,
     ) -> Tuple[np.ndarray, np.ndarray]:
-        """Prepare data for making predictions with contextual features"""
+        """
+        Prepare data for making predictions with contextual features.
+
+        With feature_states and a device_id, the lag, rolling and EMA
+        features of the window come from the device's online state instead
+        of being recomputed over df; if the state does not cover the window
+        they are computed as usual.
+        """
+        lag_features = None
+        if self.feature_states is not None and device_id is not None and device_id in self.feature_states:
+            timestamps = pd.DatetimeIndex(pd.to_datetime(df['timestamp'], utc=True)).asi8
+            lag_features = self.feature_states.feature_matrix(
+                device_id, timestamps, df[target_col].to_numpy(dtype=np.float64)
+            )
+            recent = np.argsort(timestamps, kind='stable')[-sequence_length:]
+            if len(recent) < sequence_length or not np.isfinite(lag_features[recent]).all():
+                lag_features = None
         
         # Create enhanced features
-        df_enhanced = self.create_contextual_features(df)
-        df_enhanced = df_enhanced.dropna()
+        power_data, context_data = self.feature_builder.build(df, target_col=target_col, lag_features=lag_features)
         
-        if len(df_enhanced) < sequence_length:
+        if len(power_data) < sequence_length:
             raise ValueError(f'Not enough data points. Need at least {sequence_length}')
         
         # Use the most recent sequence
-        recent_data = df_enhanced.tail(sequence_length)
+        recent_power = power_data[-sequence_length:]
+        recent_context = context_data[-sequence_length:]
         
-        # Separate features
-        power_features = [target_col]
-        exclude_cols = ['timestamp', 'device_id', target_col, 'is_anomaly', 'temp_category']
-        contextual_features = [col for col in recent_data.columns 
-                             if col not in exclude_cols and recent_data[col].dtype in ['int64', 'float64']]
-        
-        # Scale features using existing scalers
-        power_data = self.power_scaler.transform(recent_data[power_features])
-        
-        if contextual_features and hasattr(self.context_scaler, 'scale_'):
-            context_data = self.context_scaler.transform(recent_data[contextual_features])
-        else:
-            # Use dummy features if contextual features not available
-            context_data = np.zeros((len(recent_data), 7))
+        # Scale features using the scalers fitted in training (never refit here)
+        self._check_fitted()
+        power_data = self.power_scaler.transform(recent_power)
+        context_data = self.context_scaler.transform(recent_context)
         
         return np.array([power_data]), np.array([context_data])
 
-    def get_feature_importance_analysis(self, df: pd.DataFrame) -> Dict:
-        """Analyze feature importance and correlations"""
-        df_enhanced = self.create_contextual_features(df)
-        df_numeric = df_enhanced.select_dtypes(include=[np.number])
-        
-        # Correlation analysis
-        correlation_matrix = df_numeric.corr()
-        target_correlations = correlation_matrix['power_watts'].abs().sort_values(ascending=False)
-        
-        # Feature statistics
-        feature_stats = {
-            'total_features': len(df_numeric.columns),
-            'high_correlation_features': target_correlations[target_correlations > 0.1].to_dict(),
-            'feature_means': df_numeric.mean().to_dict(),
-            'feature_stds': df_numeric.std().to_dict(),
-            'missing_value_counts': df_enhanced.isnull().sum().to_dict()
-        }
-        
-        return feature_stats
+    def get_feature_importance_analysis(
+        self,
+        df: Optional[pd.DataFrame] = None,
+        device_ids: Optional[List[str]] = None,
+    ) -> Dict:
+        """
+        Analyze feature importance and correlations over the model inputs.
+
+        Without df the report comes from feature_stats (the statistics kept
+        up to date at ingest) for the given devices, all by default, and no
+        history is rebuilt.
+        """
+        if df is None:
+            if self.feature_stats is None:
+                raise ValueError('No data given and no feature statistics are kept')
+            return self.feature_stats.report(device_ids)
+        power_data, context_data = self.feature_builder.build(df, keep_incomplete=True)
+        accumulator = CovarianceAccumulator(['power_watts', *self.context_features])
+        accumulator.update(np.hstack([power_data, context_data]))
+        return accumulator.report('power_watts')
+
+    def generate_data_quality_report_chunked(self, chunks: Iterable, **kwargs) -> Dict:
+        """
+        Data quality report over history chunks (DataFrames or lists of rows)
+        in stream order, without holding the history in memory
+        """
+        return quality_report_from_chunks(chunks, **kwargs)
 
     def generate_data_quality_report(self, df: pd.DataFrame) -> Dict:
         """Generate comprehensive data quality report"""
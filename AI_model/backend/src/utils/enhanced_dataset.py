@@ -0,0 +1,106 @@
+import numpy as np
+import tensorflow as tf
+from typing import Dict, Optional, Sequence, Tuple, Union
+
+def split_index_ranges(
+    n_windows: int,
+    train_ratio: float = 0.7,
+    val_ratio: float = 0.15,
+) -> Dict[str, Tuple[int, int]]:
+    """
+    Time-ordered train/val/test split expressed as [start, end) window indices.
+
+    Same boundaries as EnhancedDataPreprocessor.train_val_test_split_enhanced.
+    """
+    train_end = int(n_windows * train_ratio)
+    val_end = int(n_windows * (train_ratio + val_ratio))
+    return {
+        'train': (0, train_end),
+        'val': (train_end, val_end),
+        'test': (val_end, n_windows),
+    }
+
+def make_window_dataset(
+    power_data: Union[np.ndarray, tf.Tensor],
+    context_data: Union[np.ndarray, tf.Tensor],
+    index_range: Tuple[int, int],
+    sequence_length: int = 168,
+    prediction_horizons: Sequence[int] = (1, 6, 24),
+    batch_size: int = 32,
+    shuffle: bool = False,
+    shuffle_buffer: int = 10000,
+    seed: Optional[int] = None,
+) -> tf.data.Dataset:
+    """
+    Lazily build windows and multi-horizon targets from the scaled base matrices.
+
+    Only window start indices are shuffled and batched; each batch gathers
+    its (batch, sequence_length, features) windows from the base matrices
+    on the fly, so peak memory stays close to the size of the series.
+
+    Yields ({'power_input', 'context_input'}, {'<h>h_prediction'}) batches,
+    matching the inputs and outputs of EnhancedPowerPredictionModel.
+    """
+    power = tf.convert_to_tensor(power_data, dtype=tf.float32)
+    context = tf.convert_to_tensor(context_data, dtype=tf.float32)
+    target = power[:, 0]
+    steps = tf.range(sequence_length, dtype=tf.int64)
+
+    def gather_batch(starts):
+        window_rows = starts[:, None] + steps[None, :]
+        inputs = {
+            'power_input': tf.gather(power, window_rows),
+            'context_input': tf.gather(context, window_rows),
+        }
+        targets = {}
+        for horizon in prediction_horizons:
+            target_rows = starts[:, None] + sequence_length + tf.range(horizon, dtype=tf.int64)[None, :]
+            targets[f'{horizon}h_prediction'] = tf.gather(target, target_rows)
+        return inputs, targets
+
+    start, end = index_range
+    dataset = tf.data.Dataset.range(start, end)
+    if shuffle:
+        dataset = dataset.shuffle(
+            min(shuffle_buffer, max(end - start, 1)),
+            seed=seed,
+            reshuffle_each_iteration=True,
+        )
+    return dataset \
+        .batch(batch_size) \
+        .map(gather_batch, num_parallel_calls=tf.data.AUTOTUNE) \
+        .prefetch(tf.data.AUTOTUNE)
+
+def make_split_datasets(
+    power_data: np.ndarray,
+    context_data: np.ndarray,
+    n_windows: int,
+    sequence_length: int = 168,
+    prediction_horizons: Sequence[int] = (1, 6, 24),
+    batch_size: int = 32,
+    train_ratio: float = 0.7,
+    val_ratio: float = 0.15,
+    shuffle_buffer: int = 10000,
+    seed: Optional[int] = None,
+) -> Dict[str, tf.data.Dataset]:
+    """
+    Train (shuffled), val and test datasets over one shared base matrix.
+    """
+    # Convert once so the three datasets share the same tensors
+    power_data = tf.convert_to_tensor(power_data, dtype=tf.float32)
+    context_data = tf.convert_to_tensor(context_data, dtype=tf.float32)
+    ranges = split_index_ranges(n_windows, train_ratio, val_ratio)
+    return {
+        name: make_window_dataset(
+            power_data,
+            context_data,
+            index_range,
+            sequence_length=sequence_length,
+            prediction_horizons=prediction_horizons,
+            batch_size=batch_size,
+            shuffle=(name == 'train'),
+            shuffle_buffer=shuffle_buffer,
+            seed=seed,
+        )
+        for name, index_range in ranges.items()
+    }
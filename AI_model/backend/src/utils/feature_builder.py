@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+from typing import Optional, Tuple
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+from .weather import DEFAULT_WEATHER_TOLERANCE, MockWeather, WeatherJoiner, _to_ns, asof_join, fill_stale
+
+LAGS = (1, 2, 6, 12, 24)
+ROLLING_WINDOWS = (6, 12, 24)
+EMA_ALPHAS = (0.1, 0.3, 0.7)
+# Leading rows of a run without a complete feature set (lag_24 needs 24 earlier rows)
+WARMUP_ROWS = max(max(LAGS), max(ROLLING_WINDOWS) - 1)
+
+# Fixed column order of the context matrix. These are the numeric columns
+# that create_contextual_features produces and prepare_enhanced_sequences
+# selects (timestamp, device_id, the target, is_anomaly, temp_category and
+# the int32 calendar columns are not model inputs).
+CONTEXT_FEATURES = (
+    'is_weekend',
+    'hour_sin', 'hour_cos', 'day_sin', 'day_cos', 'month_sin', 'month_cos',
+    'is_morning_peak', 'is_evening_peak', 'is_peak_hour', 'is_sleep_hour', 'is_work_hour',
+    'temperature', 'humidity', 'cloud_cover',
+    'temp_cold', 'temp_hot', 'heating_likely', 'cooling_likely',
+    *(f'power_watts_lag_{lag}' for lag in LAGS),
+    *(
+        f'power_watts_rolling_{stat}_{window}'
+        for window in ROLLING_WINDOWS
+        for stat in ('mean', 'std', 'min', 'max')
+    ),
+    *(f'power_watts_ema_{alpha}' for alpha in EMA_ALPHAS),
+    'device_mean_power', 'device_std_power', 'power_relative_to_device_mean',
+)
+
+# The contiguous block of history features, in OnlineLagFeatures order
+LAG_FEATURES = CONTEXT_FEATURES[
+    CONTEXT_FEATURES.index(f'power_watts_lag_{LAGS[0]}'):CONTEXT_FEATURES.index(f'power_watts_ema_{EMA_ALPHAS[-1]}') + 1
+]
+
+class ContextFeatureBuilder:
+    """
+    Single-pass replacement for create_contextual_features + dropna + the
+    dtype column scan.
+
+    Every feature is written straight into one preallocated float32 matrix
+    in CONTEXT_FEATURES order; no intermediate DataFrames are built. The
+    IsolationForest step is skipped because is_anomaly is not a model input.
+    Weather comes from the given frame, else the WeatherJoiner, else the
+    mock weather.
+    """
+
+    feature_names = CONTEXT_FEATURES
+
+    def __init__(self, weather: Optional[WeatherJoiner] = None):
+        self.weather = weather
+        self._index = {name: i for i, name in enumerate(CONTEXT_FEATURES)}
+        start = self._index[LAG_FEATURES[0]]
+        self._lag_slice = slice(start, start + len(LAG_FEATURES))
+
+    def build(
+        self,
+        df: pd.DataFrame,
+        weather_data: Optional[pd.DataFrame] = None,
+        target_col: str = 'power_watts',
+        return_index: bool = False,
+        lag_features: Optional[np.ndarray] = None,
+        keep_incomplete: bool = False,
+    ) -> Tuple[np.ndarray, ...]:
+        """
+        Build (power_data, context_data) for rows with a complete feature set.
+
+        Rows are sorted by timestamp. power_data is (n, 1) and context_data
+        is (n, len(CONTEXT_FEATURES)), both float32. Feature names keep the
+        power_watts_ prefix whatever the target column is. Without a
+        device_id column all rows are treated as one device. With
+        return_index the input row positions of the output rows are
+        returned as a third element.
+
+        lag_features, an (n, len(LAG_FEATURES)) array in input row order
+        (e.g. from DeviceFeatureStates.feature_matrix), replaces the lag,
+        rolling and EMA computation; its NaN rows count as incomplete.
+        With keep_incomplete, incomplete rows are returned too, NaN where a
+        feature could not be computed.
+        """
+        timestamps = pd.DatetimeIndex(pd.to_datetime(df['timestamp']))
+        raw_power = df[target_col].to_numpy(dtype=np.float64)
+        n = len(raw_power)
+        order = np.argsort(timestamps.asi8, kind='stable')
+
+        context = np.empty((n, len(CONTEXT_FEATURES)), dtype=np.float32)
+        column = lambda name: context[:, self._index[name]]
+
+        # Time features
+        ts = timestamps.take(order)
+        hour = ts.hour.to_numpy()
+        day_of_week = ts.dayofweek.to_numpy()
+        month = ts.month.to_numpy()
+        column('is_weekend')[:] = day_of_week >= 5
+        column('hour_sin')[:] = np.sin(2 * np.pi * hour / 24)
+        column('hour_cos')[:] = np.cos(2 * np.pi * hour / 24)
+        column('day_sin')[:] = np.sin(2 * np.pi * day_of_week / 7)
+        column('day_cos')[:] = np.cos(2 * np.pi * day_of_week / 7)
+        column('month_sin')[:] = np.sin(2 * np.pi * month / 12)
+        column('month_cos')[:] = np.cos(2 * np.pi * month / 12)
+        morning_peak = (hour >= 7) & (hour <= 9)
+        evening_peak = (hour >= 18) & (hour <= 20)
+        column('is_morning_peak')[:] = morning_peak
+        column('is_evening_peak')[:] = evening_peak
+        column('is_peak_hour')[:] = morning_peak | evening_peak
+        column('is_sleep_hour')[:] = (hour >= 23) | (hour <= 6)
+        column('is_work_hour')[:] = (hour >= 9) & (hour <= 17) & (day_of_week < 5)
+
+        # Weather features
+        device_ids = df['device_id'].to_numpy() if 'device_id' in df.columns else None
+        temperature, humidity, cloud_cover = self.weather_columns(timestamps, weather_data, device_ids)
+        temperature = temperature[order]
+        column('temperature')[:] = temperature
+        column('humidity')[:] = humidity[order]
+        column('cloud_cover')[:] = cloud_cover[order]
+        column('temp_cold')[:] = temperature <= 10
+        column('temp_hot')[:] = temperature > 30
+        column('heating_likely')[:] = temperature < 15
+        column('cooling_likely')[:] = temperature > 25
+
+        # Lag, rolling and EMA features
+        power = raw_power[order]
+        if lag_features is not None:
+            context[:, self._lag_slice] = np.asarray(lag_features)[order]
+        for lag in LAGS if lag_features is None else ():
+            lagged = column(f'power_watts_lag_{lag}')
+            lagged[:lag] = np.nan
+            lagged[lag:] = power[:n - lag] if n > lag else power[:0]
+
+        for window in ROLLING_WINDOWS if lag_features is None else ():
+            for stat in ('mean', 'std', 'min', 'max'):
+                column(f'power_watts_rolling_{stat}_{window}')[:window - 1] = np.nan
+            if n < window:
+                continue
+            windows = sliding_window_view(power, window)
+            column(f'power_watts_rolling_mean_{window}')[window - 1:] = windows.mean(axis=1)
+            column(f'power_watts_rolling_std_{window}')[window - 1:] = windows.std(axis=1, ddof=1)
+            column(f'power_watts_rolling_min_{window}')[window - 1:] = windows.min(axis=1)
+            column(f'power_watts_rolling_max_{window}')[window - 1:] = windows.max(axis=1)
+
+        for alpha in EMA_ALPHAS if lag_features is None else ():
+            # pandas ewm(adjust=True): decayed sum over decayed weight total
+            decay = 1.0 - alpha
+            weighted_sum = lfilter([1.0], [1.0, -decay], power)
+            weight_total = (1.0 - decay ** np.arange(1, n + 1)) / alpha
+            column(f'power_watts_ema_{alpha}')[:] = weighted_sum / weight_total
+
+        # Device statistics over all rows, before incomplete rows are dropped
+        if 'device_id' in df.columns:
+            codes, _ = pd.factorize(df['device_id'].to_numpy()[order])
+        else:
+            codes = np.zeros(n, dtype=np.int64)
+        counts = np.bincount(codes).astype(np.float64)
+        means = np.bincount(codes, weights=power) / counts
+        deviations = power - means[codes]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stds = np.sqrt(np.bincount(codes, weights=deviations ** 2) / (counts - 1))
+        stds[counts < 2] = np.nan
+        column('device_mean_power')[:] = means[codes]
+        column('device_std_power')[:] = stds[codes]
+        column('power_relative_to_device_mean')[:] = power / (means[codes] + 1e-6)
+
+        if keep_incomplete:
+            complete = np.ones(n, dtype=bool)
+        else:
+            complete = np.isfinite(context).all(axis=1) & np.isfinite(power)
+        if return_index:
+            return power[complete, None].astype(np.float32), context[complete], order[complete]
+        return power[complete, None].astype(np.float32), context[complete]
+
+    def weather_columns(
+        self,
+        timestamps: pd.DatetimeIndex,
+        weather_data: Optional[pd.DataFrame],
+        device_ids: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Weather columns in input row order"""
+        if weather_data is not None:
+            # As-of join: observations rarely share the readings' exact timestamps
+            times = _to_ns(weather_data['timestamp'])
+            order = np.argsort(times, kind='stable')
+            values = weather_data[['temperature', 'humidity', 'cloud_cover']].to_numpy(dtype=np.float64)
+            query = _to_ns(timestamps)
+            weather = asof_join(query, times[order], values[order], pd.Timedelta(DEFAULT_WEATHER_TOLERANCE).value)
+            # Observations lag behind readings; keep the newest rows with the last one
+            fill_stale(weather, query, times[order], values[order])
+        elif self.weather is not None:
+            weather = self.weather.join(timestamps, device_ids)
+        else:
+            # Same mock draws, in the same order, as add_weather_features
+            weather = MockWeather().values(timestamps)
+        return weather[:, 0], weather[:, 1], weather[:, 2]
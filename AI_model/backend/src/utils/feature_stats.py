@@ -0,0 +1,283 @@
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+
+from .feature_builder import ContextFeatureBuilder, EMA_ALPHAS, LAGS, ROLLING_WINDOWS
+
+class CovarianceAccumulator:
+    """
+    Mergeable means and co-moment matrix of a fixed set of features.
+
+    Chunks are folded in with the pairwise (Chan et al.) update, so the
+    state after any sequence of update() and merge() calls equals one pass
+    over all rows. The state is O(features^2) and the report needs no
+    access to the data it was built from.
+    """
+
+    def __init__(self, columns: Sequence[str]):
+        self.columns = list(columns)
+        n_features = len(self.columns)
+        self.count = 0
+        self.mean = np.zeros(n_features)
+        self.comoment = np.zeros((n_features, n_features))
+        self.missing = np.zeros(n_features, dtype=np.int64)
+        self.skipped_rows = 0
+
+    def update(self, X: np.ndarray, skipped_rows: int = 0):
+        """
+        Fold in a (rows, features) chunk. Rows with a non-finite value are
+        counted per column and left out of the moments.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != len(self.columns):
+            raise ValueError(f'Expected {len(self.columns)} feature columns, got shape {X.shape}')
+        finite = np.isfinite(X)
+        self.missing += (~finite).sum(axis=0)
+        complete = finite.all(axis=1)
+        self.skipped_rows += skipped_rows + int((~complete).sum())
+        X = X[complete]
+        if len(X) == 0:
+            return
+
+        chunk = CovarianceAccumulator(self.columns)
+        chunk.count = len(X)
+        chunk.mean = X.mean(axis=0)
+        centered = X - chunk.mean
+        chunk.comoment = centered.T @ centered
+        self._merge_moments(chunk)
+
+    def merge(self, other: 'CovarianceAccumulator'):
+        if other.columns != self.columns:
+            raise ValueError('Cannot merge accumulators over different features')
+        self.missing += other.missing
+        self.skipped_rows += other.skipped_rows
+        self._merge_moments(other)
+
+    def _merge_moments(self, other: 'CovarianceAccumulator'):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.comoment += other.comoment + np.outer(delta, delta) * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.count = count
+
+    @property
+    def covariance(self) -> np.ndarray:
+        """Sample covariance (ddof=1), NaN with fewer than two rows"""
+        if self.count < 2:
+            return np.full_like(self.comoment, np.nan)
+        return self.comoment / (self.count - 1)
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(np.diag(self.covariance))
+
+    @property
+    def correlation(self) -> np.ndarray:
+        """Pearson correlation; NaN for constant features, like DataFrame.corr"""
+        std = self.std
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = self.covariance / np.outer(std, std)
+        correlation[~np.isfinite(correlation)] = np.nan
+        return np.clip(correlation, -1.0, 1.0)
+
+    def report(self, target_col: str = 'power_watts', threshold: float = 0.1) -> Dict:
+        """Same fields as EnhancedDataPreprocessor.get_feature_importance_analysis"""
+        target = pd.Series(
+            np.abs(self.correlation[self.columns.index(target_col)]), index=self.columns
+        ).sort_values(ascending=False)
+        return {
+            'total_features': len(self.columns),
+            'total_rows': self.count,
+            'high_correlation_features': target[target > threshold].to_dict(),
+            'feature_means': dict(zip(self.columns, self.mean.tolist())),
+            'feature_stds': dict(zip(self.columns, self.std.tolist())),
+            'missing_value_counts': dict(zip(self.columns, self.missing.tolist())),
+            'incomplete_rows': self.skipped_rows,
+        }
+
+class _DeviceBuckets:
+    """Open grid bucket, unfolded completed buckets and feature tail of one device"""
+
+    def __init__(self):
+        self.open_bucket: Optional[int] = None
+        self.open_sum = 0.0
+        self.open_count = 0
+        self.pending: List[Tuple[int, float]] = []  # completed (bucket start ns, mean)
+        self.tail: Optional[pd.DataFrame] = None  # last folded buckets of the current run
+
+    @property
+    def last_time(self) -> Optional[int]:
+        if self.pending:
+            return self.pending[-1][0]
+        return self.tail['timestamp'].iloc[-1].value if self.tail is not None else None
+
+class DeviceFeatureStatistics:
+    """
+    Per-device CovarianceAccumulators over the model features, updated as
+    readings arrive and merged on demand for fleet-wide reports.
+
+    Readings are averaged onto the training grid (hourly buckets by
+    default) as in DeviceFeatureStates, since the builder lags and rolls
+    by row: a bucket counts once a reading of a later bucket arrives, and
+    as in regularize_readings up to max_fill_steps missing buckets are
+    forward-filled, a longer gap starting a new run after them. Completed
+    buckets are folded in batches of fold_buckets, or when a report is
+    asked for, so the feature rebuild does not run per reading.
+
+    The last buckets of each device are kept so lag, rolling and EMA
+    features of the next batch see their history (EMA weights beyond the
+    kept tail are below 1e-6); each bucket is counted once. Readings of a
+    bucket older than the open one are dropped. Device mean/std features
+    are taken over the batch plus its tail. Rows whose lag features are
+    not yet defined are counted per column in missing_value_counts.
+
+    Bucketing state is kept for at most max_devices devices; an evicted
+    device's accumulator stays, and its next run starts without a tail.
+    """
+
+    def __init__(
+        self,
+        builder: Optional[ContextFeatureBuilder] = None,
+        target_col: str = 'power_watts',
+        bucket_seconds: int = 3600,
+        max_fill_steps: int = 3,
+        fold_buckets: int = 24,
+        max_devices: int = 10000,
+    ):
+        self.builder = builder or ContextFeatureBuilder()
+        self.target_col = target_col
+        self.columns = [target_col, *self.builder.feature_names]
+        ema_memory = math.ceil(math.log(1e-6) / math.log(1 - min(EMA_ALPHAS)))
+        self.history = max(max(LAGS), max(ROLLING_WINDOWS), ema_memory)
+        self.step_ns = bucket_seconds * 10**9
+        self.max_fill_steps = max_fill_steps
+        self.fold_buckets = fold_buckets
+        self.max_devices = max_devices
+        self._accumulators: Dict[str, CovarianceAccumulator] = {}
+        self._tails: 'OrderedDict[str, _DeviceBuckets]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'buckets': 0, 'folds': 0, 'dropped_out_of_order': 0, 'evicted': 0}
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._accumulators or device_id in self._tails
+
+    def _device(self, device_id: str) -> _DeviceBuckets:
+        device = self._tails.get(device_id)
+        if device is None:
+            device = self._tails[device_id] = _DeviceBuckets()
+            while len(self._tails) > self.max_devices:
+                evicted_id, evicted = self._tails.popitem(last=False)
+                self._fold(evicted_id, evicted)
+                self._stats['evicted'] += 1
+        self._tails.move_to_end(device_id)
+        return device
+
+    def add_reading(self, device_id: str, timestamp, value: float):
+        """Feed one ingested reading (raw, not yet bucketed)"""
+        ts = pd.Timestamp(timestamp)
+        ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+        bucket = ts.value - ts.value % self.step_ns
+        with self._lock:
+            device = self._device(device_id)
+            if device.open_bucket is None:
+                last = device.last_time
+                if last is not None and bucket <= last:
+                    self._stats['dropped_out_of_order'] += 1
+                    return
+            elif bucket < device.open_bucket:
+                self._stats['dropped_out_of_order'] += 1
+                return
+            elif bucket > device.open_bucket:
+                self._complete(device_id, device)
+            if device.open_bucket is None:
+                device.open_bucket, device.open_sum, device.open_count = bucket, 0.0, 0
+            device.open_sum += float(value)
+            device.open_count += 1
+
+    def update(self, device_id: str, df: pd.DataFrame):
+        """Feed a chunk of one device's raw readings (timestamp, target_col), in time order"""
+        timestamps = pd.to_datetime(df['timestamp'], utc=True, format='ISO8601')
+        for timestamp, value in zip(timestamps, df[self.target_col].to_numpy(dtype=np.float64)):
+            self.add_reading(device_id, timestamp, value)
+
+    def _complete(self, device_id: str, device: _DeviceBuckets):
+        """Queue the open bucket, filling or restarting the run across a gap"""
+        bucket, value = device.open_bucket, device.open_sum / device.open_count
+        device.open_bucket = None
+        last = device.last_time
+        if last is not None and bucket - last > self.step_ns:
+            # Like regularize_readings: fill up to max_fill_steps, end the run after that
+            missing = (bucket - last) // self.step_ns - 1
+            fill = device.pending[-1][1] if device.pending else float(device.tail[self.target_col].iloc[-1])
+            filled = min(missing, self.max_fill_steps)
+            device.pending.extend((last + k * self.step_ns, fill) for k in range(1, filled + 1))
+            if missing > filled:
+                self._fold(device_id, device)
+                device.tail = None
+        device.pending.append((bucket, value))
+        self._stats['buckets'] += 1
+        if len(device.pending) >= self.fold_buckets:
+            self._fold(device_id, device)
+
+    def _fold(self, device_id: str, device: _DeviceBuckets):
+        """Fold a device's completed buckets into its accumulator"""
+        if not device.pending:
+            return
+        times, values = zip(*device.pending)
+        device.pending = []
+        chunk = pd.DataFrame({
+            'timestamp': pd.to_datetime(np.array(times, dtype=np.int64), unit='ns', utc=True),
+            self.target_col: np.array(values, dtype=np.float64),
+        })
+        tail = device.tail
+        combined = chunk if tail is None else pd.concat([tail, chunk], ignore_index=True)
+        n_tail = 0 if tail is None else len(tail)
+
+        power, context, rows = self.builder.build(
+            combined, target_col=self.target_col, return_index=True, keep_incomplete=True
+        )
+        new = rows >= n_tail
+        accumulator = self._accumulators.get(device_id)
+        if accumulator is None:
+            accumulator = self._accumulators[device_id] = CovarianceAccumulator(self.columns)
+        accumulator.update(np.hstack([power[new], context[new]]))
+        device.tail = combined.tail(self.history).reset_index(drop=True)
+        self._stats['folds'] += 1
+
+    def flush(self):
+        """Fold every device's completed buckets; the open buckets stay open"""
+        with self._lock:
+            for device_id, device in self._tails.items():
+                self._fold(device_id, device)
+
+    def merge(self, other: 'DeviceFeatureStatistics'):
+        """Fold in statistics of a later time partition (or other devices)"""
+        other.flush()
+        with self._lock:
+            for device_id, accumulator in other._accumulators.items():
+                if device_id not in self._accumulators:
+                    self._accumulators[device_id] = CovarianceAccumulator(self.columns)
+                self._accumulators[device_id].merge(accumulator)
+            for device_id, device in other._tails.items():
+                self._device(device_id)
+                self._tails[device_id] = device
+
+    def accumulator(self, device_ids: Optional[Sequence[str]] = None) -> CovarianceAccumulator:
+        """One device's statistics merged with others; all devices by default"""
+        self.flush()
+        merged = CovarianceAccumulator(self.columns)
+        for device_id in device_ids if device_ids is not None else list(self._accumulators):
+            if device_id in self._accumulators:
+                merged.merge(self._accumulators[device_id])
+        return merged
+
+    def report(self, device_ids: Optional[Sequence[str]] = None, threshold: float = 0.1) -> Dict:
+        return self.accumulator(device_ids).report(self.target_col, threshold)
+
+    def stats(self) -> Dict:
+        return {**self._stats, 'devices': len(self._tails), 'max_devices': self.max_devices}
@@ -0,0 +1,349 @@
+import copy
+import math
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+
+class RollingWindowState:
+    """
+    O(1) rolling mean/std/min/max over the last `window` readings.
+
+    - Welford accumulator with removal for mean and sample variance (ddof=1)
+    - Monotonic deques for min and max
+    - Values are NaN until the window is full, like pandas rolling(window)
+    """
+
+    def __init__(self, window: int):
+        if window <= 0:
+            raise ValueError('Window must be positive')
+        self.window = window
+        self._values = deque()
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._count = 0  # total readings seen, used as a position for the deques
+        self._min = deque()  # (position, value), values increasing
+        self._max = deque()  # (position, value), values decreasing
+
+    def update(self, value: float):
+        self._values.append(value)
+        n = len(self._values)
+        delta = value - self._mean
+        self._mean += delta / n
+        self._m2 += delta * (value - self._mean)
+
+        if n > self.window:
+            old = self._values.popleft()
+            n -= 1
+            delta = old - self._mean
+            self._mean -= delta / n
+            self._m2 = max(self._m2 - delta * (old - self._mean), 0.0)
+
+        position = self._count
+        self._count += 1
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((position, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((position, value))
+
+        oldest = self._count - self.window
+        while self._min[0][0] < oldest:
+            self._min.popleft()
+        while self._max[0][0] < oldest:
+            self._max.popleft()
+
+    @property
+    def full(self) -> bool:
+        return len(self._values) == self.window
+
+    @property
+    def mean(self) -> float:
+        return self._mean if self.full else math.nan
+
+    @property
+    def std(self) -> float:
+        if not self.full or self.window < 2:
+            return math.nan
+        if self._min[0][1] == self._max[0][1]:
+            # Constant window: avoid round-off left over from removals
+            return 0.0
+        return math.sqrt(self._m2 / (self.window - 1))
+
+    @property
+    def min(self) -> float:
+        return self._min[0][1] if self.full else math.nan
+
+    @property
+    def max(self) -> float:
+        return self._max[0][1] if self.full else math.nan
+
+class EmaState:
+    """
+    O(1) exponential moving average matching pandas ewm(alpha=alpha).mean()
+    (adjust=True): the weighted sum and the weight total decay separately.
+    """
+
+    def __init__(self, alpha: float):
+        if not 0 < alpha <= 1:
+            raise ValueError('EMA alpha must be in (0, 1]')
+        self.alpha = alpha
+        self._weighted_sum = 0.0
+        self._weight_total = 0.0
+
+    def update(self, value: float):
+        decay = 1.0 - self.alpha
+        self._weighted_sum = value + decay * self._weighted_sum
+        self._weight_total = 1.0 + decay * self._weight_total
+
+    @property
+    def value(self) -> float:
+        if self._weight_total == 0:
+            return math.nan
+        return self._weighted_sum / self._weight_total
+
+class OnlineLagFeatures:
+    """
+    Incremental version of EnhancedDataPreprocessor.add_lag_features for one
+    device. Each update is O(1) amortized and the state is O(max window),
+    however much history the device has. features() returns the latest
+    row with the same column names as the batch implementation and the
+    same values up to floating-point round-off.
+
+    Readings must be finite and fed in timestamp order.
+    """
+
+    def __init__(
+        self,
+        target_col: str = 'power_watts',
+        lags: List[int] = [1, 2, 6, 12, 24],
+        windows: List[int] = [6, 12, 24],
+        alphas: List[float] = [0.1, 0.3, 0.7],
+    ):
+        self.target_col = target_col
+        self.lags = list(lags)
+        self._history = deque(maxlen=max(self.lags) + 1)
+        self._windows = {window: RollingWindowState(window) for window in windows}
+        self._emas = {alpha: EmaState(alpha) for alpha in alphas}
+        self.count = 0
+
+    @property
+    def feature_names(self) -> List[str]:
+        names = [f'{self.target_col}_lag_{lag}' for lag in self.lags]
+        for window in self._windows:
+            names += [
+                f'{self.target_col}_rolling_{stat}_{window}'
+                for stat in ('mean', 'std', 'min', 'max')
+            ]
+        names += [f'{self.target_col}_ema_{alpha}' for alpha in self._emas]
+        return names
+
+    def update(self, value: float):
+        value = float(value)
+        self._history.append(value)
+        for state in self._windows.values():
+            state.update(value)
+        for state in self._emas.values():
+            state.update(value)
+        self.count += 1
+
+    def extend(self, values: Iterable[float]):
+        for value in values:
+            self.update(value)
+
+    def copy(self) -> 'OnlineLagFeatures':
+        return copy.deepcopy(self)
+
+    def features(self) -> Dict[str, float]:
+        """Feature row for the most recent reading (NaN where history is too short)"""
+        row = {}
+        for lag in self.lags:
+            row[f'{self.target_col}_lag_{lag}'] = \
+                self._history[-1 - lag] if len(self._history) > lag else math.nan
+        for window, state in self._windows.items():
+            row[f'{self.target_col}_rolling_mean_{window}'] = state.mean
+            row[f'{self.target_col}_rolling_std_{window}'] = state.std
+            row[f'{self.target_col}_rolling_min_{window}'] = state.min
+            row[f'{self.target_col}_rolling_max_{window}'] = state.max
+        for alpha, state in self._emas.items():
+            row[f'{self.target_col}_ema_{alpha}'] = state.value
+        return row
+
+class _DeviceRun:
+    """Feature state of one device over its current gap-free run of buckets"""
+
+    def __init__(self, feature_kwargs: Dict, history: int):
+        self.state = OnlineLagFeatures(**feature_kwargs)
+        self.times = deque(maxlen=history)  # bucket starts, ns
+        self.values = deque(maxlen=history)
+        self.rows = deque(maxlen=history)  # feature vectors in feature_names order
+        self.open_bucket: Optional[int] = None
+        self.open_sum = 0.0
+        self.open_count = 0
+
+    @property
+    def last_time(self) -> Optional[int]:
+        return self.times[-1] if self.times else None
+
+class DeviceFeatureStates:
+    """
+    Per-device OnlineLagFeatures on the grid of the enhanced model (hourly
+    buckets by default), fed from two sides:
+    - add_reading() on the ingest path averages raw readings into the open
+      bucket and steps the state once a later bucket starts
+    - sync() on the prediction path steps completed buckets the state has
+      not seen (readings that did not pass through this API) and rebuilds
+      the state when it disagrees with the stored history
+
+    The feature rows of the last `history` buckets are kept, so prediction
+    windows read their lag, rolling and EMA features (feature_matrix)
+    instead of recomputing them over the whole history. Gaps of up to
+    max_fill_steps buckets are forward-filled as in regularize_readings;
+    a longer gap starts a new run. At most max_devices devices are kept.
+    """
+
+    def __init__(
+        self,
+        bucket_seconds: int = 3600,
+        history: int = 192,
+        max_fill_steps: int = 3,
+        max_devices: int = 10000,
+        **feature_kwargs,
+    ):
+        self.step_ns = bucket_seconds * 10**9
+        self.history = history
+        self.max_fill_steps = max_fill_steps
+        self.max_devices = max_devices
+        self.feature_kwargs = feature_kwargs
+        self.feature_names = OnlineLagFeatures(**feature_kwargs).feature_names
+        self._runs: 'OrderedDict[str, _DeviceRun]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'steps': 0, 'rebuilds': 0, 'dropped_out_of_order': 0, 'evicted': 0}
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._runs
+
+    def _run(self, device_id: str) -> _DeviceRun:
+        run = self._runs.get(device_id)
+        if run is None:
+            run = self._runs[device_id] = _DeviceRun(self.feature_kwargs, self.history)
+            while len(self._runs) > self.max_devices:
+                self._runs.popitem(last=False)
+                self._stats['evicted'] += 1
+        self._runs.move_to_end(device_id)
+        return run
+
+    def _push(self, run: _DeviceRun, bucket_ns: int, value: float):
+        run.state.update(value)
+        run.times.append(bucket_ns)
+        run.values.append(value)
+        run.rows.append(np.fromiter(run.state.features().values(), dtype=np.float64))
+        self._stats['steps'] += 1
+
+    def _step(self, run: _DeviceRun, bucket_ns: int, value: float):
+        """Append one completed bucket, filling or restarting across a gap"""
+        last = run.last_time
+        if last is not None and bucket_ns - last > self.step_ns:
+            missing = (bucket_ns - last) // self.step_ns - 1
+            if missing > self.max_fill_steps:
+                fresh = _DeviceRun(self.feature_kwargs, self.history)
+                run.state, run.times, run.values, run.rows = fresh.state, fresh.times, fresh.values, fresh.rows
+            else:
+                for k in range(1, missing + 1):
+                    self._push(run, last + k * self.step_ns, run.values[-1])
+        self._push(run, bucket_ns, value)
+
+    def add_reading(self, device_id: str, timestamp, value: float):
+        """Feed one ingested reading (raw, not yet bucketed)"""
+        ts = pd.Timestamp(timestamp)
+        ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+        bucket = ts.value - ts.value % self.step_ns
+        with self._lock:
+            run = self._run(device_id)
+            if run.open_bucket is not None and bucket < run.open_bucket:
+                self._stats['dropped_out_of_order'] += 1
+                return
+            if run.open_bucket is not None and bucket > run.open_bucket:
+                # The open bucket is complete; sync() may have stepped it already
+                if run.last_time is None or run.open_bucket > run.last_time:
+                    self._step(run, run.open_bucket, run.open_sum / run.open_count)
+                run.open_bucket = None
+            if run.open_bucket is None:
+                run.open_bucket, run.open_sum, run.open_count = bucket, 0.0, 0
+            run.open_sum += float(value)
+            run.open_count += 1
+
+    def sync(self, device_id: str, timestamps_ns: np.ndarray, values: np.ndarray, rtol: float = 1e-6) -> int:
+        """
+        Bring a device up to date with completed grid buckets from storage
+        (one gap-free run, oldest first). Returns the number of buckets
+        stepped; the state is rebuilt when its newest bucket is missing
+        from, or differs from, the given history.
+        """
+        timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if len(timestamps_ns) == 0:
+            return 0
+        with self._lock:
+            run = self._run(device_id)
+            last = run.last_time
+            if last is not None:
+                i = int(np.searchsorted(timestamps_ns, last))
+                if i < len(timestamps_ns) and timestamps_ns[i] == last \
+                        and abs(values[i] - run.values[-1]) <= rtol * (1.0 + abs(values[i])):
+                    for bucket, value in zip(timestamps_ns[i + 1:], values[i + 1:]):
+                        self._step(run, int(bucket), float(value))
+                    return len(timestamps_ns) - i - 1
+                if last > timestamps_ns[-1] and timestamps_ns[-1] in run.times:
+                    # Ingest is ahead of storage (e.g. write-behind); nothing to do
+                    return 0
+
+            self._stats['rebuilds'] += 1
+            open_bucket = run.open_bucket, run.open_sum, run.open_count
+            run = self._runs[device_id] = _DeviceRun(self.feature_kwargs, self.history)
+            run.open_bucket, run.open_sum, run.open_count = open_bucket
+            # Only the buckets that can still be read back need a feature row
+            warm = max(len(timestamps_ns) - self.history, 0)
+            run.state.extend(values[:warm])
+            for bucket, value in zip(timestamps_ns[warm:], values[warm:]):
+                self._step(run, int(bucket), float(value))
+            return len(timestamps_ns)
+
+    def feature_matrix(self, device_id: str, timestamps_ns: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        (n, len(feature_names)) features for grid rows of a device, NaN for
+        rows older than the kept history. Rows after the newest completed
+        bucket (e.g. the still open one) are stepped on a copy of the state.
+        """
+        timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+        result = np.full((len(timestamps_ns), len(self.feature_names)), np.nan)
+        with self._lock:
+            run = self._runs.get(device_id)
+            if run is None or not run.times:
+                return result
+            times = np.fromiter(run.times, dtype=np.int64, count=len(run.times))
+            positions = np.searchsorted(times, timestamps_ns)
+            known = (positions < len(times)) & (times[np.minimum(positions, len(times) - 1)] == timestamps_ns)
+            rows = list(run.rows)
+            for index in np.flatnonzero(known):
+                result[index] = rows[positions[index]]
+
+            newer = np.flatnonzero(timestamps_ns > times[-1])
+            if len(newer):
+                state = run.state.copy()
+                for index in newer:
+                    state.update(float(values[index]))
+                    result[index] = np.fromiter(state.features().values(), dtype=np.float64)
+        return result
+
+    def features(self, device_id: str) -> Optional[Dict[str, float]]:
+        """Latest completed feature row, or None if the device has no state yet"""
+        run = self._runs.get(device_id)
+        if run is None or not run.rows:
+            return None
+        return dict(zip(self.feature_names, run.rows[-1]))
+
+    def stats(self) -> Dict:
+        return {**self._stats, 'devices': len(self._runs), 'max_devices': self.max_devices}
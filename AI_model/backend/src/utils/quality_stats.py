@@ -0,0 +1,236 @@
+import asyncio
+from concurrent.futures import Executor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
+import numpy as np
+import pandas as pd
+
+from .anomaly_detectors import EwmaBandDetector
+from .resampler import MIN_VALID_TIMESTAMP
+
+class RunningStats:
+    """
+    Count, mean, variance, min, max and zero count of a stream of values.
+
+    Each chunk is summarized with vectorized NumPy and folded in with the
+    parallel Welford (Chan et al.) update, so merging chunks or partitions
+    gives the same result as one pass over all values.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.zeros = 0
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+        chunk = RunningStats()
+        chunk.count = len(values)
+        chunk.mean = float(values.mean())
+        chunk.m2 = float(((values - chunk.mean) ** 2).sum())
+        chunk.min = float(values.min())
+        chunk.max = float(values.max())
+        chunk.zeros = int((values == 0).sum())
+        self.merge(chunk)
+
+    def merge(self, other: 'RunningStats'):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.zeros += other.zeros
+
+    @property
+    def std(self) -> Optional[float]:
+        # Sample standard deviation, like pandas
+        return float(np.sqrt(self.m2 / (self.count - 1))) if self.count > 1 else None
+
+class DataQualityAccumulator:
+    """
+    Chunked version of EnhancedDataPreprocessor.generate_data_quality_report
+    for one device.
+
+    Chunks must arrive in timestamp order, as the history is paged.
+    Memory is O(columns) however long the history is. Besides the
+    original report fields it tracks timestamp problems:
+    - invalid: missing, before min_valid (unset device clocks report
+      1970-01-01) or more than max_future ahead
+    - gaps: consecutive valid timestamps more than gap_threshold apart
+
+    Anomalies are counted with a streaming EWMA band instead of the
+    batch anomaly pipeline.
+    """
+
+    def __init__(
+        self,
+        value_col: str = 'power_watts',
+        gap_threshold: timedelta = timedelta(hours=1),
+        min_valid: pd.Timestamp = MIN_VALID_TIMESTAMP,
+        max_future: timedelta = timedelta(hours=1),
+    ):
+        self.value_col = value_col
+        self.gap_threshold = pd.Timedelta(gap_threshold).value
+        self.min_valid = min_valid
+        self.max_future = max_future
+        self.records = 0
+        self.null_counts: Dict[str, int] = {}
+        self.data_types: Dict[str, str] = {}
+        self.power = RunningStats()
+        self.invalid_timestamps = 0
+        self.gaps = 0
+        self.max_gap = 0
+        self.first_timestamp = None  # ns since epoch, valid timestamps only
+        self.last_timestamp = None
+        self.min_timestamp = None
+        self.max_timestamp = None
+        self.anomaly_count = 0
+        self._band = EwmaBandDetector()
+
+    def update(self, chunk: Union[pd.DataFrame, List[Dict]]):
+        df = chunk if isinstance(chunk, pd.DataFrame) else pd.DataFrame(chunk)
+        if df.empty:
+            return
+        self.records += len(df)
+        for column, nulls in df.isnull().sum().items():
+            self.null_counts[column] = self.null_counts.get(column, 0) + int(nulls)
+        for column, dtype in df.dtypes.astype(str).items():
+            self.data_types.setdefault(column, dtype)
+
+        if self.value_col in df.columns:
+            values = df[self.value_col].to_numpy(dtype=np.float64)
+            self.power.update(values)
+            finite = values[np.isfinite(values)]
+            self.anomaly_count += int(self._band.update_many(finite).sum())
+
+        if 'timestamp' in df.columns:
+            self._update_timestamps(df['timestamp'])
+
+    def _update_timestamps(self, column: pd.Series):
+        timestamps = pd.to_datetime(column, utc=True, errors='coerce', format='ISO8601').dt.as_unit('ns')
+        latest_valid = pd.Timestamp.now(tz='UTC') + self.max_future
+        valid = timestamps.notna() & (timestamps >= self.min_valid) & (timestamps <= latest_valid)
+        self.invalid_timestamps += int((~valid).sum())
+
+        time_ns = timestamps[valid].dt.tz_convert(None).to_numpy().view('int64')
+        if len(time_ns) == 0:
+            return
+        self._add_span(time_ns[0], time_ns[-1], int(time_ns.min()), int(time_ns.max()))
+        steps = np.diff(time_ns)
+        self._count_steps(steps)
+
+    def _add_span(self, first: int, last: int, lowest: int, highest: int):
+        """Account for a run of valid timestamps that follows everything seen so far"""
+        if self.last_timestamp is not None:
+            self._count_steps(np.array([first - self.last_timestamp]))
+        else:
+            self.first_timestamp = first
+        self.last_timestamp = last
+        self.min_timestamp = lowest if self.min_timestamp is None else min(self.min_timestamp, lowest)
+        self.max_timestamp = highest if self.max_timestamp is None else max(self.max_timestamp, highest)
+
+    def _count_steps(self, steps: np.ndarray):
+        if len(steps) == 0:
+            return
+        self.gaps += int((steps > self.gap_threshold).sum())
+        self.max_gap = max(self.max_gap, int(steps.max()))
+
+    def merge(self, other: 'DataQualityAccumulator'):
+        """
+        Fold in the accumulator of the partition that follows this one.
+
+        Everything but the anomaly count is exact; each partition's EWMA
+        band warms up on its own.
+        """
+        self.records += other.records
+        for column, nulls in other.null_counts.items():
+            self.null_counts[column] = self.null_counts.get(column, 0) + nulls
+        for column, dtype in other.data_types.items():
+            self.data_types.setdefault(column, dtype)
+        self.power.merge(other.power)
+        self.invalid_timestamps += other.invalid_timestamps
+        self.gaps += other.gaps
+        self.max_gap = max(self.max_gap, other.max_gap)
+        if other.first_timestamp is not None:
+            self._add_span(other.first_timestamp, other.last_timestamp, other.min_timestamp, other.max_timestamp)
+        self.anomaly_count += other.anomaly_count
+
+    def report(self) -> Dict[str, Any]:
+        """Same fields as generate_data_quality_report, plus timestamp_quality"""
+        isoformat = lambda ns: pd.Timestamp(ns, tz='UTC').isoformat() if ns is not None else None
+        has_power = self.value_col in self.data_types
+        return {
+            'total_records': self.records,
+            'date_range': {
+                'start': isoformat(self.min_timestamp),
+                'end': isoformat(self.max_timestamp),
+            },
+            'missing_values': dict(self.null_counts),
+            'data_types': dict(self.data_types),
+            'anomaly_count': self.anomaly_count,
+            'power_statistics': {
+                'mean': self.power.mean if has_power and self.power.count else None,
+                'std': self.power.std if has_power else None,
+                'min': self.power.min if has_power and self.power.count else None,
+                'max': self.power.max if has_power and self.power.count else None,
+                'zero_values': self.power.zeros if has_power else None,
+            },
+            'timestamp_quality': {
+                'invalid_timestamps': self.invalid_timestamps,
+                'gaps': self.gaps,
+                'max_gap_seconds': self.max_gap / 1e9,
+                'gap_threshold_seconds': self.gap_threshold / 1e9,
+            },
+        }
+
+def quality_report_from_chunks(chunks: Iterable[Union[pd.DataFrame, List[Dict]]], **kwargs) -> Dict[str, Any]:
+    """Quality report over chunks of one device's history, in order"""
+    accumulator = DataQualityAccumulator(**kwargs)
+    for chunk in chunks:
+        accumulator.update(chunk)
+    return accumulator.report()
+
+async def collect_quality_reports(
+    source: Any,
+    device_ids: Sequence[str],
+    start_time: datetime,
+    end_time: datetime,
+    max_concurrency: int = 4,
+    executor: Optional[Executor] = None,
+    **kwargs,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Quality reports for several devices, computed in parallel from the
+    source's iter_consumption_chunks without loading any full history.
+
+    Async sources are read concurrently on the event loop; blocking
+    sources (SupabaseClient, LocalPowerMirror) are read in the executor.
+    At most max_concurrency devices are in flight at once.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    loop = asyncio.get_event_loop()
+
+    async def report(device_id: str) -> Dict[str, Any]:
+        async with semaphore:
+            chunks = source.iter_consumption_chunks(device_id, start_time, end_time)
+            if hasattr(chunks, '__aiter__'):
+                accumulator = DataQualityAccumulator(**kwargs)
+                async for chunk in chunks:
+                    accumulator.update(chunk)
+                return accumulator.report()
+            return await loop.run_in_executor(
+                executor, lambda: quality_report_from_chunks(chunks, **kwargs)
+            )
+
+    reports = await asyncio.gather(*(report(device_id) for device_id in device_ids))
+    return dict(zip(device_ids, reports))
@@ -0,0 +1,132 @@
+from datetime import timedelta
+from typing import Optional, Union
+import numpy as np
+import pandas as pd
+
+# Readings stamped before this come from devices whose clock was never set
+# (the ESP32 reports 1970-01-01 until NTP syncs)
+MIN_VALID_TIMESTAMP = pd.Timestamp('2000-01-01', tz='UTC')
+
+def regularize_readings(
+    df: pd.DataFrame,
+    freq: Union[str, timedelta] = '1h',
+    max_fill_steps: int = 3,
+    value_col: str = 'power_watts',
+    count_col: Optional[str] = None,
+    device_col: str = 'device_id',
+    repair_col: Optional[str] = 'created_at',
+    min_valid: pd.Timestamp = MIN_VALID_TIMESTAMP,
+    max_future: timedelta = timedelta(hours=1),
+) -> pd.DataFrame:
+    """
+    Resample irregular readings onto a fixed UTC grid, for all devices at once.
+
+    - Timestamps before min_valid or more than max_future ahead are repaired
+      from repair_col (the server insert time) when it is valid, else dropped
+    - Readings are averaged per grid bucket (weighted by count_col if given,
+      e.g. sample_count of pre-aggregated buckets)
+    - Each device gets every bucket from its first to its last reading
+    - Gaps of up to max_fill_steps buckets are forward-filled; longer gaps
+      stay NaN and are flagged in 'gap'
+
+    Returns one row per device and bucket with timestamp, value_col,
+    sample_count, filled and gap (plus device_col if present), ordered by
+    device and time. Buckets align to the epoch like power_readings_buckets.
+    """
+    step = pd.Timedelta(freq).value
+    if step <= 0:
+        raise ValueError(f'Grid frequency must be positive, got {freq}')
+
+    timestamps = pd.to_datetime(df['timestamp'], utc=True).dt.as_unit('ns')
+    latest_valid = pd.Timestamp.now(tz='UTC') + max_future
+    invalid = timestamps.isna() | (timestamps < min_valid) | (timestamps > latest_valid)
+    if repair_col is not None and repair_col in df.columns and invalid.any():
+        fallback = pd.to_datetime(df[repair_col], utc=True).dt.as_unit('ns')
+        repairable = invalid & fallback.notna() & (fallback >= min_valid) & (fallback <= latest_valid)
+        timestamps = timestamps.where(~repairable, fallback)
+        invalid &= ~repairable
+
+    values = df[value_col].to_numpy(dtype=np.float64)
+    weights = df[count_col].to_numpy(dtype=np.float64) if count_col else np.ones(len(df))
+    keep = ~invalid.to_numpy() & np.isfinite(values) & (weights > 0)
+
+    if device_col in df.columns:
+        codes, devices = pd.factorize(df[device_col].to_numpy()[keep])
+    else:
+        codes, devices = np.zeros(keep.sum(), dtype=np.int64), None
+    time_ns = timestamps.dt.tz_convert(None).to_numpy().view('int64')[keep]
+    buckets = time_ns - time_ns % step
+    values = values[keep]
+    weights = weights[keep]
+
+    columns = ([device_col] if devices is not None else []) + \
+        ['timestamp', value_col, 'sample_count', 'filled', 'gap']
+    if len(values) == 0:
+        result = pd.DataFrame({column: [] for column in columns})
+        result['timestamp'] = pd.to_datetime(result['timestamp'], utc=True)
+        result.attrs['dropped_invalid'] = int(invalid.sum())
+        return result
+
+    # Aggregate per (device, bucket)
+    order = np.lexsort((buckets, codes))
+    codes, buckets, values, weights = codes[order], buckets[order], values[order], weights[order]
+    group_starts = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (buckets[1:] != buckets[:-1])])
+    group_codes = codes[group_starts]
+    group_buckets = buckets[group_starts]
+    group_counts = np.add.reduceat(weights, group_starts)
+    group_means = np.add.reduceat(values * weights, group_starts) / group_counts
+
+    # One contiguous grid per device
+    device_starts = np.flatnonzero(np.r_[True, group_codes[1:] != group_codes[:-1]])
+    device_ends = np.r_[device_starts[1:], len(group_codes)] - 1
+    first_bucket = group_buckets[device_starts]
+    lengths = (group_buckets[device_ends] - first_bucket) // step + 1
+    offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+    total = int(lengths.sum())
+
+    grid_device = np.repeat(np.arange(len(device_starts)), lengths)
+    grid_time = first_bucket[grid_device] + (np.arange(total) - offsets[grid_device]) * step
+    grid_values = np.full(total, np.nan)
+    grid_counts = np.zeros(total)
+
+    group_device = np.repeat(np.arange(len(device_starts)), device_ends - device_starts + 1)
+    positions = offsets[group_device] + (group_buckets - first_bucket[group_device]) // step
+    grid_values[positions] = group_means
+    grid_counts[positions] = group_counts
+
+    # Limited forward fill; every device grid starts with an observed bucket,
+    # so the last observation never crosses into another device
+    observed = grid_counts > 0
+    row = np.arange(total)
+    last_observed = np.maximum.accumulate(np.where(observed, row, 0))
+    filled = ~observed & (row - last_observed <= max_fill_steps)
+    grid_values[filled] = grid_values[last_observed[filled]]
+
+    result = pd.DataFrame({
+        'timestamp': pd.to_datetime(grid_time, unit='ns', utc=True),
+        value_col: grid_values,
+        'sample_count': grid_counts,
+        'filled': filled,
+        'gap': ~observed & ~filled,
+    })
+    if devices is not None:
+        result.insert(0, device_col, np.asarray(devices)[group_codes[device_starts]][grid_device])
+    result.attrs['dropped_invalid'] = int(invalid.sum())
+    return result
+
+def last_gap_free_run(df: pd.DataFrame, gap_col: str = 'gap') -> pd.DataFrame:
+    """
+    The rows of a regularized single-device frame after its last unfilled
+    gap: the most recent stretch a model window may span without joining
+    readings from both sides of a gap.
+    """
+    gaps = np.flatnonzero(df[gap_col].to_numpy(dtype=bool))
+    return df.iloc[gaps[-1] + 1:] if len(gaps) else df
+
+def gap_free_runs(df: pd.DataFrame, gap_col: str = 'gap') -> np.ndarray:
+    """
+    Run id per row of a regularized single-device frame: the id goes up at
+    every unfilled gap, so rows that share an id form one gap-free stretch
+    once the gap rows are dropped.
+    """
+    return np.cumsum(df[gap_col].to_numpy(dtype=bool))
@@ -0,0 +1,253 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+class ReadingRingBuffer:
+    """
+    Fixed-capacity, NumPy-backed ring buffer of recent readings for one device.
+
+    Memory is allocated once (capacity x 24 bytes) and never grows. With
+    bucket_seconds set, readings that fall in the same bucket as the newest
+    slot are folded into it as a running mean, so the buffer holds a
+    regular series (e.g. hourly) instead of raw readings.
+    """
+
+    def __init__(self, capacity: int, bucket_seconds: Optional[int] = None):
+        if capacity <= 0:
+            raise ValueError('Ring buffer capacity must be positive')
+        self.capacity = capacity
+        self.bucket_ns = bucket_seconds * 10**9 if bucket_seconds else None
+        self._timestamps = np.zeros(capacity, dtype=np.int64)  # ns since epoch, UTC
+        self._sums = np.zeros(capacity, dtype=np.float64)
+        self._counts = np.zeros(capacity, dtype=np.float64)
+        self._end = 0  # index one past the newest slot
+        self._size = 0
+        self.dropped_out_of_order = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def last_timestamp(self) -> Optional[int]:
+        if self._size == 0:
+            return None
+        return int(self._timestamps[(self._end - 1) % self.capacity])
+
+    def append(self, timestamp_ns: int, value: float, count: float = 1.0):
+        """
+        Append one reading (or a pre-aggregated bucket when count > 1).
+
+        Readings older than the newest slot are dropped; the buffer only
+        moves forward in time.
+        """
+        if self.bucket_ns:
+            timestamp_ns -= timestamp_ns % self.bucket_ns
+
+        last = self.last_timestamp
+        if last is not None:
+            if timestamp_ns < last:
+                self.dropped_out_of_order += 1
+                return
+            if self.bucket_ns and timestamp_ns == last:
+                newest = (self._end - 1) % self.capacity
+                self._sums[newest] += value * count
+                self._counts[newest] += count
+                return
+
+        self._timestamps[self._end] = timestamp_ns
+        self._sums[self._end] = value * count
+        self._counts[self._end] = count
+        self._end = (self._end + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def extend(self, timestamps_ns: np.ndarray, values: np.ndarray, counts: Optional[np.ndarray] = None):
+        """Append many readings in time order"""
+        timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        counts = np.ones(len(values)) if counts is None else np.asarray(counts, dtype=np.float64)
+        if len(values) == 0:
+            return
+
+        if self.bucket_ns is None and self._size == 0 and np.all(np.diff(timestamps_ns) >= 0):
+            # Seeding an empty raw buffer: copy the newest entries in one go
+            n = min(len(values), self.capacity)
+            self._timestamps[:n] = timestamps_ns[-n:]
+            self._sums[:n] = (values * counts)[-n:]
+            self._counts[:n] = counts[-n:]
+            self._end = n % self.capacity
+            self._size = n
+            return
+
+        for timestamp_ns, value, count in zip(timestamps_ns, values, counts):
+            self.append(int(timestamp_ns), float(value), float(count))
+
+    def _ordered(self, array: np.ndarray, n: int) -> np.ndarray:
+        start = (self._end - n) % self.capacity
+        if start + n <= self.capacity:
+            return array[start:start + n].copy()
+        return np.concatenate([array[start:], array[:self._end]])
+
+    def tail(self, n: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Newest n entries (all if None) as (timestamps_ns, values), oldest first"""
+        n = self._size if n is None else min(n, self._size)
+        timestamps = self._ordered(self._timestamps, n)
+        values = self._ordered(self._sums, n) / self._ordered(self._counts, n)
+        return timestamps, values
+
+    def since(self, start_ns: int) -> Tuple[np.ndarray, np.ndarray]:
+        """All entries at or after start_ns, oldest first"""
+        timestamps, values = self.tail()
+        first = np.searchsorted(timestamps, start_ns, side='left')
+        return timestamps[first:], values[first:]
+
+    def to_frame(self, start_time: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        Reading-shaped frame (timestamp, power_watts) for the preprocessors.
+
+        Naive start times are treated as UTC, as the database does.
+        """
+        timestamps, values = self.tail() if start_time is None else self.since(_to_ns(start_time))
+        return pd.DataFrame({
+            'timestamp': pd.to_datetime(timestamps, unit='ns', utc=True),
+            'power_watts': values,
+        })
+
+def _to_ns(timestamp) -> int:
+    ts = pd.Timestamp(timestamp)
+    ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+    return int(ts.value)
+
+class DeviceRingBuffers:
+    """
+    Per-device ring buffers of recent readings, seeded from the history
+    source and fed by the ingest path.
+
+    A device's buffer is seeded the first time it is requested. Readings
+    that do not pass through this API (devices posting straight to
+    PostgREST, other workers) are picked up by re-seeding a buffer once it
+    is older than max_staleness seconds, so within that bound predictions
+    read their input windows from memory.
+
+    With bucket_seconds (hourly by default) each buffer holds one slot per
+    bucket and its capacity defaults to the seed window. At most
+    max_devices buffers are kept; the least recently used is evicted.
+    """
+
+    def __init__(
+        self,
+        db_client,
+        capacity: Optional[int] = None,
+        seed_window: timedelta = timedelta(hours=48),
+        bucket_seconds: Optional[int] = 3600,
+        max_devices: int = 10000,
+        max_staleness: Optional[float] = 60.0,
+    ):
+        if capacity is None:
+            if not bucket_seconds:
+                raise ValueError('Raw (unbucketed) ring buffers need an explicit capacity')
+            capacity = math.ceil(seed_window.total_seconds() / bucket_seconds) + 1
+        self.db_client = db_client
+        self.capacity = capacity
+        self.seed_window = seed_window
+        self.bucket_seconds = bucket_seconds
+        self.max_devices = max_devices
+        self.max_staleness = max_staleness
+        self._buffers: 'OrderedDict[str, ReadingRingBuffer]' = OrderedDict()
+        self._seeded_at: Dict[str, float] = {}
+        self._seed_locks: Dict[str, asyncio.Lock] = {}
+        self._stats = {'seeds': 0, 'reseeds': 0, 'evicted': 0}
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._buffers
+
+    def append(self, device_id: str, timestamp, value: float):
+        """
+        Feed one ingested reading. Devices that were never seeded are skipped;
+        their first prediction seeds them from the database.
+        """
+        buffer = self._buffers.get(device_id)
+        if buffer is not None:
+            buffer.append(_to_ns(timestamp), value)
+
+    def _is_stale(self, device_id: str) -> bool:
+        if self.max_staleness is None:
+            return False
+        return time.monotonic() - self._seeded_at.get(device_id, 0.0) > self.max_staleness
+
+    async def get(self, device_id: str) -> ReadingRingBuffer:
+        """Return the device buffer, (re)seeding it from history when missing or stale"""
+        buffer = self._buffers.get(device_id)
+        if buffer is not None and not self._is_stale(device_id):
+            self._buffers.move_to_end(device_id)
+            return buffer
+
+        lock = self._seed_locks.setdefault(device_id, asyncio.Lock())
+        async with lock:
+            if device_id not in self._buffers or self._is_stale(device_id):
+                self._stats['reseeds' if device_id in self._buffers else 'seeds'] += 1
+                self._buffers[device_id] = await self._seed(device_id)
+                self._seeded_at[device_id] = time.monotonic()
+            self._buffers.move_to_end(device_id)
+            buffer = self._buffers[device_id]
+
+        while len(self._buffers) > self.max_devices:
+            evicted, _ = self._buffers.popitem(last=False)
+            self._seeded_at.pop(evicted, None)
+            self._seed_locks.pop(evicted, None)
+            self._stats['evicted'] += 1
+        return buffer
+
+    async def _seed(self, device_id: str) -> ReadingRingBuffer:
+        end_time = datetime.now(timezone.utc)
+        start_time = end_time - self.seed_window
+        buffer = ReadingRingBuffer(self.capacity, self.bucket_seconds)
+
+        if self.bucket_seconds:
+            fetch = self.db_client.fetch_consumption_buckets
+            args = (device_id, start_time, end_time, self.bucket_seconds)
+        else:
+            fetch = self.db_client.fetch_consumption_frame
+            args = (device_id, start_time, end_time)
+
+        if asyncio.iscoroutinefunction(fetch):
+            result = await fetch(*args)
+        else:
+            loop = asyncio.get_event_loop()
+            result = await loop.run_in_executor(None, fetch, *args)
+
+        if self.bucket_seconds:
+            if result:
+                buckets = pd.DataFrame(result)
+                buffer.extend(
+                    pd.to_datetime(buckets['bucket_start'], utc=True, format='ISO8601').dt.as_unit('ns').astype('int64').values,
+                    buckets['mean_watts'].values,
+                    buckets['sample_count'].values,
+                )
+        elif not result.empty:
+            buffer.extend(
+                result['timestamp'].dt.as_unit('ns').astype('int64').values,
+                result['power_watts'].values,
+            )
+
+        return buffer
+
+    def memory_bytes(self) -> int:
+        """Total memory held by all device buffers"""
+        return sum(
+            buffer._timestamps.nbytes + buffer._sums.nbytes + buffer._counts.nbytes
+            for buffer in list(self._buffers.values())
+        )
+
+    def stats(self) -> Dict:
+        return {
+            **self._stats,
+            'devices': len(self._buffers),
+            'max_devices': self.max_devices,
+            'capacity': self.capacity,
+            'memory_bytes': self.memory_bytes(),
+        }
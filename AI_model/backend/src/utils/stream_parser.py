@@ -0,0 +1,199 @@
+import codecs
+import csv
+import json
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+class ReadingStreamParser:
+    """
+    Incremental parser for power reading uploads.
+
+    Accepts the body in arbitrary byte chunks and yields complete rows as
+    soon as their line is terminated, so memory stays bounded by the chunk
+    size plus one partial line (or one partial CSV record).
+
+    CSV rows go through a single csv.reader for the whole body, so quoted
+    fields may contain newlines (e.g. the metadata JSON column); a row is
+    handed to the reader once it ends outside a quoted field. As in csv,
+    only a quote at the start of a field opens one. A record still open
+    after max_line_bytes (or at the end of the body) is reported as an
+    error for its first line and the lines after it are parsed again.
+
+    Supported formats:
+    - 'csv': header row followed by data rows (power_readings_rows.csv layout)
+    - 'ndjson': one JSON object per line
+    """
+
+    SUPPORTED_FORMATS = ('csv', 'ndjson')
+
+    def __init__(self, fmt: str = 'csv', max_line_bytes: int = 1024 * 1024):
+        if fmt not in self.SUPPORTED_FORMATS:
+            raise ValueError(
+                f'Unsupported upload format: {fmt}. '
+                f'Expected one of {", ".join(self.SUPPORTED_FORMATS)}'
+            )
+        self.fmt = fmt
+        self.max_line_bytes = max_line_bytes
+        self.line_number = 0
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self._pending = ''
+        self._header: Optional[List[str]] = None
+        # CSV: (line number, line) pairs of the record being assembled
+        self._record: List[Tuple[int, str]] = []
+        self._record_bytes = 0
+        self._in_quotes = False
+        self._lines: deque = deque()
+        self._reader = csv.reader(self._next_line())
+
+    def feed(self, chunk: bytes) -> Tuple[List[Tuple[int, Dict]], List[Dict]]:
+        """
+        Consume one chunk of the body.
+
+        Returns (rows, errors) where rows are (line_number, row) pairs and
+        errors describe lines that could not be parsed.
+        """
+        self._pending += self._decoder.decode(chunk)
+        lines = self._pending.split('\n')
+        self._pending = lines.pop()
+
+        if len(self._pending) > self.max_line_bytes:
+            raise ValueError(
+                f'Line {self.line_number + 1} exceeds {self.max_line_bytes} bytes'
+            )
+
+        return self._parse_lines(lines)
+
+    def _next_line(self):
+        # Only pulled by the reader once a complete record is queued
+        while True:
+            yield self._lines.popleft()
+
+    def close(self) -> Tuple[List[Tuple[int, Dict]], List[Dict]]:
+        """
+        Flush the trailing line once the body has been fully received.
+        """
+        self._pending += self._decoder.decode(b'', final=True)
+        lines = [self._pending] if self._pending else []
+        self._pending = ''
+        rows, errors = self._parse_lines(lines)
+        while self._record:
+            # Unterminated quoted field: only its first line is lost
+            self._collect(self._reject_record(), rows, errors)
+        return rows, errors
+
+    def _parse_lines(self, lines: List[str]) -> Tuple[List[Tuple[int, Dict]], List[Dict]]:
+        rows = []
+        errors = []
+
+        for line in lines:
+            self.line_number += 1
+            if self.fmt == 'csv':
+                self._collect(self._add_csv_line(self.line_number, line), rows, errors)
+                continue
+
+            line = line.rstrip('\r')
+            if not line.strip():
+                continue
+            try:
+                rows.append((self.line_number, self._parse_json(line)))
+            except ValueError as e:
+                errors.append({'line': self.line_number, 'error': str(e)})
+
+        return rows, errors
+
+    def _collect(self, events: List[Tuple[int, Optional[str]]], rows: List, errors: List):
+        """Parse the completed records (error None) and report the rejected ones"""
+        for line_number, error in events:
+            if error is not None:
+                errors.append({'line': line_number, 'error': error})
+                continue
+            try:
+                row = self._parse_record()
+            except ValueError as e:
+                errors.append({'line': line_number, 'error': str(e)})
+                continue
+            if row is not None:
+                rows.append((line_number, row))
+
+    def _add_csv_line(self, line_number: int, line: str) -> List[Tuple[int, Optional[str]]]:
+        """
+        Add a line to the current CSV record. Returns (first line number,
+        error) events: error None for a record queued for the reader.
+        """
+        self._record.append((line_number, line))
+        self._record_bytes += len(line) + 1
+        self._scan_quotes(line)
+        if not self._in_quotes:
+            self._lines.extend(f'{part}\n' for _, part in self._record)
+            first = self._record[0][0]
+            self._record = []
+            self._record_bytes = 0
+            return [(first, None)]
+        if self._record_bytes > self.max_line_bytes:
+            return self._reject_record()
+        return []
+
+    def _reject_record(self) -> List[Tuple[int, Optional[str]]]:
+        """Drop the first line of an unterminated record and rescan the rest"""
+        (first, _), rest = self._record[0], self._record[1:]
+        self._record = []
+        self._record_bytes = 0
+        self._in_quotes = False
+        events = [(first, 'Unterminated quoted field')]
+        for line_number, line in rest:
+            events.extend(self._add_csv_line(line_number, line))
+        return events
+
+    def _scan_quotes(self, line: str):
+        """
+        Follow csv's quoting rules over one line: a quote opens a quoted
+        field only at the start of a field, and "" inside one is a quote
+        """
+        in_quotes = self._in_quotes
+        field_start = not in_quotes and not self._record[:-1]
+        closed = False
+        for char in line:
+            if in_quotes:
+                if char == '"':
+                    in_quotes, closed = False, True
+            elif char == '"' and (field_start or closed):
+                # Opens a field, or is the second quote of "" inside one
+                in_quotes = True
+            else:
+                field_start = char == ','
+            if char != '"':
+                closed = False
+        self._in_quotes = in_quotes
+
+    def _parse_json(self, line: str) -> Dict:
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Invalid JSON: {e.msg}')
+        if not isinstance(row, dict):
+            raise ValueError('Each line must be a JSON object')
+        return row
+
+    def _parse_record(self) -> Optional[Dict]:
+        try:
+            values = next(self._reader)
+        except csv.Error as e:
+            raise ValueError(f'Invalid CSV: {e}')
+        if not values or not ''.join(values).strip():
+            return None
+
+        if self._header is None:
+            self._header = [name.strip() for name in values]
+            return None
+
+        if len(values) != len(self._header):
+            raise ValueError(
+                f'Expected {len(self._header)} columns, got {len(values)}'
+            )
+
+        # Empty CSV cells mean "no value", not an empty string
+        return {
+            name: value
+            for name, value in zip(self._header, values)
+            if value != ''
+        }
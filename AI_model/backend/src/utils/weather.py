@@ -0,0 +1,336 @@
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Mapping, Optional, Sequence, Tuple, Union
+import numpy as np
+import pandas as pd
+
+WEATHER_COLUMNS = ('temperature', 'humidity', 'cloud_cover')
+
+# Hourly observations may be published late; older ones still describe the hour
+DEFAULT_WEATHER_TOLERANCE = timedelta(hours=3)
+
+def _to_ns(timestamps) -> np.ndarray:
+    """UTC nanoseconds since the epoch; naive timestamps are taken as UTC"""
+    index = pd.DatetimeIndex(pd.to_datetime(timestamps))
+    if index.tz is not None:
+        index = index.tz_convert(None)
+    return index.as_unit('ns').asi8
+
+def asof_join(
+    times: np.ndarray,
+    weather_times: np.ndarray,
+    weather_values: np.ndarray,
+    tolerance_ns: int,
+    direction: str = 'backward',
+) -> np.ndarray:
+    """
+    As-of join of sorted observations onto arbitrary query times (int64 ns).
+
+    Each query takes the last observation at or before it ('backward') or
+    the closest one ('nearest'), if it lies within tolerance_ns; otherwise
+    NaN. The queries need not be sorted, so rows of many devices are joined
+    with one searchsorted call.
+    """
+    result = np.full((len(times), weather_values.shape[1]), np.nan)
+    if len(weather_times) == 0 or len(times) == 0:
+        return result
+
+    before = np.searchsorted(weather_times, times, side='right') - 1
+    if direction == 'nearest':
+        after = np.minimum(before + 1, len(weather_times) - 1)
+        clipped = np.maximum(before, 0)
+        use_after = (before < 0) | (
+            np.abs(weather_times[after] - times) < np.abs(times - weather_times[clipped])
+        )
+        match = np.where(use_after, after, clipped)
+    elif direction == 'backward':
+        match = before
+    else:
+        raise ValueError(f'Unsupported as-of direction: {direction}')
+
+    valid = (match >= 0) & (np.abs(times - weather_times[np.maximum(match, 0)]) <= tolerance_ns)
+    result[valid] = weather_values[match[valid]]
+    return result
+
+def fill_stale(
+    joined: np.ndarray,
+    times: np.ndarray,
+    weather_times: np.ndarray,
+    weather_values: np.ndarray,
+) -> int:
+    """
+    Give rows of an as-of join that found no observation within the
+    tolerance the last earlier observation, however old (in place).
+    Returns the number of rows filled; rows before the first observation
+    stay NaN.
+    """
+    missing = np.isnan(joined).any(axis=1)
+    if not missing.any():
+        return 0
+    fallback = asof_join(times[missing], weather_times, weather_values, np.iinfo(np.int64).max)
+    joined[missing] = fallback
+    return int(np.isfinite(fallback).all(axis=1).sum())
+
+class WeatherProvider(ABC):
+    """
+    Source of hourly (or finer) weather observations per location.
+
+    get() returns timestamp plus WEATHER_COLUMNS, sorted by timestamp.
+    WeatherJoiner reads observations through ensure() and snapshot(); the
+    defaults fetch the queried range with get() on every call, providers
+    that keep data locally override them (see FileWeatherCache).
+    """
+
+    @abstractmethod
+    def get(self, location: str, start_time: pd.Timestamp, end_time: pd.Timestamp) -> pd.DataFrame:
+        ...
+
+    def ensure(self, location: str, start_time: pd.Timestamp, end_time: pd.Timestamp):
+        """Make observations for the range available to snapshot()"""
+
+    def snapshot(
+        self,
+        location: str,
+        start_time: Optional[pd.Timestamp] = None,
+        end_time: Optional[pd.Timestamp] = None,
+    ) -> Tuple[Optional[float], np.ndarray, np.ndarray]:
+        """
+        (version, timestamps ns, values (n, 3)) of the observations for a
+        location, sorted by time. A None version is never memoized.
+        """
+        df = self.get(location, start_time, end_time)
+        times = _to_ns(df['timestamp'])
+        order = np.argsort(times, kind='stable')
+        return None, times[order], df[list(WEATHER_COLUMNS)].to_numpy(dtype=np.float64)[order]
+
+class MockWeather:
+    """
+    The demonstration weather of add_weather_features, per row.
+
+    Draws come from a private RandomState(seed), so the values are the same
+    as after np.random.seed(42) without reseeding the global generator.
+    """
+
+    def __init__(self, seed: int = 42):
+        self.seed = seed
+
+    def values(self, timestamps: pd.DatetimeIndex) -> np.ndarray:
+        n = len(timestamps)
+        rng = np.random.RandomState(self.seed)
+        temperature = 20 + 10 * np.sin(2 * np.pi * timestamps.hour.to_numpy() / 24) + rng.normal(0, 2, n)
+        humidity = 50 + 20 * rng.random_sample(n)
+        cloud_cover = rng.uniform(0, 100, n)
+        return np.column_stack([temperature, humidity, cloud_cover])
+
+class FileWeatherCache(WeatherProvider):
+    """
+    Weather observations cached on disk as one Parquet or CSV file per
+    location (<root>/<location>.parquet or .csv).
+
+    Each file is parsed once into sorted int64/float64 arrays and reloaded
+    only when its modification time changes. With an upstream provider,
+    ranges the file does not cover are fetched, merged and written back as
+    Parquet, at most once per refetch_interval per location.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        upstream: Optional[WeatherProvider] = None,
+        refetch_interval: timedelta = timedelta(minutes=15),
+    ):
+        self.root = root
+        self.upstream = upstream
+        self.refetch_interval = refetch_interval
+        self._fetched_at: Dict[str, pd.Timestamp] = {}
+        self.logger = logging.getLogger(__name__)
+        self._arrays: Dict[str, Tuple[Optional[float], np.ndarray, np.ndarray]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, location: str) -> Optional[str]:
+        for extension in ('parquet', 'csv'):
+            path = os.path.join(self.root, f'{location}.{extension}')
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _read(self, path: str) -> pd.DataFrame:
+        if path.endswith('.parquet'):
+            return pd.read_parquet(path, columns=['timestamp', *WEATHER_COLUMNS])
+        return pd.read_csv(path, usecols=['timestamp', *WEATHER_COLUMNS])
+
+    def snapshot(
+        self,
+        location: str,
+        start_time: Optional[pd.Timestamp] = None,
+        end_time: Optional[pd.Timestamp] = None,
+    ) -> Tuple[Optional[float], np.ndarray, np.ndarray]:
+        """
+        (file mtime, timestamps ns, values (n, 3)) for a location, sorted by
+        time; the mtime identifies the version of the data. The whole file
+        is returned whatever the range.
+        """
+        path = self._path(location)
+        if path is None:
+            return None, np.empty(0, dtype=np.int64), np.empty((0, len(WEATHER_COLUMNS)))
+        mtime = os.path.getmtime(path)
+        with self._lock:
+            cached = self._arrays.get(location)
+            if cached is None or cached[0] != mtime:
+                df = self._read(path)
+                times = _to_ns(df['timestamp'])
+                order = np.argsort(times, kind='stable')
+                values = df[list(WEATHER_COLUMNS)].to_numpy(dtype=np.float64)[order]
+                cached = self._arrays[location] = (mtime, times[order], values)
+        return cached
+
+    def arrays(self, location: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(timestamps ns, values (n, 3)) for a location, sorted by time"""
+        _, times, values = self.snapshot(location)
+        return times, values
+
+    def ensure(self, location: str, start_time: pd.Timestamp, end_time: pd.Timestamp):
+        """Fetch missing observations from upstream into the cache file"""
+        if self.upstream is None:
+            return
+        times, _ = self.arrays(location)
+        start_ns, end_ns = _to_ns([start_time, end_time])
+        if len(times) and times[0] <= start_ns and times[-1] >= end_ns:
+            return
+        # The newest hours are often not published yet; don't ask on every call
+        now = pd.Timestamp.now(tz='UTC')
+        last_fetch = self._fetched_at.get(location)
+        if last_fetch is not None and now - last_fetch < self.refetch_interval:
+            return
+        self._fetched_at[location] = now
+
+        fetched = self.upstream.get(location, start_time, end_time)
+        if fetched.empty:
+            return
+        path = self._path(location)
+        existing = self._read(path) if path else None
+        merged = pd.concat([existing, fetched[['timestamp', *WEATHER_COLUMNS]]], ignore_index=True) \
+            if existing is not None else fetched[['timestamp', *WEATHER_COLUMNS]]
+        merged['timestamp'] = pd.to_datetime(merged['timestamp'], utc=True)
+        merged = merged.drop_duplicates('timestamp', keep='last').sort_values('timestamp')
+
+        target = os.path.join(self.root, f'{location}.parquet')
+        merged.to_parquet(f'{target}.tmp', index=False)
+        os.replace(f'{target}.tmp', target)
+        if path and path != target:
+            os.remove(path)
+        self.logger.info(f"Cached {len(fetched)} weather rows for {location}")
+
+    def get(self, location: str, start_time: pd.Timestamp, end_time: pd.Timestamp) -> pd.DataFrame:
+        times, values = self.arrays(location)
+        start_ns, end_ns = _to_ns([start_time, end_time])
+        lo = np.searchsorted(times, start_ns, side='left')
+        hi = np.searchsorted(times, end_ns, side='right')
+        df = pd.DataFrame(values[lo:hi], columns=list(WEATHER_COLUMNS))
+        df.insert(0, 'timestamp', pd.to_datetime(times[lo:hi], unit='ns', utc=True))
+        return df
+
+class WeatherJoiner:
+    """
+    Attach weather columns to readings with a sorted as-of join.
+
+    Rows of all devices are joined in one vectorized pass per location
+    (device_locations maps device_id to location, else default_location).
+    Joined columns are memoized per location and set of timestamps, so the
+    repeated prediction windows of a device cost a dictionary lookup.
+
+    Rows with no observation within the tolerance would lose their whole
+    feature row, and the newest hours are usually not published yet; with
+    fill_stale such rows take the last earlier observation instead (counted
+    in stats()). Rows before the first observation stay NaN.
+    """
+
+    def __init__(
+        self,
+        provider: WeatherProvider,
+        tolerance: timedelta = DEFAULT_WEATHER_TOLERANCE,
+        direction: str = 'backward',
+        default_location: str = 'default',
+        device_locations: Optional[Mapping[str, str]] = None,
+        cache_size: int = 256,
+        fill_stale: bool = True,
+    ):
+        self.provider = provider
+        self.tolerance_ns = pd.Timedelta(tolerance).value
+        self.direction = direction
+        self.default_location = default_location
+        self.device_locations = dict(device_locations or {})
+        self.cache_size = cache_size
+        self.fill_stale = fill_stale
+        self.logger = logging.getLogger(__name__)
+        self._memo: 'OrderedDict[tuple, np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'joined_rows': 0, 'stale_rows': 0, 'missing_rows': 0}
+
+    def _join_location(self, location: str, times: np.ndarray) -> np.ndarray:
+        if len(times):
+            start_time = pd.Timestamp(int(times.min()) - self.tolerance_ns, tz='UTC')
+            ahead = self.tolerance_ns if self.direction == 'nearest' else 0
+            end_time = pd.Timestamp(int(times.max()) + ahead, tz='UTC')
+            self.provider.ensure(location, start_time, end_time)
+            version, weather_times, weather_values = self.provider.snapshot(location, start_time, end_time)
+        else:
+            version, weather_times, weather_values = None, np.empty(0, dtype=np.int64), np.empty((0, len(WEATHER_COLUMNS)))
+        key = (location, version, self.tolerance_ns, self.direction, self.fill_stale, hash(times.tobytes()))
+        with self._lock:
+            cached = self._memo.get(key) if version is not None else None
+            if cached is not None:
+                self._memo.move_to_end(key)
+                return cached
+
+        joined = asof_join(times, weather_times, weather_values, self.tolerance_ns, self.direction)
+        stale = fill_stale(joined, times, weather_times, weather_values) if self.fill_stale else 0
+        if stale:
+            self.logger.warning(f"Weather for {location}: {stale} rows use an observation older than the tolerance")
+        joined.flags.writeable = False
+        with self._lock:
+            self._stats['joined_rows'] += len(times)
+            self._stats['stale_rows'] += stale
+            self._stats['missing_rows'] += int(np.isnan(joined).any(axis=1).sum())
+            if version is not None:
+                self._memo[key] = joined
+                while len(self._memo) > self.cache_size:
+                    self._memo.popitem(last=False)
+        return joined
+
+    def stats(self) -> Dict:
+        return {**self._stats, 'memoized': len(self._memo)}
+
+    def join(
+        self,
+        timestamps: Union[pd.DatetimeIndex, pd.Series, Sequence],
+        device_ids: Optional[np.ndarray] = None,
+    ) -> np.ndarray:
+        """
+        (n, 3) temperature, humidity and cloud_cover in input row order;
+        NaN where no observation lies within the tolerance
+        """
+        times = _to_ns(timestamps)
+        if device_ids is None or not self.device_locations:
+            return self._join_location(self.default_location, times)
+
+        locations = pd.Series(device_ids).map(self.device_locations).fillna(self.default_location).to_numpy()
+        result = np.empty((len(times), len(WEATHER_COLUMNS)))
+        for location in pd.unique(locations):
+            rows = locations == location
+            result[rows] = self._join_location(location, times[rows])
+        return result
+
+    def join_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """df with WEATHER_COLUMNS added (replacing any existing ones)"""
+        device_ids = df['device_id'].to_numpy() if 'device_id' in df.columns else None
+        joined = self.join(df['timestamp'], device_ids)
+        df = df.drop(columns=[c for c in WEATHER_COLUMNS if c in df.columns])
+        for i, column in enumerate(WEATHER_COLUMNS):
+            df[column] = joined[:, i]
+        return df
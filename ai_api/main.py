@@ -1,15 +1,28 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import numpy as np
-import tensorflow as tf
 import os
+import importlib.util
 
 app = FastAPI()
 
 # Load your trained model (update the path as needed)
+# A .tflite export (python -m src.models.tflite_export) is served with
+# tflite-runtime only; TensorFlow is imported just for Keras files
 MODEL_PATH = os.getenv('LSTM_MODEL_PATH', 'AI_model/backend/model.h5')
 try:
-    model = tf.keras.models.load_model(MODEL_PATH)
+    if MODEL_PATH.endswith('.tflite'):
+        # Loaded by file path so the API starts from any working directory
+        lite_runtime_path = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), '..', 'AI_model', 'backend', 'src', 'models', 'lite_runtime.py'
+        )
+        spec = importlib.util.spec_from_file_location('lite_runtime', lite_runtime_path)
+        lite_runtime = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(lite_runtime)
+        model = lite_runtime.LiteModel(MODEL_PATH, num_threads=int(os.getenv('TFLITE_NUM_THREADS', '1')))
+    else:
+        import tensorflow as tf
+        model = tf.keras.models.load_model(MODEL_PATH)
 except Exception as e:
     model = None
     print(f'Error loading model: {e}')
@@ -22,7 +35,7 @@ def predict(req: PredictRequest):
     if model is None:
         raise HTTPException(status_code=500, detail='Model not loaded')
     try:
-        X = np.array(req.data).reshape((1, len(req.data), -1))
+        X = np.array(req.data, dtype=np.float32).reshape((1, len(req.data), -1))
         prediction = model.predict(X)
         return {'prediction': float(prediction[0][0])}
     except Exception as e:
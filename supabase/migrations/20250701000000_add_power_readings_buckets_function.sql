@@ -0,0 +1,37 @@
+-- Migration: Server-side time-bucket aggregation of power_readings
+-- Returns one row per bucket so model inputs can be fetched at a fixed
+-- resolution (e.g. hourly) instead of transferring every raw reading.
+
+CREATE OR REPLACE FUNCTION public.power_readings_buckets(
+  p_device_id uuid,
+  p_start timestamp with time zone,
+  p_end timestamp with time zone,
+  p_bucket_seconds integer DEFAULT 3600
+)
+RETURNS TABLE (
+  bucket_start timestamp with time zone,
+  mean_watts double precision,
+  min_watts double precision,
+  max_watts double precision,
+  sample_count bigint,
+  energy_kwh double precision
+) AS $$
+  SELECT
+    date_bin(
+      make_interval(secs => p_bucket_seconds),
+      r.timestamp,
+      TIMESTAMP WITH TIME ZONE '1970-01-01 00:00:00+00'
+    ) AS bucket_start,
+    AVG(r.power_watts) AS mean_watts,
+    MIN(r.power_watts) AS min_watts,
+    MAX(r.power_watts) AS max_watts,
+    COUNT(*) AS sample_count,
+    -- Energy as recorded by the meter in power_kwh
+    COALESCE(SUM(r.power_kwh), 0) AS energy_kwh
+  FROM public.power_readings r
+  WHERE r.device_id = p_device_id
+    AND r.timestamp >= p_start
+    AND r.timestamp <= p_end
+  GROUP BY 1
+  ORDER BY 1;
+$$ LANGUAGE sql STABLE;
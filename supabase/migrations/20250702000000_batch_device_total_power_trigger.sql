@@ -0,0 +1,50 @@
+-- Migration: Accumulate devices.total_power once per statement instead of once per row
+--
+-- The row-level trigger ran one UPDATE on devices for every inserted reading,
+-- so bulk inserts serialized on the same device row. This statement-level
+-- trigger reads the inserted rows from a transition table and applies one
+-- aggregated UPDATE per device per statement. The device rows are locked
+-- first, explicitly in id order, so concurrent batches take the locks in the
+-- same order (an ORDER BY inside the UPDATE's FROM does not fix the lock
+-- order, since the join may be a hash join).
+--
+-- Sums power_kwh, as intended by 20250530233125 (20250530233126 later
+-- redefined the row-level function to add power_watts).
+
+CREATE OR REPLACE FUNCTION update_device_total_power_batch()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM 1
+  FROM devices
+  WHERE id IN (
+    SELECT device_id
+    FROM inserted_readings
+    WHERE device_id IS NOT NULL
+    GROUP BY device_id
+    HAVING SUM(COALESCE(power_kwh, 0)) <> 0
+  )
+  ORDER BY id
+  FOR UPDATE;
+
+  UPDATE devices d
+  SET total_power = COALESCE(d.total_power, 0) + totals.kwh
+  FROM (
+    SELECT device_id, SUM(COALESCE(power_kwh, 0)) AS kwh
+    FROM inserted_readings
+    WHERE device_id IS NOT NULL
+    GROUP BY device_id
+  ) AS totals
+  WHERE d.id = totals.device_id
+    AND totals.kwh <> 0;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS power_reading_insert_trigger ON power_readings;
+CREATE TRIGGER power_reading_insert_trigger
+AFTER INSERT ON power_readings
+REFERENCING NEW TABLE AS inserted_readings
+FOR EACH STATEMENT
+EXECUTE FUNCTION update_device_total_power_batch();
+
+DROP FUNCTION IF EXISTS update_device_total_power();
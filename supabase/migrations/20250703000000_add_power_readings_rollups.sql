@@ -0,0 +1,142 @@
+-- Migration: Composite time index and hourly/daily rollups for power_readings
+--
+-- Every read filters on device_id and a timestamp range ordered by
+-- timestamp (with id as the keyset tie-breaker), so index exactly that.
+-- The rollup tables keep sum/min/max/count per device and UTC hour/day.
+-- A statement-level trigger adds each insert statement's rows to them, so
+-- dashboard aggregates read a handful of rollup rows instead of scanning
+-- raw readings. Rollups follow inserts only; rows changed by a later
+-- UPDATE or DELETE are not subtracted.
+
+CREATE INDEX IF NOT EXISTS power_readings_device_timestamp_idx
+ON public.power_readings (device_id, timestamp, id);
+
+CREATE TABLE IF NOT EXISTS public.power_readings_hourly (
+  device_id uuid NOT NULL REFERENCES public.devices (id) ON DELETE CASCADE,
+  bucket_start timestamp with time zone NOT NULL,
+  sample_count bigint NOT NULL DEFAULT 0,
+  sum_watts double precision NOT NULL DEFAULT 0,
+  min_watts double precision,
+  max_watts double precision,
+  energy_kwh double precision NOT NULL DEFAULT 0,
+  mean_watts double precision GENERATED ALWAYS AS (sum_watts / NULLIF(sample_count, 0)) STORED,
+  PRIMARY KEY (device_id, bucket_start)
+);
+
+CREATE TABLE IF NOT EXISTS public.power_readings_daily (
+  device_id uuid NOT NULL REFERENCES public.devices (id) ON DELETE CASCADE,
+  bucket_start timestamp with time zone NOT NULL,
+  sample_count bigint NOT NULL DEFAULT 0,
+  sum_watts double precision NOT NULL DEFAULT 0,
+  min_watts double precision,
+  max_watts double precision,
+  energy_kwh double precision NOT NULL DEFAULT 0,
+  mean_watts double precision GENERATED ALWAYS AS (sum_watts / NULLIF(sample_count, 0)) STORED,
+  PRIMARY KEY (device_id, bucket_start)
+);
+
+-- Runs as the owner so anonymous inserts into power_readings can maintain the rollups
+CREATE OR REPLACE FUNCTION public.update_power_readings_rollups()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO public.power_readings_hourly AS h
+    (device_id, bucket_start, sample_count, sum_watts, min_watts, max_watts, energy_kwh)
+  SELECT
+    device_id,
+    date_bin(INTERVAL '1 hour', timestamp, TIMESTAMP WITH TIME ZONE '1970-01-01 00:00:00+00'),
+    COUNT(*),
+    COALESCE(SUM(power_watts), 0),
+    MIN(power_watts),
+    MAX(power_watts),
+    COALESCE(SUM(power_kwh), 0)
+  FROM inserted_readings
+  GROUP BY 1, 2
+  ORDER BY 1, 2
+  ON CONFLICT (device_id, bucket_start) DO UPDATE SET
+    sample_count = h.sample_count + EXCLUDED.sample_count,
+    sum_watts = h.sum_watts + EXCLUDED.sum_watts,
+    min_watts = LEAST(h.min_watts, EXCLUDED.min_watts),
+    max_watts = GREATEST(h.max_watts, EXCLUDED.max_watts),
+    energy_kwh = h.energy_kwh + EXCLUDED.energy_kwh;
+
+  INSERT INTO public.power_readings_daily AS d
+    (device_id, bucket_start, sample_count, sum_watts, min_watts, max_watts, energy_kwh)
+  SELECT
+    device_id,
+    date_bin(INTERVAL '1 day', timestamp, TIMESTAMP WITH TIME ZONE '1970-01-01 00:00:00+00'),
+    COUNT(*),
+    COALESCE(SUM(power_watts), 0),
+    MIN(power_watts),
+    MAX(power_watts),
+    COALESCE(SUM(power_kwh), 0)
+  FROM inserted_readings
+  GROUP BY 1, 2
+  ORDER BY 1, 2
+  ON CONFLICT (device_id, bucket_start) DO UPDATE SET
+    sample_count = d.sample_count + EXCLUDED.sample_count,
+    sum_watts = d.sum_watts + EXCLUDED.sum_watts,
+    min_watts = LEAST(d.min_watts, EXCLUDED.min_watts),
+    max_watts = GREATEST(d.max_watts, EXCLUDED.max_watts),
+    energy_kwh = d.energy_kwh + EXCLUDED.energy_kwh;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS power_reading_rollup_trigger ON public.power_readings;
+CREATE TRIGGER power_reading_rollup_trigger
+AFTER INSERT ON public.power_readings
+REFERENCING NEW TABLE AS inserted_readings
+FOR EACH STATEMENT
+EXECUTE FUNCTION public.update_power_readings_rollups();
+
+-- Backfill from existing readings
+INSERT INTO public.power_readings_hourly
+  (device_id, bucket_start, sample_count, sum_watts, min_watts, max_watts, energy_kwh)
+SELECT
+  device_id,
+  date_bin(INTERVAL '1 hour', timestamp, TIMESTAMP WITH TIME ZONE '1970-01-01 00:00:00+00'),
+  COUNT(*),
+  COALESCE(SUM(power_watts), 0),
+  MIN(power_watts),
+  MAX(power_watts),
+  COALESCE(SUM(power_kwh), 0)
+FROM public.power_readings
+GROUP BY 1, 2
+ON CONFLICT (device_id, bucket_start) DO NOTHING;
+
+INSERT INTO public.power_readings_daily
+  (device_id, bucket_start, sample_count, sum_watts, min_watts, max_watts, energy_kwh)
+SELECT
+  device_id,
+  date_bin(INTERVAL '1 day', timestamp, TIMESTAMP WITH TIME ZONE '1970-01-01 00:00:00+00'),
+  COUNT(*),
+  COALESCE(SUM(power_watts), 0),
+  MIN(power_watts),
+  MAX(power_watts),
+  COALESCE(SUM(power_kwh), 0)
+FROM public.power_readings
+GROUP BY 1, 2
+ON CONFLICT (device_id, bucket_start) DO NOTHING;
+
+-- Same read access as power_readings
+ALTER TABLE public.power_readings_hourly ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.power_readings_daily ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow users to read their own hourly rollups"
+ON public.power_readings_hourly
+FOR SELECT
+TO authenticated
+USING (device_id IN (
+    SELECT id FROM public.devices
+    WHERE user_id = auth.uid()
+));
+
+CREATE POLICY "Allow users to read their own daily rollups"
+ON public.power_readings_daily
+FOR SELECT
+TO authenticated
+USING (device_id IN (
+    SELECT id FROM public.devices
+    WHERE user_id = auth.uid()
+));
@@ -0,0 +1,19 @@
+-- Migration: Make (device_id, timestamp) the natural key of power_readings
+--
+-- Uploads and batches used to insert every row, so re-sending the same
+-- export stored each reading again. With a unique key the clients upsert
+-- on (device_id, timestamp): batches skip readings already stored
+-- (ON CONFLICT DO NOTHING), so the statement-level insert triggers only
+-- see new rows and total_power and the rollups never count a reading twice.
+--
+-- Existing duplicates are removed first, keeping the earliest stored row.
+-- total_power and the rollups already counted them and are not corrected.
+
+DELETE FROM public.power_readings p
+USING public.power_readings earlier
+WHERE p.device_id = earlier.device_id
+  AND p.timestamp = earlier.timestamp
+  AND (earlier.created_at, earlier.id) < (p.created_at, p.id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS power_readings_device_timestamp_key
+ON public.power_readings (device_id, timestamp);
@@ -68,11 +68,12 @@ def test_supabase_data():
         now = datetime.now(timezone.utc)
         yesterday = now - timedelta(hours=24)
         
-        readings_24h = client.client.table('power_readings').select('power_watts').eq('device_id', DEVICE_ID).gte('timestamp', yesterday.isoformat()).lte('timestamp', now.isoformat()).execute()
-        if readings_24h.data:
-            powers = [r['power_watts'] for r in readings_24h.data]
-            avg_power = sum(powers) / len(powers)
-            print(f"✅ Average Power (24h): {avg_power:.1f}W from {len(powers)} readings")
+        # Hourly rollups: at most 25 rows instead of every raw reading
+        rollups = client.fetch_consumption_rollups(DEVICE_ID, yesterday, now, granularity='hour')
+        if rollups:
+            sample_count = sum(r['sample_count'] for r in rollups)
+            avg_power = sum(r['sum_watts'] for r in rollups) / sample_count
+            print(f"✅ Average Power (24h): {avg_power:.1f}W from {sample_count} readings")
         else:
             print("❌ No 24h power readings found")
             
@@ -10,60 +10,54 @@ API_BASE = "http://localhost:8006"
 DEVICE_ID = "d2ab803a-1742-46be-84c9-a20868642bc2"
 CSV_FILE = "/Users/seifkhaled/Development/projects/powerflick_ copy 12/AI_model/power_readings_rows.csv"
 
+def read_chunks(path, chunk_size=64 * 1024):
+    """Yield the CSV file in fixed-size chunks for a chunked upload"""
+    with open(path, 'rb') as csvfile:
+        while True:
+            chunk = csvfile.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
 def upload_csv_data():
     """Upload CSV data to the API"""
     print("📊 Loading CSV data...")
     
     try:
-        # Read CSV file
-        df = pd.read_csv(CSV_FILE)
-        print(f"✅ Loaded {len(df)} records from CSV")
-        
         # Show sample data
+        df = pd.read_csv(CSV_FILE, nrows=3)
         print("\n📋 Sample data:")
-        print(df.head(3)[['device_id', 'power_watts', 'timestamp']].to_string())
+        print(df[['device_id', 'power_watts', 'timestamp']].to_string())
         
-        successful_uploads = 0
-        failed_uploads = 0
+        print(f"\n🚀 Streaming {CSV_FILE} to API...")
         
-        print(f"\n🚀 Uploading {len(df)} records to API...")
+        # Stream the whole file; the server parses it incrementally and
+        # writes it in large batches instead of one request per row
+        response = requests.post(
+            f"{API_BASE}/api/consumption/upload",
+            params={"device_id": DEVICE_ID},
+            data=read_chunks(CSV_FILE),
+            headers={"Content-Type": "text/csv"},
+        )
+        
+        if response.status_code != 200:
+            print(f"❌ Upload failed: {response.status_code} - {response.text[:200]}")
+            return False
         
-        # Upload each row
-        for index, row in df.iterrows():
-            try:
-                # Prepare data for API
-                data = {
-                    "device_id": str(row['device_id']),
-                    "timestamp": str(row['timestamp']),
-                    "consumption": float(row['power_watts'])
-                }
-                
-                # Upload to API
-                response = requests.post(f"{API_BASE}/api/consumption/{DEVICE_ID}", json=data)
-                
-                if response.status_code == 200:
-                    successful_uploads += 1
-                    if successful_uploads % 100 == 0:
-                        print(f"✅ Uploaded {successful_uploads} records...")
-                else:
-                    failed_uploads += 1
-                    if failed_uploads < 5:  # Show first few errors
-                        print(f"❌ Failed record {index}: {response.status_code} - {response.text[:100]}")
-                    
-            except Exception as e:
-                failed_uploads += 1
-                if failed_uploads < 5:
-                    print(f"❌ Error processing record {index}: {str(e)[:100]}")
+        summary = response.json()
+        for error in summary.get('errors', [])[:5]:  # Show first few errors
+            print(f"❌ Failed line {error['line']}: {error['error'][:100]}")
         
         print(f"\n📈 Upload Summary:")
-        print(f"✅ Successful: {successful_uploads}")
-        print(f"❌ Failed: {failed_uploads}")
-        print(f"📊 Total: {len(df)}")
+        print(f"✅ Successful: {summary['accepted']}")
+        print(f"❌ Failed: {summary['rejected']}")
+        print(f"📊 Total: {summary['rows_received']}")
+        print(f"⏱️  Time: {summary['elapsed_seconds']}s")
         
-        return successful_uploads > 0
+        return summary['accepted'] > 0
         
     except Exception as e:
-        print(f"❌ Error loading CSV: {e}")
+        print(f"❌ Error uploading CSV: {e}")
         return False
 
 def train_model():